@@ -0,0 +1,167 @@
+"""Sliding-window activity counters, trending NFTs and collection leaderboards.
+
+Views and likes (through their own write-behind buffer) and completed
+sales are added to time buckets per NFT and per collection. Each event
+lands in one bucket per window:
+
+* 5 minute buckets for the 1h window;
+* hourly buckets for the 24h window;
+* daily buckets for the 7d window.
+
+A window sums the buckets starting at or after the start of the bucket
+holding ``now - window``, so it also covers part of one older bucket.
+Every bucket carries an ``expires_at`` after which no window reads it, and
+it is then dropped (by a TTL index on Mongo).
+
+Ranking every key of a window on each request would grow with activity.
+``ActivityBoards`` instead materializes the top ``size`` NFTs and
+collections of each window into a snapshot document, one
+``SnapshotRefresher`` per window, like the marketplace stats. A request
+reads one document.
+"""
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from repositories import Document, Repositories
+from snapshots import SnapshotRefresher
+
+
+# Window: granularity of its buckets, bucket width and window length
+WINDOWS = {
+    "1h": ("5m", timedelta(minutes=5), timedelta(hours=1)),
+    "24h": ("1h", timedelta(hours=1), timedelta(hours=24)),
+    "7d": ("1d", timedelta(days=1), timedelta(days=7)),
+}
+
+# Trending NFTs rank by weighted activity: a like counts as five views, a sale as twenty
+SCORE_WEIGHTS = {"views": 1, "likes": 5, "sales": 20}
+
+# NFT fields copied onto trending entries
+TRENDING_NFT_FIELDS = ["id", "name", "image", "collection", "price", "status"]
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(at: datetime, width: timedelta) -> datetime:
+    """Start of the ``width`` bucket holding ``at`` (UTC, aligned on the epoch)"""
+    return at - (at - EPOCH) % width
+
+
+def trending_score(counts: Dict[str, float]) -> float:
+    return float(sum(weight * counts.get(field, 0) for field, weight in SCORE_WEIGHTS.items()))
+
+
+def activity_buckets(rows: Iterable[Tuple[str, Optional[str], Dict[str, float]]], at: datetime) -> List[Document]:
+    """Bucket deltas for ``(nft_id, collection, counts)`` rows at ``at``, merged per bucket"""
+    buckets: Dict[Tuple[str, str, str, datetime], Document] = {}
+    for nft_id, collection, counts in rows:
+        keys = [("nft", nft_id)] + ([("collection", collection)] if collection else [])
+        for scope, key in keys:
+            for granularity, width, length in WINDOWS.values():
+                start = bucket_start(at, width)
+                bucket = buckets.get((scope, granularity, start, key))
+                if bucket is None:
+                    bucket = buckets[(scope, granularity, start, key)] = {
+                        "scope": scope,
+                        "key": key,
+                        "granularity": granularity,
+                        "start": start,
+                        # Read while the window start has not passed the bucket's end
+                        "expires_at": start + width + length,
+                        "counts": {},
+                    }
+                for field, amount in counts.items():
+                    bucket["counts"][field] = bucket["counts"].get(field, 0) + amount
+    return list(buckets.values())
+
+
+async def record_activity(
+    repos: Repositories, rows: Iterable[Tuple[str, Optional[str], Dict[str, float]]], at: Optional[datetime] = None
+):
+    """Add ``(nft_id, collection, counts)`` rows to the activity buckets"""
+    buckets = activity_buckets(rows, at or datetime.utcnow())
+    if buckets:
+        await repos.activity.add(buckets)
+
+
+class ActivityRecorder:
+    """``increment_many`` target of a CounterBuffer: NFT counter deltas into activity buckets"""
+
+    def __init__(self, repos: Repositories):
+        self.repos = repos
+
+    async def increment_many(self, deltas: Dict[str, Dict[str, int]]):
+        docs = await self.repos.nfts.get_many(list(deltas), fields=["id", "collection"])
+        collections = {doc["id"]: doc.get("collection") for doc in docs}
+        await record_activity(self.repos, [
+            (nft_id, collections[nft_id], counts) for nft_id, counts in deltas.items() if nft_id in collections
+        ])
+
+
+class ActivityBoards:
+    def __init__(self, repos: Repositories, max_staleness: float = 30.0, size: int = 100):
+        self.repos = repos
+        self.max_staleness = max_staleness
+        # Entries kept per board; requests can page no further
+        self.size = size
+        self._snapshots = {
+            window: SnapshotRefresher(repos, f"activity:{window}", partial(self.compute, window), max_staleness)
+            for window in WINDOWS
+        }
+
+    async def compute(self, window: str) -> Dict[str, Any]:
+        granularity, width, length = WINDOWS[window]
+        since = bucket_start(datetime.utcnow() - length, width)
+        nft_totals, collection_totals = await asyncio.gather(
+            self.repos.activity.totals("nft", granularity, since),
+            self.repos.activity.totals("collection", granularity, since),
+        )
+        top_nfts = heapq.nlargest(
+            self.size, nft_totals.items(), key=lambda item: (trending_score(item[1]), item[0])
+        )
+        top_collections = heapq.nlargest(
+            self.size, collection_totals.items(),
+            key=lambda item: (item[1]["volume"], item[1]["sales"], trending_score(item[1]), item[0])
+        )
+        nft_docs, collection_docs = await asyncio.gather(
+            self.repos.nfts.get_many([nft_id for nft_id, _ in top_nfts], fields=TRENDING_NFT_FIELDS),
+            self.repos.collections.get_many_by_name([name for name, _ in top_collections]),
+        )
+        nfts_by_id = {doc["id"]: doc for doc in nft_docs}
+        collections_by_name = {doc["name"]: doc for doc in collection_docs}
+        return {
+            "window": window,
+            "nfts": [
+                {**nfts_by_id[nft_id], **counts, "score": trending_score(counts)}
+                for nft_id, counts in top_nfts if nft_id in nfts_by_id
+            ],
+            "collections": [
+                {
+                    "name": name,
+                    "id": collections_by_name.get(name, {}).get("id"),
+                    "banner_image": collections_by_name.get(name, {}).get("banner_image"),
+                    "floor_price": collections_by_name.get(name, {}).get("floor_price"),
+                    **counts,
+                }
+                for name, counts in top_collections
+            ],
+        }
+
+    async def refresh(self, window: str) -> Dict[str, Any]:
+        """Recompute and store the boards of ``window``"""
+        return await self._snapshots[window].refresh()
+
+    async def get(self, window: str) -> Dict[str, Any]:
+        """Current boards of ``window``, refreshed first if older than max_staleness"""
+        return await self._snapshots[window].get()
+
+    async def start(self):
+        for snapshot in self._snapshots.values():
+            await snapshot.start()
+
+    async def stop(self):
+        for snapshot in self._snapshots.values():
+            await snapshot.stop()
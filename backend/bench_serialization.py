@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Benchmark response serialization for the list endpoints.
+
+Compares the validated path (documents rebuilt as models, then validated
+again through ``response_model``) with the FAST_RESPONSES path (documents
+encoded as-is with orjson). Both go through ``server.read_response`` in a
+small in-process app, so Mongo is not involved and the numbers are pure
+serialization cost.
+
+Usage, from the backend directory::
+
+    python bench_serialization.py --rows 1000 --requests 200
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Callable, Dict, List
+
+import httpx
+import typer
+from fastapi import FastAPI
+
+import server
+from server import NFT, NFTTrait, Transaction, User, read_response
+
+
+cli = typer.Typer(help="Benchmark validated vs fast response serialization")
+
+
+def stored(model) -> Dict[str, Any]:
+    """Document as Mongo returns it: enums as strings, no _id"""
+    return {key: value.value if isinstance(value, Enum) else value for key, value in model.dict().items()}
+
+
+def make_transaction(i: int) -> Dict[str, Any]:
+    return stored(Transaction(
+        nft_id=str(uuid.uuid4()),
+        collection=f"Collection {i % 20}",
+        buyer=f"0x{uuid.uuid4().hex[:40]}",
+        seller=f"0x{uuid.uuid4().hex[:40]}",
+        price=round(random.uniform(0.01, 50), 3),
+        timestamp=datetime.utcnow().replace(microsecond=0) - timedelta(minutes=i),
+        status="completed"
+    ))
+
+
+def make_user(i: int) -> Dict[str, Any]:
+    return stored(User(
+        username=f"user{i}",
+        email=f"user{i}@example.com",
+        bio="Collector of digital art",
+        created_at=datetime.utcnow().replace(microsecond=0)
+    ))
+
+
+def make_nft(i: int) -> Dict[str, Any]:
+    return stored(NFT(
+        name=f"Token #{i}",
+        description="A generated piece from the benchmark collection",
+        image=f"/api/images/{uuid.uuid4().hex}{uuid.uuid4().hex}",
+        price=round(random.uniform(0.01, 50), 3),
+        owner=f"0x{uuid.uuid4().hex[:40]}",
+        creator=f"0x{uuid.uuid4().hex[:40]}",
+        collection=f"Collection {i % 20}",
+        traits=[NFTTrait(trait_type="Background", value="Blue"), NFTTrait(trait_type="Eyes", value="Laser")],
+        token_id=i,
+        created_at=datetime.utcnow().replace(microsecond=0)
+    ))
+
+
+ENDPOINTS: Dict[str, tuple] = {
+    "transactions": (Transaction, make_transaction),
+    "users": (User, make_user),
+    "nfts": (NFT, make_nft),
+}
+
+
+def build_app(rows: int) -> FastAPI:
+    app = FastAPI()
+    for name, (model, factory) in ENDPOINTS.items():
+        docs = [factory(i) for i in range(rows)]
+        for fast in (False, True):
+            app.add_api_route(
+                f"/{'fast' if fast else 'validated'}/{name}",
+                make_route(model, docs, fast),
+                response_model=List[model]
+            )
+    return app
+
+
+def make_route(model, docs: List[Dict[str, Any]], fast: bool) -> Callable:
+    async def route():
+        server.FAST_RESPONSES = fast
+        return read_response(docs, model)
+    return route
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int, rows: int) -> Dict[str, float]:
+    await client.get(path)  # warm up
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = await client.get(path)
+        response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_sec": round(requests / elapsed, 1),
+        "ms_per_request": round(elapsed / requests * 1000, 3),
+        "us_per_row": round(elapsed / requests / rows * 1e6, 3),
+    }
+
+
+async def run(rows: int, requests: int) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=build_app(rows))
+    report = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        validated = await client.get("/validated/transactions")
+        fast = await client.get("/fast/transactions")
+        if validated.json() != fast.json():
+            raise RuntimeError("Fast and validated responses differ")
+        for name in ENDPOINTS:
+            before = await measure(client, f"/validated/{name}", requests, rows)
+            after = await measure(client, f"/fast/{name}", requests, rows)
+            report[name] = {
+                "validated": before,
+                "fast": after,
+                "speedup": round(after["requests_per_sec"] / before["requests_per_sec"], 2),
+            }
+    server.FAST_RESPONSES = False
+    return report
+
+
+@cli.command()
+def main(
+    rows: int = typer.Option(1000, help="Documents per response"),
+    requests: int = typer.Option(100, help="Requests per endpoint and mode"),
+):
+    report = asyncio.run(run(rows, requests))
+    typer.echo(json.dumps({"rows": rows, "requests": requests, "endpoints": report}, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,254 @@
+"""Content-addressed blob storage for NFT and collection images.
+
+Blobs are keyed by the SHA-256 of their bytes. Identical uploads share one
+copy and a key can never point at different content, which is what allows
+``GET /api/images/{hash}`` to be cached by clients indefinitely.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+
+IMAGE_URL_PREFIX = "/api/images/"
+READ_CHUNK_SIZE = 64 * 1024
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Leading bytes of the image formats we expect to see
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+# Types served inline. Anything else, notably SVG which can carry script,
+# is served as a download so it never renders as a document on our origin
+INLINE_CONTENT_TYPES = frozenset({content_type for _, content_type in _SIGNATURES} | {"image/webp"})
+
+# Blobs are user supplied: no sniffing, and no script or plugins if one is opened directly
+IMAGE_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "Content-Security-Policy": "default-src 'none'; style-src 'unsafe-inline'; sandbox",
+}
+
+
+def is_blob_hash(value: str) -> bool:
+    """Check whether a string is a well-formed blob key"""
+    return bool(_HASH_RE.match(value or ""))
+
+
+def image_url(blob_hash: str) -> str:
+    """URL under which a stored blob is served"""
+    return f"{IMAGE_URL_PREFIX}{blob_hash}"
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Guess an image MIME type from the first bytes of the file"""
+    for signature, content_type in _SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.lstrip().startswith((b"<svg", b"<?xml")):
+        return "image/svg+xml"
+    return "application/octet-stream"
+
+
+@dataclass
+class BlobInfo:
+    size: int
+    content_type: str
+
+
+class BlobStore(ABC):
+    """Interface shared by the blob store backends"""
+
+    @abstractmethod
+    async def put(self, data: bytes) -> str:
+        """Store bytes and return their content hash"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> str:
+        """Store a stream of chunks without buffering it and return its hash
+
+        If the iterator raises, nothing is stored and the error propagates.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stat(self, blob_hash: str) -> Optional[BlobInfo]:
+        """Size and content type of a blob, or None if it does not exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, blob_hash: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes of ``[start, end]`` (inclusive) in chunks; implemented as an async generator"""
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs stored as files under ``root/ab/cd/<hash>``"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def _path(self, blob_hash: str) -> Path:
+        return self.root / blob_hash[:2] / blob_hash[2:4] / blob_hash
+
+    def _write(self, blob_hash: str, data: bytes):
+        path = self._path(blob_hash)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write under a unique name and rename so readers never see partial files
+        tmp_path = path.with_name(f".{blob_hash}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    async def put(self, data: bytes) -> str:
+        blob_hash = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write, blob_hash, data)
+        return blob_hash
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> str:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f".{uuid.uuid4().hex}.tmp"
+        digest = hashlib.sha256()
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            try:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                f.close()
+            blob_hash = digest.hexdigest()
+            path = self._path(blob_hash)
+            if not path.exists():
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, path)
+            return blob_hash
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def _stat(self, blob_hash: str) -> Optional[BlobInfo]:
+        path = self._path(blob_hash)
+        try:
+            with open(path, "rb") as f:
+                head = f.read(16)
+                size = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            return None
+        return BlobInfo(size=size, content_type=sniff_content_type(head))
+
+    async def stat(self, blob_hash: str) -> Optional[BlobInfo]:
+        return await asyncio.to_thread(self._stat, blob_hash)
+
+    async def read(self, blob_hash: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self._path(blob_hash), "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+
+class GridFSBlobStore(BlobStore):
+    """Blobs stored in a GridFS bucket with the content hash as filename"""
+
+    def __init__(self, db, bucket_name: str = "images"):
+        self.files = db[f"{bucket_name}.files"]
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+
+    async def put(self, data: bytes) -> str:
+        blob_hash = hashlib.sha256(data).hexdigest()
+        if await self.files.find_one({"filename": blob_hash}, {"_id": 1}):
+            return blob_hash
+        await self.bucket.upload_from_stream(
+            blob_hash,
+            data,
+            metadata={"contentType": sniff_content_type(data[:16])}
+        )
+        return blob_hash
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> str:
+        digest = hashlib.sha256()
+        upload = None
+        try:
+            async for chunk in chunks:
+                if upload is None:
+                    # Upload under a temporary name until the hash is known
+                    upload = self.bucket.open_upload_stream(
+                        f"tmp-{uuid.uuid4().hex}",
+                        metadata={"contentType": sniff_content_type(chunk[:16])}
+                    )
+                digest.update(chunk)
+                await upload.write(chunk)
+        except BaseException:
+            if upload is not None:
+                await upload.abort()
+            raise
+        if upload is None:
+            return await self.put(b"")
+        await upload.close()
+        blob_hash = digest.hexdigest()
+        if await self.files.find_one({"filename": blob_hash}, {"_id": 1}):
+            await self.bucket.delete(upload._id)
+        else:
+            await self.bucket.rename(upload._id, blob_hash)
+        return blob_hash
+
+    async def stat(self, blob_hash: str) -> Optional[BlobInfo]:
+        doc = await self.files.find_one({"filename": blob_hash}, {"length": 1, "metadata": 1})
+        if not doc:
+            return None
+        content_type = (doc.get("metadata") or {}).get("contentType", "application/octet-stream")
+        return BlobInfo(size=doc["length"], content_type=content_type)
+
+    async def read(self, blob_hash: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        stream = await self.bucket.open_download_stream_by_name(blob_hash)
+        try:
+            stream.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining)
+                chunk = await stream.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            stream.close()
+
+
+def create_blob_store(db, default_root: Path) -> BlobStore:
+    """Build the blob store selected by the BLOB_STORE environment variable"""
+    backend = os.environ.get("BLOB_STORE", "local")
+    if backend == "gridfs":
+        return GridFSBlobStore(db)
+    if backend == "local":
+        return LocalBlobStore(Path(os.environ.get("BLOB_DIR", default_root)))
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
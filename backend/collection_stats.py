@@ -0,0 +1,69 @@
+"""Incrementally maintained collection statistics.
+
+``items_count``, ``floor_price`` and ``volume`` on a collection document are
+adjusted by each mint, listing change and sale instead of rescanning the
+collection:
+
+* a mint or a new listing lowers the floor with one conditional update;
+* when a listing at the current floor goes away, the new floor is read with
+  one seek on the ``collection_status_price`` index (the sorted price index
+  in the memory engine), the sorted structure that makes removing the
+  minimum cheap. It is written only if the floor has not changed since it
+  was read; otherwise a concurrent listing or delisting moved it, and the
+  check starts over from the new floor;
+* a sale adds its price to ``volume``.
+
+``recompute_collection_stats`` rebuilds the same numbers with server-side
+aggregations on Mongo. It repairs drift and backfills data written outside these
+hooks. A ``floor_price`` of 0 means nothing is listed.
+"""
+from typing import Iterable, Optional
+
+from repositories import Repositories
+
+
+async def record_mint(repos: Repositories, collection_name: str, price: float, listed: bool = True, count: int = 1):
+    """Account for ``count`` new NFTs; ``price`` is the lowest listed one"""
+    await repos.collections.add_items(collection_name, count, price if listed else None)
+
+
+async def record_listing(repos: Repositories, collection_name: str, price: float):
+    """An NFT was listed at ``price``"""
+    await repos.collections.lower_floor(collection_name, price)
+
+
+async def record_delisting(repos: Repositories, collection_name: str, price: float):
+    """A listing at ``price`` went away (sold or unlisted)"""
+    while True:
+        floor_price = await repos.collections.get_floor(collection_name)
+        # Only removing the current minimum can move the floor
+        if floor_price is None or price > floor_price:
+            return
+        cheapest = await repos.nfts.cheapest_listed_price(collection_name)
+        new_floor = cheapest if cheapest is not None else 0.0
+        # A listing made meanwhile lowered the floor with lower_floor; never overwrite it
+        if await repos.collections.replace_floor(collection_name, floor_price, new_floor):
+            return
+
+
+async def record_sale(repos: Repositories, collection_name: str, sale_price: float, listed_price: Optional[float]):
+    """A sale completed: add to volume and drop the listing from the floor"""
+    await repos.collections.add_volume(collection_name, sale_price)
+    if listed_price is not None:
+        await record_delisting(repos, collection_name, listed_price)
+
+
+async def recompute_collection_stats(repos: Repositories, collection_names: Optional[Iterable[str]] = None) -> int:
+    """Rebuild stats from scratch; returns collections updated"""
+    names = list(collection_names) if collection_names is not None else None
+
+    stats = {
+        name: {**values, "volume": 0.0}
+        for name, values in (await repos.nfts.stats_by_collection(names)).items()
+    }
+    for name, volume in (await repos.transactions.volume_by_collection(names)).items():
+        stats.setdefault(name, {"items_count": 0, "floor_price": 0.0})["volume"] = volume
+
+    for name in names or []:
+        stats.setdefault(name, {"items_count": 0, "floor_price": 0.0, "volume": 0.0})
+    return await repos.collections.set_stats(stats)
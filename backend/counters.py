@@ -0,0 +1,128 @@
+"""Write-behind buffer for hot document counters (views, likes).
+
+Increments are coalesced in process per document and field. They are
+written with one ``increment_many`` call on the repository (an unordered
+``bulk_write`` of ``$inc`` updates on Mongo) when the flush interval elapses
+or the number of dirty documents passes ``max_pending``.
+Requests never wait on the write, and a popular document receives one
+update per flush instead of one per hit.
+
+Deltas are in memory until flushed. A crash loses at most one interval's
+worth of increments, and a clean shutdown flushes everything.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    def __init__(
+        self,
+        repository,
+        flush_interval: float = 1.0,
+        max_pending: int = 1000,
+        on_flush: Optional[Callable[[Iterable[str]], None]] = None,
+    ):
+        # Anything with an increment_many, e.g. the NFT repository
+        self.repository = repository
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Called with the ids written by each successful flush
+        self.on_flush = on_flush
+        self._pending: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stats = {
+            "flushes": 0,
+            "flush_failures": 0,
+            "documents_flushed": 0,
+            "increments_flushed": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def incr(self, doc_id: str, field: str, amount: int = 1):
+        """Record an increment; it is persisted by the next flush"""
+        self._pending[doc_id][field] += amount
+        if len(self._pending) >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self, doc_id: str, field: str) -> int:
+        """Increments recorded for a document field but not flushed yet"""
+        deltas = self._pending.get(doc_id)
+        return deltas.get(field, 0) if deltas else 0
+
+    async def flush(self):
+        """Write all pending increments in one batch"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+            started = time.perf_counter()
+            try:
+                await self.repository.increment_many({doc_id: dict(deltas) for doc_id, deltas in batch.items()})
+            except Exception as e:
+                # Put the deltas back so the next flush retries them
+                self._stats["flush_failures"] += 1
+                logger.error(f"Counter flush failed, {len(batch)} documents requeued: {e}")
+                for doc_id, deltas in batch.items():
+                    for field, amount in deltas.items():
+                        self._pending[doc_id][field] += amount
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._stats["flushes"] += 1
+            self._stats["documents_flushed"] += len(batch)
+            self._stats["increments_flushed"] += sum(sum(d.values()) for d in batch.values())
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+            self._stats["total_flush_ms"] += elapsed_ms
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(batch.keys())
+                except Exception as e:
+                    logger.error(f"Counter on_flush callback failed: {e}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still pending"""
+        if self._task is not None:
+            # Let the loop finish its flush rather than cancel it mid-write:
+            # a cancelled write would lose the batch it had taken
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def metrics(self) -> Dict[str, float]:
+        flushes = self._stats["flushes"]
+        return {
+            "pending_documents": len(self._pending),
+            "pending_increments": sum(sum(d.values()) for d in self._pending.values()),
+            **self._stats,
+            "avg_flush_ms": self._stats["total_flush_ms"] / flushes if flushes else 0.0,
+        }
@@ -0,0 +1,202 @@
+"""In-process marketplace event bus.
+
+Write paths publish events (mints, listings, purchases, settlements,
+likes), and subscribers receive them over WebSocket or SSE instead of
+re-polling the list endpoints.
+
+* Topics: a subscriber follows every event or only those of some
+  collections. Matching subscribers are found through a per-collection
+  index, so an event costs nothing for subscribers of other collections.
+* Each event is encoded once with orjson, and the same bytes go to every
+  subscriber.
+* Counter events are coalesced: likes are summed per NFT and published as
+  one ``nft.likes`` event per ``coalesce_interval``.
+* Every subscriber has a bounded buffer. A subscriber that falls
+  ``buffer_size`` events behind is dropped: its buffer is emptied, it
+  receives a final ``DROPPED`` marker and its connection is closed, so a
+  slow client can never hold memory or slow down publishing.
+
+An idle subscriber costs one small queue and no work on publish, so a
+worker can hold thousands of them. The bus is per process: with several
+workers, a client only sees events raised in the worker serving it.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set
+
+import orjson
+from starlette.responses import StreamingResponse
+
+
+logger = logging.getLogger(__name__)
+
+# Last item a subscriber receives: it fell behind, or its client went away
+DROPPED = object()
+CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, collections: Optional[Iterable[str]], buffer_size: int):
+        # None follows every collection
+        self.collections = frozenset(collections) if collections else None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.buffer_size = buffer_size
+        self.dropped = False
+
+    async def get(self):
+        """Next encoded event, or DROPPED/CLOSED"""
+        return await self.queue.get()
+
+    def end(self, marker=CLOSED):
+        """Discard the buffer and make ``marker`` the next and last item"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(marker)
+
+    def deliver(self, payload: bytes) -> bool:
+        """Queue ``payload``; False when this subscriber fell behind and was dropped"""
+        if self.queue.full():
+            self.dropped = True
+            self.end(DROPPED)
+            return False
+        self.queue.put_nowait(payload)
+        return True
+
+
+class EventBus:
+    def __init__(self, buffer_size: int = 256, coalesce_interval: float = 0.5):
+        self.buffer_size = buffer_size
+        self.coalesce_interval = coalesce_interval
+        self._everything: Set[Subscription] = set()
+        self._by_collection: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._sequence = 0
+        # {nft_id: {"collection": name, field: delta}} waiting for the next coalesced publish
+        self._counters: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "published": 0,
+            "delivered": 0,
+            "dropped_subscribers": 0,
+            "coalesced_increments": 0,
+        }
+
+    def subscribe(self, collections: Optional[Iterable[str]] = None) -> Subscription:
+        subscription = Subscription(collections, self.buffer_size)
+        if subscription.collections is None:
+            self._everything.add(subscription)
+        else:
+            for name in subscription.collections:
+                self._by_collection[name].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.collections is None:
+            self._everything.discard(subscription)
+            return
+        for name in subscription.collections:
+            subscribers = self._by_collection.get(name)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_collection[name]
+
+    def publish(self, event_type: str, data: Dict[str, Any], collection: Optional[str] = None):
+        """Send an event to every matching subscriber without waiting on any of them"""
+        self._sequence += 1
+        self._stats["published"] += 1
+        subscribers = (self._everything | self._by_collection.get(collection, set())) if collection else self._everything
+        if not subscribers:
+            return
+        payload = orjson.dumps({
+            "id": self._sequence,
+            "type": event_type,
+            "collection": collection,
+            "timestamp": time.time(),
+            "data": data,
+        })
+        for subscription in list(subscribers):
+            if subscription.deliver(payload):
+                self._stats["delivered"] += 1
+            else:
+                self._stats["dropped_subscribers"] += 1
+                self.unsubscribe(subscription)
+
+    def count(self, nft_id: str, collection: Optional[str], field: str, amount: int = 1):
+        """Add to a coalesced counter event published on the next tick"""
+        pending = self._counters.setdefault(nft_id, {"collection": collection})
+        pending[field] = pending.get(field, 0) + amount
+        self._stats["coalesced_increments"] += 1
+
+    def flush_counters(self):
+        counters, self._counters = self._counters, {}
+        for nft_id, pending in counters.items():
+            collection = pending.pop("collection")
+            for field, delta in pending.items():
+                self.publish(f"nft.{field}", {"nft_id": nft_id, "delta": delta}, collection)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.coalesce_interval)
+            try:
+                self.flush_counters()
+            except Exception as e:
+                logger.error(f"Publishing counter events failed: {e}")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush_counters()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._everything) + len({
+                subscription for subscribers in self._by_collection.values() for subscription in subscribers
+            }),
+            "collections_followed": len(self._by_collection),
+            "pending_counter_events": len(self._counters),
+            **self._stats,
+        }
+
+
+async def sse_events(bus: EventBus, collections: Optional[Iterable[str]], heartbeat: float = 15.0) -> AsyncIterator[bytes]:
+    """Server-sent events for one subscriber, with keepalive comments while idle"""
+    subscription = bus.subscribe(collections)
+    try:
+        yield b": connected\n\n"
+        while True:
+            try:
+                payload = await asyncio.wait_for(subscription.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if payload is DROPPED:
+                yield b'event: dropped\ndata: {"reason": "too slow"}\n\n'
+                return
+            if payload is CLOSED:
+                return
+            yield b"data: " + payload + b"\n\n"
+    finally:
+        bus.unsubscribe(subscription)
+
+
+class EventStreamResponse(StreamingResponse):
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # A disconnect cancels the response while the generator waits
+            # for an event; closing it unsubscribes right away
+            await self.body_iterator.aclose()
@@ -0,0 +1,41 @@
+"""Streaming NDJSON exports.
+
+A repository cursor is read batch by batch and every document becomes one
+orjson-encoded line, so memory use does not grow with the size of the
+result. Lines are sent in chunks of ``chunk_rows``. The cursor is closed
+when the stream ends, fails or the client disconnects.
+"""
+from typing import AsyncIterator
+
+import orjson
+from starlette.responses import StreamingResponse
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def ndjson_lines(cursor, chunk_rows: int = 500) -> AsyncIterator[bytes]:
+    """Encode the documents of ``cursor`` as NDJSON, ``chunk_rows`` lines per chunk"""
+    try:
+        chunk = []
+        async for doc in cursor:
+            chunk.append(orjson.dumps(doc))
+            if len(chunk) >= chunk_rows:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+        if chunk:
+            yield b"\n".join(chunk) + b"\n"
+    finally:
+        await cursor.close()
+
+
+class NDJSONResponse(StreamingResponse):
+    media_type = NDJSON_MEDIA_TYPE
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # A disconnect cancels the response while the generator is
+            # suspended; closing it runs its finally and closes the cursor
+            await self.body_iterator.aclose()
@@ -0,0 +1,51 @@
+"""Trait facets for NFT listings.
+
+A facet gives, for the NFTs matching the current filters, the number
+holding each (trait_type, value). Selection is disjunctive. Values of one
+trait type are alternatives (OR), and different types must all match
+(AND). The counts of a selected type therefore ignore that type's own
+selection, so a client can show how many items each other value would add.
+
+A listing filtered by collection alone is answered from the collection's
+maintained trait counts (see ``rarity``) in one read. The counts are only
+trusted when their total matches the collection's NFT count. Stale counts
+schedule a rescore through ``on_stale``. Any other filter, and any stale
+collection, runs one ``$facet`` aggregation over the matching NFTs.
+"""
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional
+
+from repositories import NFTFilter, Repositories
+
+
+def _only_collection(query: NFTFilter) -> bool:
+    return bool(query.collection) and query == replace(NFTFilter(), collection=query.collection)
+
+
+def sorted_facets(counts: Dict[Any, Dict[Any, int]]) -> List[Dict[str, Any]]:
+    """API shape of facet counts: types by name, values by count then value"""
+    return [
+        {
+            "trait_type": trait_type,
+            "values": [
+                {"value": value, "count": count}
+                for value, count in sorted(values.items(), key=lambda item: (-item[1], str(item[0])))
+            ],
+        }
+        for trait_type, values in sorted(counts.items(), key=lambda item: str(item[0]))
+    ]
+
+
+async def trait_facets(
+    repos: Repositories, query: NFTFilter, on_stale: Optional[Callable[[str], None]] = None
+) -> Dict[str, Any]:
+    """``{"total": n, "traits": [...]}`` for the NFTs matching ``query``"""
+    if _only_collection(query):
+        stored = await repos.trait_counts.get(query.collection)
+        total = await repos.nfts.count(query)
+        if total and stored["total"] == total:
+            return {"total": total, "traits": sorted_facets(stored["counts"])}
+        if total and on_stale is not None:
+            on_stale(query.collection)
+    facets = await repos.nfts.trait_facets(query)
+    return {"total": facets["total"], "traits": sorted_facets(facets["traits"])}
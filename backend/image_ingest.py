@@ -0,0 +1,183 @@
+"""Non-blocking download of remote images into the blob store.
+
+All downloads share one keep-alive connection pool. Each host gets a small
+concurrency budget so a slow or popular image host cannot take over the
+pool; a host's budget is dropped once it has no download in flight, so
+arbitrary hostnames cannot grow the table. Bodies are streamed straight into the blob store, capped at
+``max_bytes``, and never held in memory as a whole.
+
+URLs come from API clients, so the fetcher accepts only http(s). It resolves
+the host and refuses any address that is not publicly routable (private,
+loopback, link-local, reserved...). The request then connects to the
+address that passed the check, with the original Host header and TLS server
+name, so a host whose DNS answer changes in between (DNS rebinding) cannot
+slip a private address past it. Redirects are followed by hand so every
+hop goes through the same check. ``allow_private_hosts``
+(IMAGE_FETCH_ALLOW_PRIVATE=1) lifts the address check for local testing.
+"""
+import asyncio
+import ipaddress
+import os
+import socket
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from blob_store import BlobStore
+
+
+class ImageTooLarge(Exception):
+    """Raised when a remote image exceeds the configured size cap"""
+
+
+class UnsafeImageURL(Exception):
+    """Raised when an image URL is not http(s) or resolves to a non-public address"""
+
+
+def is_public_address(address: str) -> bool:
+    """Whether ``address`` is globally routable unicast"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class _HostSlot:
+    """Concurrency budget of one host and the downloads holding or awaiting it"""
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class ImageFetcher:
+    def __init__(
+        self,
+        max_bytes: int = 10 * 1024 * 1024,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 15.0,
+        total_timeout: float = 60.0,
+        max_connections: int = 32,
+        max_keepalive: int = 16,
+        per_host_limit: int = 4,
+        max_redirects: int = 5,
+        allow_private_hosts: bool = False,
+    ):
+        self.max_bytes = max_bytes
+        self.max_redirects = max_redirects
+        self.allow_private_hosts = allow_private_hosts
+        self.total_timeout = total_timeout
+        self.per_host_limit = per_host_limit
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, _HostSlot] = {}
+
+    @classmethod
+    def from_env(cls) -> "ImageFetcher":
+        """Build a fetcher configured from IMAGE_FETCH_* environment variables"""
+        env = os.environ
+        return cls(
+            max_bytes=int(env.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024)),
+            connect_timeout=float(env.get("IMAGE_FETCH_CONNECT_TIMEOUT", 5.0)),
+            read_timeout=float(env.get("IMAGE_FETCH_READ_TIMEOUT", 15.0)),
+            total_timeout=float(env.get("IMAGE_FETCH_TOTAL_TIMEOUT", 60.0)),
+            max_connections=int(env.get("IMAGE_FETCH_MAX_CONNECTIONS", 32)),
+            per_host_limit=int(env.get("IMAGE_FETCH_PER_HOST", 4)),
+            max_redirects=int(env.get("IMAGE_FETCH_MAX_REDIRECTS", 5)),
+            allow_private_hosts=env.get("IMAGE_FETCH_ALLOW_PRIVATE", "0") == "1",
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                limits=self._limits,
+                # Redirects are followed in _fetch so each hop is checked
+                follow_redirects=False
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self, url: httpx.URL):
+        host = url.netloc.decode("ascii").lower()
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = _HostSlot(self.per_host_limit)
+        slot.users += 1
+        try:
+            async with slot.semaphore:
+                yield
+        finally:
+            slot.users -= 1
+            if not slot.users:
+                del self._host_slots[host]
+
+    async def _check_url(self, url: httpx.URL) -> Optional[str]:
+        """The checked address to connect to; None when private hosts are allowed"""
+        if url.scheme not in ("http", "https"):
+            raise UnsafeImageURL(f"Unsupported URL scheme: {url.scheme or '(none)'}")
+        if not url.host:
+            raise UnsafeImageURL("Image URL has no host")
+        if self.allow_private_hosts:
+            return None
+        port = url.port or (443 if url.scheme == "https" else 80)
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(url.host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise UnsafeImageURL(f"Cannot resolve {url.host}: {e}")
+        for info in infos:
+            if not is_public_address(info[4][0]):
+                raise UnsafeImageURL(f"{url.host} resolves to a non-public address")
+        return infos[0][4][0]
+
+    def _stream(self, url: httpx.URL, address: Optional[str]):
+        if address is None:
+            return self.client.stream("GET", url)
+        # Connect to the checked address; Host and the TLS server name still name the host
+        return self.client.stream(
+            "GET",
+            url.copy_with(host=address),
+            headers={"Host": url.netloc.decode("ascii")},
+            extensions={"sni_hostname": url.host} if url.scheme == "https" else None,
+        )
+
+    async def _body(self, response: httpx.Response) -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > self.max_bytes:
+                raise ImageTooLarge(f"Image exceeds {self.max_bytes} bytes")
+            yield chunk
+
+    async def _fetch(self, url: str, store: BlobStore) -> str:
+        target = httpx.URL(url)
+        for _ in range(self.max_redirects + 1):
+            address = await self._check_url(target)
+            async with self._slot(target):
+                async with self._stream(target, address) as response:
+                    if response.is_redirect:
+                        # Resolved against the URL as given, not the pinned address
+                        target = target.join(response.headers["location"])
+                        continue
+                    response.raise_for_status()
+                    declared = response.headers.get("content-length")
+                    if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                        raise ImageTooLarge(f"Image exceeds {self.max_bytes} bytes")
+                    return await store.put_stream(self._body(response))
+        raise httpx.TooManyRedirects(f"More than {self.max_redirects} redirects")
+
+    async def fetch_into(self, url: str, store: BlobStore) -> str:
+        """Download ``url`` into ``store`` and return the blob hash"""
+        return await asyncio.wait_for(self._fetch(url, store), self.total_timeout)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
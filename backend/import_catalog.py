@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Stream a large NFT catalog (JSONL or CSV) into MongoDB.
+
+Rows are read lazily and written in ordered batches. After every batch the
+number of rows consumed is written to a checkpoint file, so an interrupted
+import resumes where it stopped. Each row gets a deterministic id, and
+batches are upserts, so replaying a partially written batch is harmless.
+
+Usage, from the backend directory::
+
+    python import_catalog.py catalog.jsonl --batch-size 1000
+    python import_catalog.py catalog.csv --no-fetch-images
+
+Recognised columns: id, name, description, price, collection, image_url or
+image, owner, creator, status and traits. In JSONL, traits is a list of
+``{"trait_type", "value"}`` objects. In CSV, it is ``Type:Value`` pairs
+separated by ``;``.
+"""
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+import uuid
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import typer
+from pydantic import ValidationError
+from pymongo import ReplaceOne, UpdateOne
+
+from collection_stats import recompute_collection_stats
+from rarity import rescore_collection
+from server import NFT, Collection, client, db, download_images, nft_document, repositories, token_ids
+
+
+cli = typer.Typer(help="Import an NFT catalog into MongoDB")
+logger = logging.getLogger("import_catalog")
+
+
+def iter_rows(path: Path, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Yield catalog rows one at a time without loading the file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_traits(value: Any) -> List[Dict[str, str]]:
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    traits = []
+    for pair in str(value).split(";"):
+        trait_type, _, trait_value = pair.partition(":")
+        if trait_type.strip():
+            traits.append({"trait_type": trait_type.strip(), "value": trait_value.strip()})
+    return traits
+
+
+def row_to_nft(row: Dict[str, Any], row_id: str, token_id: int, image: str) -> NFT:
+    fields = {
+        "id": row.get("id") or row_id,
+        "name": row["name"],
+        "description": row.get("description") or "",
+        "image": image,
+        "price": float(row["price"]),
+        "owner": row.get("owner") or "0x" + uuid.uuid4().hex[:40],
+        "creator": row.get("creator") or "0x" + uuid.uuid4().hex[:40],
+        "collection": row["collection"],
+        "traits": parse_traits(row.get("traits")),
+        "token_id": token_id,
+    }
+    if row.get("status"):
+        fields["status"] = row["status"]
+    return NFT(**fields)
+
+
+def load_checkpoint(path: Path, source: Path) -> int:
+    if not path.exists():
+        return 0
+    checkpoint = json.loads(path.read_text())
+    if checkpoint.get("source") != str(source.resolve()):
+        raise typer.BadParameter(f"Checkpoint {path} belongs to {checkpoint.get('source')}")
+    return checkpoint["rows_done"]
+
+
+def save_checkpoint(path: Path, source: Path, rows_done: int):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps({"source": str(source.resolve()), "rows_done": rows_done}))
+    os.replace(tmp_path, path)
+
+
+async def ensure_collections(names: Set[str], known: Set[str]):
+    """Create collections referenced by the catalog that do not exist yet"""
+    missing = names - known
+    if not missing:
+        return
+    await db.collections.bulk_write([
+        UpdateOne(
+            {"name": name},
+            {"$setOnInsert": Collection(
+                name=name,
+                description="",
+                creator="0x" + uuid.uuid4().hex[:40]
+            ).dict()},
+            upsert=True
+        )
+        for name in missing
+    ], ordered=False)
+    known.update(missing)
+
+
+async def import_batch(
+    rows: List[Dict[str, Any]],
+    first_row: int,
+    namespace: uuid.UUID,
+    fetch_images: bool,
+    image_concurrency: int,
+    known_collections: Set[str],
+) -> int:
+    """Write one batch of rows and return how many were valid"""
+    if fetch_images:
+        images = await download_images([row.get("image_url") or "" for row in rows], image_concurrency)
+    else:
+        images = [row.get("image") or "" for row in rows]
+
+    # One id reservation per batch instead of one per NFT
+    token_id_block = iter(await token_ids.reserve(len(rows)))
+
+    docs = []
+    for offset, (row, image) in enumerate(zip(rows, images)):
+        row_number = first_row + offset
+        try:
+            nft = row_to_nft(row, str(uuid.uuid5(namespace, str(row_number))), next(token_id_block), image)
+        except (KeyError, ValueError, ValidationError) as e:
+            logger.warning(f"Skipping row {row_number}: {e}")
+            continue
+        docs.append(nft_document(nft))
+
+    if docs:
+        await ensure_collections({doc["collection"] for doc in docs}, known_collections)
+        await db.nfts.bulk_write(
+            [ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs],
+            ordered=True
+        )
+    return len(docs)
+
+
+async def run_import(
+    source: Path,
+    fmt: str,
+    batch_size: int,
+    checkpoint: Path,
+    fetch_images: bool,
+    image_concurrency: int,
+):
+    await token_ids.seed()
+    rows_done = load_checkpoint(checkpoint, source)
+    if rows_done:
+        typer.echo(f"Resuming after row {rows_done}")
+
+    namespace = uuid.uuid5(uuid.NAMESPACE_URL, source.name)
+    known_collections = set(await db.collections.distinct("name"))
+    touched_collections: Set[str] = set()
+    imported = skipped = 0
+    started = time.monotonic()
+
+    rows = islice(iter_rows(source, fmt), rows_done, None)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        batch_started = time.monotonic()
+        written = await import_batch(
+            batch, rows_done, namespace, fetch_images, image_concurrency, known_collections
+        )
+        rows_done += len(batch)
+        imported += written
+        skipped += len(batch) - written
+        touched_collections.update(row.get("collection") for row in batch if row.get("collection"))
+        save_checkpoint(checkpoint, source, rows_done)
+
+        batch_rate = len(batch) / max(time.monotonic() - batch_started, 1e-9)
+        overall_rate = (imported + skipped) / max(time.monotonic() - started, 1e-9)
+        typer.echo(
+            f"rows {rows_done:>9}  batch {batch_rate:>9.0f} rows/s  overall {overall_rate:>9.0f} rows/s"
+        )
+
+    # Refresh collection stats and rarity once for the whole import instead of once per NFT
+    await recompute_collection_stats(repositories, touched_collections)
+    for name in sorted(touched_collections):
+        await rescore_collection(repositories, name)
+
+    elapsed = time.monotonic() - started
+    typer.echo(json.dumps({
+        "imported": imported,
+        "skipped": skipped,
+        "rows_done": rows_done,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round((imported + skipped) / max(elapsed, 1e-9), 1),
+        "collections": len(touched_collections),
+    }, indent=2))
+
+
+@cli.command()
+def main(
+    source: Path = typer.Argument(..., exists=True, dir_okay=False, help="JSONL or CSV catalog"),
+    fmt: Optional[str] = typer.Option(None, "--format", help="jsonl or csv (default: from extension)"),
+    batch_size: int = typer.Option(1000, help="Rows written per ordered batch"),
+    checkpoint: Optional[Path] = typer.Option(None, help="Checkpoint file (default: <source>.checkpoint)"),
+    fetch_images: bool = typer.Option(True, help="Download image_url into the blob store"),
+    image_concurrency: int = typer.Option(16, help="Concurrent image downloads per batch"),
+):
+    """Stream a catalog into the nfts collection in resumable batches"""
+    fmt = fmt or ("csv" if source.suffix.lower() == ".csv" else "jsonl")
+    if fmt not in ("jsonl", "csv"):
+        raise typer.BadParameter("--format must be jsonl or csv")
+    checkpoint = checkpoint or source.with_name(source.name + ".checkpoint")
+
+    asyncio.run(run_import(source, fmt, batch_size, checkpoint, fetch_images, image_concurrency))
+    client.close()
+
+
+if __name__ == "__main__":
+    cli()
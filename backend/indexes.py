@@ -0,0 +1,135 @@
+"""Declared MongoDB indexes for every query shape the API issues.
+
+``ensure_indexes`` runs at startup. ``create_indexes`` is a no-op for
+indexes that already exist with the same definition, so repeated restarts
+are cheap.
+"""
+import logging
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "nfts": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("token_id", ASCENDING)], name="token_id_unique", unique=True),
+        # Collection pages, listed-only filters and floor price lookups
+        IndexModel(
+            [("collection", ASCENDING), ("status", ASCENDING), ("price", ASCENDING)],
+            name="collection_status_price"
+        ),
+        IndexModel([("owner", ASCENDING)], name="owner"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        # get_nfts sorts, each with the id tiebreaker used by keyset cursors
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("price", ASCENDING), ("id", ASCENDING)], name="price_id"),
+        IndexModel([("likes", DESCENDING), ("id", DESCENDING)], name="likes_id"),
+        IndexModel([("views", DESCENDING), ("id", DESCENDING)], name="views_id"),
+        IndexModel([("rarity_score", DESCENDING), ("id", DESCENDING)], name="rarity_score_id"),
+        # Rarity is ranked within a collection, so its pages are usually filtered by one
+        IndexModel(
+            [("collection", ASCENDING), ("rarity_score", DESCENDING), ("id", DESCENDING)],
+            name="collection_rarity_score_id"
+        ),
+        # Multikey index serving anchored prefix matches from search
+        IndexModel([("search_terms", ASCENDING)], name="search_terms"),
+        # Trait filters ($elemMatch on type and value) within a collection
+        IndexModel(
+            [("collection", ASCENDING), ("traits.trait_type", ASCENDING), ("traits.value", ASCENDING)],
+            name="collection_trait_type_value"
+        ),
+    ],
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("wallet_address", ASCENDING)], name="wallet_address"),
+    ],
+    "collections": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("name", ASCENDING)], name="name"),
+    ],
+    "transactions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("timestamp", DESCENDING)], name="status_timestamp"),
+        IndexModel([("timestamp", DESCENDING)], name="timestamp"),
+        IndexModel([("nft_id", ASCENDING)], name="nft_id"),
+    ],
+    "settlement_jobs": [
+        # Claiming due jobs; run_at doubles as the lease expiry while processing
+        IndexModel([("state", ASCENDING), ("run_at", ASCENDING)], name="state_run_at"),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+        # Finished jobs are kept for a day for inspection
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=86400),
+    ],
+    "trait_counts": [
+        # One counter per trait value; trait_type and value are null on the collection total
+        IndexModel(
+            [("collection", ASCENDING), ("trait_type", ASCENDING), ("value", ASCENDING)],
+            name="collection_trait_value", unique=True
+        ),
+    ],
+    "activity": [
+        # One bucket per key; also serves the window sums of a scope and granularity
+        IndexModel(
+            [("scope", ASCENDING), ("granularity", ASCENDING), ("start", ASCENDING), ("key", ASCENDING)],
+            name="scope_granularity_start_key", unique=True
+        ),
+        # Buckets are dropped once no window reads them
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "price_history": [
+        # One rollup per bucket; also serves newest-first bucket ranges
+        IndexModel(
+            [("collection", ASCENDING), ("interval", ASCENDING), ("start", ASCENDING)],
+            name="collection_interval_start", unique=True
+        ),
+    ],
+}
+
+
+async def ensure_indexes(db):
+    """Create any declared index that does not exist yet
+
+    Indexes are created one by one so that a failure (typically a unique
+    index blocked by existing duplicates) is logged without preventing the
+    others.
+    """
+    for collection_name, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[collection_name].create_indexes([model])
+            except OperationFailure as e:
+                logger.error(f"Could not create index {model.document['name']} on {collection_name}: {e}")
+
+
+async def index_usage(db) -> List[Dict[str, Any]]:
+    """Per-index access counters from $indexStats for the declared collections"""
+    report = []
+    for collection_name, models in INDEXES.items():
+        declared = {model.document["name"] for model in models}
+        stats = await db[collection_name].aggregate([{"$indexStats": {}}]).to_list(None)
+        present = set()
+        for stat in stats:
+            present.add(stat["name"])
+            report.append({
+                "collection": collection_name,
+                "name": stat["name"],
+                "key": dict(stat["key"]),
+                "ops": stat["accesses"]["ops"],
+                "since": stat["accesses"]["since"],
+                "declared": stat["name"] in declared,
+            })
+        for name in sorted(declared - present):
+            report.append({
+                "collection": collection_name,
+                "name": name,
+                "key": None,
+                "ops": 0,
+                "since": None,
+                "declared": True,
+                "missing": True,
+            })
+    return sorted(report, key=lambda row: (row["collection"], -row["ops"]))
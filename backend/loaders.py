@@ -0,0 +1,62 @@
+"""Request-scoped document loaders.
+
+A ``DocumentLoader`` batches every ``load`` issued in the same event loop
+turn into one ``get_many`` call on a repository (an ``$in`` query on Mongo)
+and memoizes the result, so looking up the same
+collection or user many times within a request costs a single round trip.
+Loaders cache without expiry, so they must not outlive a request: use the
+``get_loaders`` dependency in server.py, which builds a fresh set per
+request.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from repositories import Document, Repositories
+
+
+class DocumentLoader:
+    def __init__(self, fetch_many: Callable[[List[Any]], Awaitable[List[Document]]], key: str = "id"):
+        # Returns the documents whose ``key`` is among the given values
+        self.fetch_many = fetch_many
+        self.key = key
+        self._results: Dict[Any, asyncio.Future] = {}
+        self._queue: List[Any] = []
+        self._dispatch: Optional[asyncio.Task] = None
+
+    def load(self, value: Any) -> "asyncio.Future[Optional[Dict[str, Any]]]":
+        """Document whose ``key`` equals ``value``, or None"""
+        result = self._results.get(value)
+        if result is None:
+            loop = asyncio.get_running_loop()
+            result = self._results[value] = loop.create_future()
+            self._queue.append(value)
+            if self._dispatch is None:
+                # Runs once the caller yields, after every load of this turn is queued
+                self._dispatch = loop.create_task(self._fetch())
+        return result
+
+    async def load_many(self, values: Iterable[Any]) -> List[Optional[Dict[str, Any]]]:
+        """Documents for ``values`` in the same order, None where missing"""
+        return list(await asyncio.gather(*(self.load(value) for value in values)))
+
+    async def _fetch(self):
+        values, self._queue, self._dispatch = self._queue, [], None
+        try:
+            docs = await self.fetch_many(values)
+        except Exception as e:
+            for value in values:
+                self._results.pop(value).set_exception(e)
+            return
+        by_key = {doc[self.key]: doc for doc in docs}
+        for value in values:
+            self._results[value].set_result(by_key.get(value))
+
+
+class Loaders:
+    """The loaders a request may use, all sharing one request's lifetime"""
+
+    def __init__(self, repos: Repositories):
+        self.nfts = DocumentLoader(repos.nfts.get_many)
+        self.users = DocumentLoader(repos.users.get_many)
+        self.collections = DocumentLoader(repos.collections.get_many)
+        self.collections_by_name = DocumentLoader(repos.collections.get_many_by_name, key="name")
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""Seeded load test and latency benchmark for the API.
+
+Seeds a dedicated database with users, collections, NFTs and historical
+transactions at a configurable scale, then drives a concurrent mixed
+workload of the main user journeys:
+
+* browse: NFT listing pages with random sorts and collection filters,
+  sometimes following the next-page cursor;
+* search: NFT text search;
+* detail: single NFT view;
+* like: like an NFT;
+* mint: create an NFT, with its image served by a local HTTP server;
+* buy: purchase a listed NFT from its owner.
+
+The app runs in process through ``httpx.ASGITransport`` by default, or
+against a running server with ``--base-url``. The server must then use
+the same MONGO_URL and DB_NAME as the seeding step, or run with
+``--no-seed`` against data already in place. It also needs
+IMAGE_FETCH_ALLOW_PRIVATE=1 to fetch the local mint images.
+
+``--engine mongo`` uses MONGO_URL (a local mongod). ``--engine memory``
+uses the in-process storage engine (STORAGE_ENGINE=memory), which measures
+the API layer without a database.
+
+Usage, from the backend directory::
+
+    python loadtest.py --nfts 5000 --requests 5000 --concurrency 32 --save-baseline baseline.json
+    python loadtest.py --nfts 5000 --requests 5000 --concurrency 32 --baseline baseline.json
+
+The report (JSON) lists throughput, status codes and p50/p95/p99 latency
+per operation. With ``--baseline``, operations whose p95 or p99 grew, or
+whose throughput dropped, by more than ``--tolerance`` are listed under
+"regressions" and the exit code is 1.
+"""
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import typer
+
+
+cli = typer.Typer(help="Seed a database and run a mixed concurrent workload against the API")
+
+OPERATIONS = ("browse", "search", "detail", "like", "mint", "buy")
+DEFAULT_MIX = "browse=40,search=15,detail=25,like=10,mint=5,buy=5"
+WORDS = [
+    "cosmic", "neon", "pixel", "dream", "ape", "punk", "glitch", "aurora", "shadow", "crystal",
+    "robot", "samurai", "ocean", "forest", "ember", "lunar", "solar", "vapor", "echo", "prism",
+]
+TRAITS = {
+    "Background": ["Blue", "Red", "Gold", "Black", "Green"],
+    "Eyes": ["Laser", "Sleepy", "Wide", "Closed"],
+    "Accessory": ["Hat", "Chain", "Glasses", "None"],
+}
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 16
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # Vary the bytes per path so every mint stores a distinct blob
+        body = PNG + self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve_images(ports: multiprocessing.Queue):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_image_server() -> str:
+    """Serve generated PNGs for mint requests; returns the base URL
+
+    The server runs in its own process so it does not compete with the app
+    for the GIL and distort mint latencies.
+    """
+    ports = multiprocessing.Queue()
+    multiprocessing.Process(target=_serve_images, args=(ports,), daemon=True).start()
+    return f"http://127.0.0.1:{ports.get(timeout=10)}"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise typer.BadParameter(f"Unknown operation {name!r}; expected one of {', '.join(OPERATIONS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+async def seed(server, rng: random.Random, users: int, collections: int, nfts: int, transactions: int) -> Dict[str, Any]:
+    """Replace the database contents with generated data"""
+    repos = server.repositories
+    await repos.clear()
+    await server.token_ids.seed()
+    server.response_cache.clear()
+
+    user_docs = [server.User(username=f"user{i}", email=f"user{i}@example.com").dict() for i in range(users)]
+    collection_docs = [
+        server.Collection(
+            name=f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}",
+            description="Generated for load testing",
+            creator=rng.choice(user_docs)["wallet_address"]
+        ).dict()
+        for i in range(collections)
+    ]
+    await repos.users.insert_many(user_docs)
+    await repos.collections.insert_many(collection_docs)
+
+    block = await server.token_ids.reserve(nfts)
+    now = datetime.utcnow()
+    nft_docs = []
+    for i, token_id in zip(range(nfts), block):
+        nft = server.NFT(
+            name=f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} #{i}",
+            description=f"A {rng.choice(WORDS)} {rng.choice(WORDS)} piece",
+            image="",
+            price=round(rng.uniform(0.01, 20), 3),
+            owner=rng.choice(user_docs)["wallet_address"],
+            creator=rng.choice(user_docs)["wallet_address"],
+            collection=rng.choice(collection_docs)["name"],
+            traits=[server.NFTTrait(trait_type=kind, value=rng.choice(values)) for kind, values in TRAITS.items()],
+            token_id=token_id,
+            created_at=now - timedelta(minutes=i),
+            status=server.NFTStatus.LISTED if rng.random() < 0.7 else server.NFTStatus.UNLISTED,
+            likes=rng.randint(0, 500),
+            views=rng.randint(0, 5000)
+        )
+        nft_docs.append(server.nft_document(nft))
+    for start in range(0, len(nft_docs), 1000):
+        await repos.nfts.insert_many(nft_docs[start:start + 1000])
+
+    transaction_docs = []
+    for i in range(transactions):
+        nft = rng.choice(nft_docs)
+        transaction_docs.append(server.Transaction(
+            nft_id=nft["id"],
+            collection=nft["collection"],
+            buyer=rng.choice(user_docs)["wallet_address"],
+            seller=nft["creator"],
+            price=nft["price"],
+            timestamp=now - timedelta(minutes=rng.randint(0, 60 * 24 * 30)),
+            status=server.TransactionStatus.COMPLETED
+        ).dict())
+    for start in range(0, len(transaction_docs), 1000):
+        await repos.transactions.insert_many(transaction_docs[start:start + 1000])
+
+    await server.recompute_collection_stats(repos)
+    return {
+        "users": users,
+        "collections": collections,
+        "nfts": nfts,
+        "transactions": transactions,
+    }
+
+
+async def load_targets(client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Ids, collection names and listed NFTs the workload picks from"""
+    collections = (await client.get("/api/collections")).json()
+    nfts = []
+    cursor = None
+    while len(nfts) < 5000:
+        params = {"limit": 100, "fields": "id,owner,price,status"}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/api/nfts", params=params)
+        nfts += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    return {
+        "collections": [collection["name"] for collection in collections],
+        "nft_ids": [nft["id"] for nft in nfts],
+        "listed": [nft for nft in nfts if nft["status"] == "listed"],
+    }
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, targets: Dict[str, Any], image_base: str, rng: random.Random):
+        self.client = client
+        self.targets = targets
+        self.image_base = image_base
+        self.rng = rng
+        self.minted = 0
+
+    async def browse(self) -> httpx.Response:
+        params = {
+            "limit": 20,
+            "sort_by": self.rng.choice(["created_at", "price", "likes", "views"]),
+            "order": self.rng.choice(["asc", "desc"]),
+        }
+        if self.targets["collections"] and self.rng.random() < 0.4:
+            params["collection"] = self.rng.choice(self.targets["collections"])
+        response = await self.client.get("/api/nfts", params=params)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor and self.rng.random() < 0.3:
+            response = await self.client.get("/api/nfts", params={**params, "cursor": cursor})
+        return response
+
+    async def search(self) -> httpx.Response:
+        terms = " ".join(self.rng.sample(WORDS, self.rng.choice([1, 1, 2])))
+        return await self.client.get("/api/nfts", params={"search": terms, "limit": 20})
+
+    async def detail(self) -> httpx.Response:
+        return await self.client.get(f"/api/nfts/{self.rng.choice(self.targets['nft_ids'])}")
+
+    async def like(self) -> httpx.Response:
+        return await self.client.post(f"/api/nfts/{self.rng.choice(self.targets['nft_ids'])}/like")
+
+    async def mint(self) -> httpx.Response:
+        self.minted += 1
+        return await self.client.post("/api/nfts", json={
+            "name": f"Load Test {self.rng.choice(WORDS).title()} {self.minted}",
+            "description": "Minted by the load test",
+            "image_url": f"{self.image_base}/{self.rng.getrandbits(64):x}.png",
+            "price": round(self.rng.uniform(0.01, 20), 3),
+            "collection": self.rng.choice(self.targets["collections"]),
+        })
+
+    async def buy(self) -> Optional[httpx.Response]:
+        listed = self.targets["listed"]
+        if not listed:
+            return None
+        # Each listing is bought at most once so purchases do not conflict
+        nft = listed.pop(self.rng.randrange(len(listed)))
+        return await self.client.post("/api/transactions", json={
+            "nft_id": nft["id"],
+            "buyer": f"0x{self.rng.getrandbits(160):040x}",
+            "seller": nft["owner"],
+            "price": nft["price"],
+        })
+
+
+async def drive(workload: Workload, weights: Dict[str, float], concurrency: int, requests: int, duration: Optional[float]) -> Dict[str, Any]:
+    names = list(weights)
+    shares = [weights[name] for name in names]
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    statuses: Dict[str, Dict[str, int]] = {name: {} for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    budget = {"left": requests}
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            else:
+                if budget["left"] <= 0:
+                    return
+                budget["left"] -= 1
+            name = workload.rng.choices(names, weights=shares)[0]
+            started = time.perf_counter()
+            try:
+                response = await getattr(workload, name)()
+            except Exception:
+                errors[name] += 1
+                continue
+            if response is None:
+                continue
+            samples[name].append((time.perf_counter() - started) * 1000)
+            code = str(response.status_code)
+            statuses[name][code] = statuses[name].get(code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    operations = {}
+    for name in names:
+        latencies = sorted(samples[name])
+        operations[name] = {
+            "count": len(latencies),
+            "errors": errors[name],
+            "status": statuses[name],
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        }
+    total = sum(op["count"] for op in operations.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "operations": operations,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Operations that got slower or lost throughput by more than ``tolerance``"""
+    regressions = []
+    for name, current in report["operations"].items():
+        before = baseline.get("operations", {}).get(name)
+        if not before or not before["count"] or not current["count"]:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if before[metric] and current[metric] > before[metric] * (1 + tolerance):
+                regressions.append({"operation": name, "metric": metric, "baseline": before[metric], "current": current[metric]})
+        if current["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append({
+                "operation": name, "metric": "throughput_rps",
+                "baseline": before["throughput_rps"], "current": current["throughput_rps"]
+            })
+    return regressions
+
+
+async def run(options: Dict[str, Any]) -> Dict[str, Any]:
+    # Configure the app before it is imported so its singletons use the test database
+    os.environ["DB_NAME"] = options["db_name"]
+    os.environ.setdefault("BLOB_DIR", tempfile.mkdtemp(prefix="loadtest-blobs-"))
+    os.environ["STORAGE_ENGINE"] = options["engine"]
+    # Mint images come from the local image server
+    os.environ.setdefault("IMAGE_FETCH_ALLOW_PRIVATE", "1")
+    if options["engine"] == "memory":
+        # Never contacted, but the app expects a connection string
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    import server
+
+    rng = random.Random(options["seed"])
+    seeded = None
+    if options["seed_data"]:
+        seeded = await seed(
+            server, rng, options["users"], options["collections"], options["nfts"], options["transactions"]
+        )
+
+    if options["base_url"]:
+        client = httpx.AsyncClient(base_url=options["base_url"], timeout=30)
+    else:
+        await server.app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://loadtest", timeout=30)
+
+    try:
+        targets = await load_targets(client)
+        if not targets["nft_ids"] or not targets["collections"]:
+            raise typer.BadParameter("The database has no NFTs or collections; run with seeding enabled")
+        workload = Workload(client, targets, start_image_server(), rng)
+        results = await drive(workload, options["weights"], options["concurrency"], options["requests"], options["duration"])
+    finally:
+        await client.aclose()
+        if not options["base_url"]:
+            await server.app.router.shutdown()
+
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "engine": options["engine"],
+        "target": options["base_url"] or "in-process",
+        "seeded": seeded,
+        "concurrency": options["concurrency"],
+        "mix": options["weights"],
+        **results,
+    }
+
+
+@cli.command()
+def main(
+    base_url: Optional[str] = typer.Option(None, help="Run against a live server instead of in process"),
+    engine: str = typer.Option("mongo", help="mongo (MONGO_URL) or memory (in process)"),
+    db_name: str = typer.Option("nft_loadtest", help="Database to seed and test; its contents are replaced"),
+    seed_data: bool = typer.Option(True, "--seed/--no-seed", help="Replace the database with generated data first"),
+    users: int = typer.Option(200, help="Users to seed"),
+    collections: int = typer.Option(20, help="Collections to seed"),
+    nfts: int = typer.Option(2000, help="NFTs to seed"),
+    transactions: int = typer.Option(2000, help="Historical transactions to seed"),
+    concurrency: int = typer.Option(16, help="Concurrent virtual users"),
+    requests: int = typer.Option(2000, help="Total requests (ignored with --duration)"),
+    duration: Optional[float] = typer.Option(None, help="Run for this many seconds instead of a request count"),
+    mix: str = typer.Option(DEFAULT_MIX, help="Operation weights, e.g. browse=40,detail=25,buy=5"),
+    seed: int = typer.Option(42, help="Random seed for data and workload"),
+    output: Optional[Path] = typer.Option(None, help="Write the report here as well as to stdout"),
+    baseline: Optional[Path] = typer.Option(None, exists=True, dir_okay=False, help="Report to compare against"),
+    save_baseline: Optional[Path] = typer.Option(None, help="Store this report as the new baseline"),
+    tolerance: float = typer.Option(0.2, help="Allowed relative regression against the baseline"),
+):
+    if engine not in ("mongo", "memory"):
+        raise typer.BadParameter("--engine must be mongo or memory")
+    if base_url and engine == "memory":
+        raise typer.BadParameter("--engine memory only works in process")
+    report = asyncio.run(run({
+        "base_url": base_url,
+        "engine": engine,
+        "db_name": db_name,
+        "seed_data": seed_data,
+        "users": users,
+        "collections": collections,
+        "nfts": nfts,
+        "transactions": transactions,
+        "concurrency": concurrency,
+        "requests": requests,
+        "duration": duration,
+        "weights": parse_mix(mix),
+        "seed": seed,
+    }))
+
+    regressions = None
+    if baseline:
+        regressions = compare(report, json.loads(baseline.read_text()), tolerance)
+        report["baseline"] = str(baseline)
+        report["regressions"] = regressions
+    text = json.dumps(report, indent=2)
+    typer.echo(text)
+    if output:
+        output.write_text(text)
+    if save_baseline:
+        save_baseline.write_text(text)
+    if regressions:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,42 @@
+"""Materialized marketplace-wide statistics.
+
+``GET /api/stats`` reads a single snapshot document (key "marketplace"),
+kept fresh by a ``SnapshotRefresher``: never older than ``max_staleness``.
+
+A refresh never scans history:
+
+* totals use estimated counts (``estimated_document_count`` on Mongo,
+  collection metadata);
+* active listings are counted on the ``status`` index;
+* total volume sums the per-collection ``volume`` fields that
+  collection_stats keeps current, one row per collection.
+"""
+import asyncio
+from typing import Any, Dict
+
+from repositories import NFTFilter, Repositories
+from snapshots import SnapshotRefresher
+
+
+STATS_ID = "marketplace"
+
+
+class MarketplaceStats(SnapshotRefresher):
+    def __init__(self, repos: Repositories, max_staleness: float = 30.0):
+        super().__init__(repos, STATS_ID, self.compute_stats, max_staleness)
+
+    async def compute_stats(self) -> Dict[str, Any]:
+        total_nfts, total_users, total_collections, active_listings, total_volume = await asyncio.gather(
+            self.repos.nfts.estimated_count(),
+            self.repos.users.estimated_count(),
+            self.repos.collections.estimated_count(),
+            self.repos.nfts.count(NFTFilter(status="listed")),
+            self.repos.collections.total_volume(),
+        )
+        return {
+            "total_nfts": total_nfts,
+            "total_users": total_users,
+            "total_collections": total_collections,
+            "total_volume": total_volume,
+            "active_listings": active_listings,
+        }
@@ -0,0 +1,807 @@
+"""In-process implementation of the repositories.
+
+Documents live in dictionaries keyed by id. Secondary indexes mirror the
+Mongo ones the queries rely on:
+
+* hash indexes on NFT collection, status, owner and (trait_type, value);
+* sorted ``(value, id)`` indexes for every NFT sort field, so keyset pages
+  are a bisect plus a short walk;
+* a sorted term list for prefix search.
+
+Each operation runs without yielding to the event loop, which makes every
+single-document update (and every batch) atomic, as it is in Mongo.
+Results are copies, so callers can never mutate stored documents.
+"""
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from dataclasses import replace
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from repositories import (
+    ACTIVITY_COUNTERS, NFT_INTERNAL_FIELDS, ActivityRepository, CollectionRepository, Document, DocumentCursor, NFTFilter, NFTRepository,
+    PriceHistoryRepository, Repositories, SequenceRepository, SettlementJobRepository, SnapshotRepository,
+    TraitCountRepository, TransactionFilter, TransactionRepository, UserRepository
+)
+
+
+# Finished settlement jobs are dropped after this long, like the Mongo TTL index
+FINISHED_JOB_RETENTION = timedelta(days=1)
+
+
+def _stored(doc: Document) -> Document:
+    """Copy of ``doc`` as the database would hold it: enums as their values, no _id"""
+    return {key: value.value if isinstance(value, Enum) else value for key, value in doc.items() if key != "_id"}
+
+
+def _project(doc: Document, fields: Optional[List[str]], hidden: Iterable[str] = ()) -> Document:
+    if fields is None:
+        return {key: value for key, value in doc.items() if key not in hidden}
+    return {name: doc[name] for name in fields if name in doc}
+
+
+def _trait_keys(doc: Document) -> Set[Tuple[Any, Any]]:
+    return {(trait.get("trait_type"), trait.get("value")) for trait in doc.get("traits") or ()}
+
+
+def _sort_key(value: Any) -> Tuple:
+    # Missing values sort first, as null does in Mongo
+    return (0, 0) if value is None else (1, value)
+
+
+class SortedIndex:
+    """``(value, id)`` pairs kept in ascending order"""
+
+    def __init__(self):
+        self._keys: List[Tuple[Tuple, str]] = []
+
+    def add(self, value: Any, doc_id: str):
+        insort(self._keys, (_sort_key(value), doc_id))
+
+    def remove(self, value: Any, doc_id: str):
+        key = (_sort_key(value), doc_id)
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def scan(self, direction: int, after: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Ids in (value, id) order, starting strictly after ``after``"""
+        keys = self._keys
+        if direction > 0:
+            start = bisect_right(keys, (_sort_key(after["value"]), after["id"])) if after else 0
+            for i in range(start, len(keys)):
+                yield keys[i][1]
+        else:
+            end = bisect_left(keys, (_sort_key(after["value"]), after["id"])) if after else len(keys)
+            for i in range(end - 1, -1, -1):
+                yield keys[i][1]
+
+    def last_value(self) -> Any:
+        return self._keys[-1][0][1] if self._keys and self._keys[-1][0][0] else None
+
+
+class MemoryCursor(DocumentCursor):
+    """Iterates a snapshot of matching ids, projecting documents lazily"""
+
+    def __init__(self, docs: Dict[str, Document], ids: List[str], fields: Optional[List[str]], hidden: Iterable[str] = ()):
+        self._docs = docs
+        self._ids = iter(ids)
+        self._fields = fields
+        self._hidden = tuple(hidden)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Document:
+        for doc_id in self._ids:
+            doc = self._docs.get(doc_id)
+            if doc is not None:
+                return _project(doc, self._fields, self._hidden)
+        raise StopAsyncIteration
+
+    async def close(self):
+        self._ids = iter(())
+
+
+class MemoryNFTRepository(NFTRepository):
+    SORTED_FIELDS = ("created_at", "price", "likes", "views", "token_id", "rarity_score")
+    HASHED_FIELDS = ("collection", "status", "owner")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._docs: Dict[str, Document] = {}
+        self._hashed: Dict[str, Dict[Any, Set[str]]] = {field: defaultdict(set) for field in self.HASHED_FIELDS}
+        self._sorted: Dict[str, SortedIndex] = {field: SortedIndex() for field in self.SORTED_FIELDS}
+        self._token_ids: Dict[Any, str] = {}
+        self._trait_ids: Dict[Tuple[Any, Any], Set[str]] = defaultdict(set)
+        self._term_ids: Dict[str, Set[str]] = defaultdict(set)
+        self._terms: List[str] = []
+
+    # Indexing
+
+    def _index_field(self, doc: Document, field: str):
+        if field == "traits":
+            for pair in _trait_keys(doc):
+                self._trait_ids[pair].add(doc["id"])
+        if field in self._hashed:
+            self._hashed[field][doc.get(field)].add(doc["id"])
+        if field in self._sorted:
+            self._sorted[field].add(doc.get(field), doc["id"])
+
+    def _unindex_field(self, doc: Document, field: str):
+        if field == "traits":
+            for pair in _trait_keys(doc):
+                ids = self._trait_ids.get(pair)
+                if ids is not None:
+                    ids.discard(doc["id"])
+                    if not ids:
+                        del self._trait_ids[pair]
+        if field in self._hashed:
+            ids = self._hashed[field].get(doc.get(field))
+            if ids is not None:
+                ids.discard(doc["id"])
+                if not ids:
+                    del self._hashed[field][doc.get(field)]
+        if field in self._sorted:
+            self._sorted[field].remove(doc.get(field), doc["id"])
+
+    def _index_terms(self, doc: Document):
+        for term in doc.get("search_terms") or []:
+            if term not in self._term_ids:
+                insort(self._terms, term)
+            self._term_ids[term].add(doc["id"])
+
+    def _update(self, doc: Document, changes: Document):
+        for field in changes:
+            self._unindex_field(doc, field)
+        doc.update(changes)
+        for field in changes:
+            self._index_field(doc, field)
+
+    # Matching
+
+    def _prefix_ids(self, token: str) -> Set[str]:
+        ids: Set[str] = set()
+        i = bisect_left(self._terms, token)
+        while i < len(self._terms) and self._terms[i].startswith(token):
+            ids |= self._term_ids[self._terms[i]]
+            i += 1
+        return ids
+
+    def _candidates(self, query: NFTFilter) -> Optional[Set[str]]:
+        """Ids that may match according to the indexes; None when unrestricted"""
+        sets = [
+            self._hashed[field].get(getattr(query, field), set())
+            for field in self.HASHED_FIELDS if getattr(query, field)
+        ]
+        if query.search is not None:
+            sets += [self._prefix_ids(token) for token in query.search] or [set()]
+        for trait_type, values in (query.traits or {}).items():
+            sets.append(set().union(*(self._trait_ids.get((trait_type, value), set()) for value in values)))
+        if not sets:
+            return None
+        smallest = min(sets, key=len)
+        return smallest.intersection(*sets) if len(sets) > 1 else set(smallest)
+
+    @staticmethod
+    def _matches(doc: Document, query: NFTFilter) -> bool:
+        for field in ("collection", "status", "owner", "creator"):
+            value = getattr(query, field)
+            if value and doc.get(field) != value:
+                return False
+        price = doc.get("price")
+        if query.min_price is not None and (price is None or price < query.min_price):
+            return False
+        if query.max_price is not None and (price is None or price > query.max_price):
+            return False
+        if query.search is not None:
+            terms = doc.get("search_terms") or []
+            if not query.search or not all(any(term.startswith(token) for term in terms) for token in query.search):
+                return False
+        if query.traits:
+            pairs = _trait_keys(doc)
+            if not all(any((trait_type, value) in pairs for value in values) for trait_type, values in query.traits.items()):
+                return False
+        return True
+
+    def _ordered(
+        self, candidates: Optional[Set[str]], sort_by: str, direction: int, after: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Document]:
+        """Candidate documents in (sort_by, id) order, starting strictly after ``after``"""
+        if candidates is not None and len(candidates) * 8 < len(self._docs):
+            # Few candidates: sorting them beats walking the whole sort index
+            rows = sorted(
+                (self._docs[doc_id] for doc_id in candidates),
+                key=lambda doc: (_sort_key(doc.get(sort_by)), doc["id"]),
+                reverse=direction < 0
+            )
+            if after:
+                position = (_sort_key(after["value"]), after["id"])
+                rows = [
+                    doc for doc in rows
+                    if ((_sort_key(doc.get(sort_by)), doc["id"]) > position) == (direction > 0)
+                    and (_sort_key(doc.get(sort_by)), doc["id"]) != position
+                ]
+            return iter(rows)
+        return (
+            self._docs[doc_id] for doc_id in self._sorted[sort_by].scan(direction, after)
+            if candidates is None or doc_id in candidates
+        )
+
+    def _matching(self, query: NFTFilter) -> Iterator[Document]:
+        candidates = self._candidates(query)
+        # Unfiltered reads keep insertion order; indexed ones only visit their candidates, in token order
+        docs = self._docs.values() if candidates is None else self._ordered(candidates, "token_id", 1)
+        for doc in docs:
+            if self._matches(doc, query):
+                yield doc
+
+    # Reads
+
+    async def get(self, nft_id: str) -> Optional[Document]:
+        doc = self._docs.get(nft_id)
+        return _project(doc, None, NFT_INTERNAL_FIELDS) if doc else None
+
+    async def get_many(self, nft_ids: List[str], fields: Optional[List[str]] = None) -> List[Document]:
+        return [
+            _project(self._docs[nft_id], fields, NFT_INTERNAL_FIELDS)
+            for nft_id in dict.fromkeys(nft_ids) if nft_id in self._docs
+        ]
+
+    async def exists(self, nft_id: str) -> bool:
+        return nft_id in self._docs
+
+    async def find(self, query, sort_by, direction, after=None, skip=0, limit=20, fields=None) -> List[Document]:
+        page = []
+        for doc in self._ordered(self._candidates(query), sort_by, direction, after):
+            if not self._matches(doc, query):
+                continue
+            if skip:
+                skip -= 1
+                continue
+            page.append(_project(doc, fields, NFT_INTERNAL_FIELDS))
+            if len(page) >= limit:
+                break
+        return page
+
+    async def list(self, query: NFTFilter, fields=None, limit: int = 1000) -> List[Document]:
+        rows = []
+        for doc in self._matching(query):
+            if len(rows) >= limit:
+                break
+            rows.append(_project(doc, fields, NFT_INTERNAL_FIELDS))
+        return rows
+
+    def search_candidates(self, query: NFTFilter, batch_size: int = 500) -> MemoryCursor:
+        return MemoryCursor(self._docs, [doc["id"] for doc in self._matching(query)], ["id", "name_terms", "search_terms"])
+
+    def iterate(self, query: NFTFilter, fields=None, batch_size: int = 500) -> MemoryCursor:
+        return MemoryCursor(self._docs, [doc["id"] for doc in self._matching(query)], fields, NFT_INTERNAL_FIELDS)
+
+    async def count(self, query: NFTFilter) -> int:
+        return sum(1 for _ in self._matching(query))
+
+    async def estimated_count(self) -> int:
+        return len(self._docs)
+
+    async def trait_facets(self, query: NFTFilter) -> Document:
+        selected = query.traits or {}
+        total = 0
+        counts: Dict[Any, Dict[Any, int]] = {}
+        for doc in self._matching(replace(query, traits=None)):
+            pairs = _trait_keys(doc)
+            missed = [
+                trait_type for trait_type, values in selected.items()
+                if not any((trait_type, value) in pairs for value in values)
+            ]
+            if not missed:
+                total += 1
+            for trait_type, value in pairs:
+                # A pair counts when the NFT matches every selected type except its own
+                if all(name == trait_type for name in missed):
+                    values = counts.setdefault(trait_type, {})
+                    values[value] = values.get(value, 0) + 1
+        return {"total": total, "traits": counts}
+
+    async def cheapest_listed_price(self, collection: str) -> Optional[float]:
+        ids = self._hashed["collection"].get(collection, set()) & self._hashed["status"].get("listed", set())
+        return min((self._docs[doc_id]["price"] for doc_id in ids), default=None)
+
+    async def stats_by_collection(self, collections: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        by_collection = self._hashed["collection"]
+        names = by_collection.keys() if collections is None else [name for name in collections if name in by_collection]
+        stats = {}
+        for name in names:
+            ids = by_collection[name]
+            listed = [self._docs[doc_id]["price"] for doc_id in ids if self._docs[doc_id].get("status") == "listed"]
+            stats[name] = {"items_count": len(ids), "floor_price": min(listed, default=0.0)}
+        return stats
+
+    async def max_token_id(self) -> int:
+        return self._sorted["token_id"].last_value() or 0
+
+    # Writes
+
+    async def insert(self, doc: Document):
+        doc = _stored(doc)
+        if doc["id"] in self._docs:
+            raise DuplicateKeyError(f"Duplicate NFT id {doc['id']}")
+        if doc.get("token_id") in self._token_ids:
+            raise DuplicateKeyError(f"Duplicate token id {doc['token_id']}")
+        self._docs[doc["id"]] = doc
+        self._token_ids[doc.get("token_id")] = doc["id"]
+        for field in (*self.HASHED_FIELDS, *self.SORTED_FIELDS, "traits"):
+            self._index_field(doc, field)
+        self._index_terms(doc)
+
+    async def insert_many(self, docs: List[Document]):
+        # Ordered, like insert_many: stops at the first failure
+        for doc in docs:
+            await self.insert(doc)
+
+    async def list_for_sale(self, nft_id: str, price: float) -> Optional[Document]:
+        doc = self._docs.get(nft_id)
+        if doc is None:
+            return None
+        previous = _project(doc, None, NFT_INTERNAL_FIELDS)
+        self._update(doc, {"status": "listed", "price": price})
+        return previous
+
+    async def unlist(self, nft_id: str) -> Optional[Document]:
+        doc = self._docs.get(nft_id)
+        if doc is None or doc.get("status") != "listed":
+            return None
+        previous = _project(doc, None, NFT_INTERNAL_FIELDS)
+        self._update(doc, {"status": "unlisted"})
+        return previous
+
+    async def update_many(self, changes: Dict[str, Document]):
+        for nft_id, fields in changes.items():
+            doc = self._docs.get(nft_id)
+            if doc is not None:
+                self._update(doc, _stored(fields))
+
+    async def increment_many(self, deltas: Dict[str, Dict[str, int]]):
+        for nft_id, fields in deltas.items():
+            doc = self._docs.get(nft_id)
+            if doc is not None:
+                self._update(doc, {field: doc.get(field, 0) + amount for field, amount in fields.items()})
+
+    async def transfer(
+        self, nft_id: str, seller: str, buyer: str, transaction_id: str, price: Optional[float] = None
+    ) -> bool:
+        doc = self._docs.get(nft_id)
+        if doc is None:
+            return False
+        listed_by_seller = (
+            doc.get("owner") == seller and doc.get("status") == "listed"
+            and (price is None or doc.get("price") == price)
+        )
+        if not listed_by_seller and doc.get("last_transaction_id") != transaction_id:
+            return False
+        self._update(doc, {"owner": buyer, "status": "sold", "last_transaction_id": transaction_id})
+        return True
+
+    async def revert_transfer(self, nft_id: str, seller: str, transaction_id: str):
+        doc = self._docs.get(nft_id)
+        if doc is not None and doc.get("last_transaction_id") == transaction_id:
+            self._update(doc, {"owner": seller, "status": "listed"})
+            del doc["last_transaction_id"]
+
+
+class MemoryCollectionRepository(CollectionRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._docs: Dict[str, Document] = {}
+        self._by_name: Dict[str, str] = {}
+
+    def _named(self, name: str) -> Optional[Document]:
+        doc_id = self._by_name.get(name)
+        return self._docs[doc_id] if doc_id else None
+
+    async def list(self, fields=None, limit: int = 1000) -> List[Document]:
+        return [_project(doc, fields) for doc in list(self._docs.values())[:limit]]
+
+    async def get(self, collection_id: str) -> Optional[Document]:
+        doc = self._docs.get(collection_id)
+        return dict(doc) if doc else None
+
+    async def get_many(self, collection_ids: List[str]) -> List[Document]:
+        return [dict(self._docs[i]) for i in dict.fromkeys(collection_ids) if i in self._docs]
+
+    async def get_many_by_name(self, names: List[str]) -> List[Document]:
+        return [dict(doc) for doc in self._docs.values() if doc.get("name") in set(names)]
+
+    def iterate(self, fields=None, batch_size: int = 500) -> MemoryCursor:
+        return MemoryCursor(self._docs, list(self._docs), fields)
+
+    async def estimated_count(self) -> int:
+        return len(self._docs)
+
+    async def insert(self, doc: Document):
+        doc = _stored(doc)
+        if doc["id"] in self._docs:
+            raise DuplicateKeyError(f"Duplicate collection id {doc['id']}")
+        self._docs[doc["id"]] = doc
+        # Like update_one({"name": ...}), stats updates go to the first collection with a name
+        self._by_name.setdefault(doc["name"], doc["id"])
+
+    async def insert_many(self, docs: List[Document]):
+        for doc in docs:
+            await self.insert(doc)
+
+    async def add_items(self, name: str, count: int, floor_candidate: Optional[float] = None):
+        doc = self._named(name)
+        if doc is None:
+            return
+        doc["items_count"] = doc.get("items_count", 0) + count
+        if floor_candidate is not None:
+            self._lower(doc, floor_candidate)
+
+    @staticmethod
+    def _lower(doc: Document, price: float):
+        floor = doc.get("floor_price") or 0
+        if floor <= 0 or floor > price:
+            doc["floor_price"] = price
+
+    async def lower_floor(self, name: str, price: float):
+        doc = self._named(name)
+        if doc is not None:
+            self._lower(doc, price)
+
+    async def get_floor(self, name: str) -> Optional[float]:
+        doc = self._named(name)
+        return doc.get("floor_price", 0.0) if doc else None
+
+    async def replace_floor(self, name: str, expected: float, price: float) -> bool:
+        doc = self._named(name)
+        if doc is None or (doc.get("floor_price") or 0.0) != expected:
+            return False
+        doc["floor_price"] = price
+        return True
+
+    async def add_volume(self, name: str, amount: float):
+        doc = self._named(name)
+        if doc is not None:
+            doc["volume"] = doc.get("volume", 0.0) + amount
+
+    async def set_stats(self, stats: Dict[str, Dict[str, Any]]) -> int:
+        matched = 0
+        for name, values in stats.items():
+            doc = self._named(name)
+            if doc is not None:
+                doc.update(values)
+                matched += 1
+        return matched
+
+    async def total_volume(self) -> float:
+        return sum(doc.get("volume", 0.0) for doc in self._docs.values())
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._docs: Dict[str, Document] = {}
+
+    async def list(self, limit: int = 1000) -> List[Document]:
+        return [dict(doc) for doc in list(self._docs.values())[:limit]]
+
+    async def get(self, user_id: str) -> Optional[Document]:
+        doc = self._docs.get(user_id)
+        return dict(doc) if doc else None
+
+    async def get_many(self, user_ids: List[str]) -> List[Document]:
+        return [dict(self._docs[i]) for i in dict.fromkeys(user_ids) if i in self._docs]
+
+    def iterate(self, verified=None, fields=None, batch_size: int = 500) -> MemoryCursor:
+        ids = [doc["id"] for doc in self._docs.values() if verified is None or doc.get("verified") == verified]
+        return MemoryCursor(self._docs, ids, fields)
+
+    async def estimated_count(self) -> int:
+        return len(self._docs)
+
+    async def insert(self, doc: Document):
+        doc = _stored(doc)
+        if doc["id"] in self._docs:
+            raise DuplicateKeyError(f"Duplicate user id {doc['id']}")
+        self._docs[doc["id"]] = doc
+
+    async def insert_many(self, docs: List[Document]):
+        for doc in docs:
+            await self.insert(doc)
+
+
+class MemoryTransactionRepository(TransactionRepository):
+    def __init__(self, nfts: MemoryNFTRepository):
+        self.nfts = nfts
+        self.reset()
+
+    def reset(self):
+        self._docs: Dict[str, Document] = {}
+        self._by_timestamp = SortedIndex()
+
+    @staticmethod
+    def _matches(doc: Document, query: TransactionFilter) -> bool:
+        for field in ("status", "nft_id", "collection", "buyer", "seller"):
+            value = getattr(query, field)
+            if value and doc.get(field) != value:
+                return False
+        if query.since and not (doc.get("timestamp") and doc["timestamp"] >= query.since):
+            return False
+        if query.until and not (doc.get("timestamp") and doc["timestamp"] < query.until):
+            return False
+        return True
+
+    async def list(self, limit: int = 1000) -> List[Document]:
+        rows = []
+        for doc_id in self._by_timestamp.scan(-1):
+            rows.append(dict(self._docs[doc_id]))
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def iterate(self, query: TransactionFilter, fields=None, batch_size: int = 500) -> MemoryCursor:
+        ids = [doc_id for doc_id, doc in self._docs.items() if self._matches(doc, query)]
+        return MemoryCursor(self._docs, ids, fields)
+
+    async def insert(self, doc: Document):
+        doc = _stored(doc)
+        if doc["id"] in self._docs:
+            raise DuplicateKeyError(f"Duplicate transaction id {doc['id']}")
+        self._docs[doc["id"]] = doc
+        self._by_timestamp.add(doc.get("timestamp"), doc["id"])
+
+    async def insert_many(self, docs: List[Document]):
+        for doc in docs:
+            await self.insert(doc)
+
+    def _set_pending(self, transaction_ids: List[str], changes: Document) -> List[str]:
+        moved = []
+        for transaction_id in transaction_ids:
+            doc = self._docs.get(transaction_id)
+            if doc is not None and doc.get("status") == "pending":
+                doc.update(changes)
+                moved.append(transaction_id)
+        return moved
+
+    async def complete_many(self, transaction_ids: List[str], settled_at: datetime) -> List[str]:
+        return self._set_pending(transaction_ids, {"status": "completed", "settled_at": settled_at})
+
+    async def fail_many(self, transaction_ids: List[str], settled_at: Optional[datetime] = None) -> List[str]:
+        changes = {"status": "failed"}
+        if settled_at is not None:
+            changes["settled_at"] = settled_at
+        return self._set_pending(transaction_ids, changes)
+
+    async def volume_by_collection(self, collections: Optional[List[str]] = None) -> Dict[str, float]:
+        completed = [doc for doc in self._docs.values() if doc.get("status") == "completed"]
+        # Older transactions have no collection field; resolve it through the NFT
+        legacy = [doc.get("nft_id") for doc in completed if doc.get("collection") is None]
+        nft_collections = {
+            nft["id"]: nft.get("collection")
+            for nft in (await self.nfts.get_many(legacy, fields=["id", "collection"]) if legacy else [])
+        }
+        volumes: Dict[str, float] = {}
+        for doc in completed:
+            collection = doc.get("collection")
+            if collection is None:
+                collection = nft_collections.get(doc.get("nft_id"))
+            if collection is None or (collections is not None and collection not in collections):
+                continue
+            volumes[collection] = volumes.get(collection, 0.0) + doc["price"]
+        return volumes
+
+
+class MemorySettlementJobRepository(SettlementJobRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._jobs: Dict[str, Document] = {}
+
+    async def enqueue(self, job: Document):
+        now = datetime.utcnow()
+        for job_id, existing in list(self._jobs.items()):
+            if existing.get("finished_at") and now - existing["finished_at"] > FINISHED_JOB_RETENTION:
+                del self._jobs[job_id]
+        if job["_id"] in self._jobs:
+            raise DuplicateKeyError(f"Duplicate settlement job {job['_id']}")
+        self._jobs[job["_id"]] = dict(job)
+
+    async def claim_many(self, now: datetime, lease_until: datetime, limit: int) -> List[Document]:
+        due = [
+            job for job in self._jobs.values()
+            if job["state"] in ("queued", "processing") and job["run_at"] <= now
+        ]
+        claimed = []
+        for job in heapq.nsmallest(limit, due, key=lambda job: job["run_at"]):
+            job.update({"state": "processing", "run_at": lease_until, "attempts": job.get("attempts", 0) + 1})
+            claimed.append(dict(job))
+        return claimed
+
+    def _set(self, job_id: str, changes: Document):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.update(changes)
+
+    async def finish_many(self, job_ids: List[str], finished_at: datetime):
+        for job_id in job_ids:
+            self._set(job_id, {"state": "done", "finished_at": finished_at})
+
+    async def requeue(self, job_id: str, run_at: datetime, error: str):
+        self._set(job_id, {"state": "queued", "error": error, "run_at": run_at})
+
+    async def fail(self, job_id: str, error: str, finished_at: datetime):
+        self._set(job_id, {"state": "failed", "error": error, "finished_at": finished_at})
+
+    async def count_by_state(self) -> Dict[str, int]:
+        counts = {"queued": 0, "processing": 0, "failed": 0}
+        for job in self._jobs.values():
+            if job["state"] in counts:
+                counts[job["state"]] += 1
+        return counts
+
+    async def oldest_pending(self) -> Optional[datetime]:
+        return min(
+            (job["created_at"] for job in self._jobs.values() if job["state"] in ("queued", "processing")),
+            default=None
+        )
+
+
+class MemorySequenceRepository(SequenceRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._values: Dict[str, int] = {}
+
+    async def advance(self, name: str, count: int) -> int:
+        self._values[name] = self._values.get(name, 0) + count
+        return self._values[name]
+
+    async def raise_to(self, name: str, value: int):
+        self._values[name] = max(self._values.get(name, 0), value)
+
+
+class MemorySnapshotRepository(SnapshotRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._docs: Dict[str, Document] = {}
+
+    async def get(self, key: str) -> Optional[Document]:
+        doc = self._docs.get(key)
+        return dict(doc) if doc else None
+
+    async def put(self, key: str, doc: Document):
+        self._docs[key] = dict(doc)
+
+
+class MemoryTraitCountRepository(TraitCountRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._totals: Dict[str, int] = {}
+        self._counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+    async def add_items(self, collection: str, items: List[List[Tuple[str, str]]]):
+        self._totals[collection] = self._totals.get(collection, 0) + len(items)
+        counts = self._counts.setdefault(collection, {})
+        for pairs in items:
+            for trait_type, value in pairs:
+                values = counts.setdefault(trait_type, {})
+                values[value] = values.get(value, 0) + 1
+
+    async def get(self, collection: str) -> Document:
+        counts = self._counts.get(collection, {})
+        return {
+            "total": self._totals.get(collection, 0),
+            "counts": {trait_type: dict(values) for trait_type, values in counts.items()},
+        }
+
+    async def replace(self, collection: str, total: int, counts: Dict[str, Dict[str, int]]):
+        self._totals[collection] = total
+        self._counts[collection] = {trait_type: dict(values) for trait_type, values in counts.items()}
+
+
+class MemoryPriceHistoryRepository(PriceHistoryRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # {(collection, interval): {start: bucket}}
+        self._series: Dict[Tuple[str, str], Dict[datetime, Document]] = defaultdict(dict)
+
+    async def merge(self, buckets: List[Document]):
+        for delta in buckets:
+            series = self._series[(delta["collection"], delta["interval"])]
+            bucket = series.get(delta["start"])
+            if bucket is None:
+                series[delta["start"]] = dict(delta)
+                continue
+            bucket["open"] = min(bucket["open"], delta["open"], key=lambda point: (point["at"], point["price"]))
+            bucket["close"] = max(bucket["close"], delta["close"], key=lambda point: (point["at"], point["price"]))
+            bucket["low"] = min(bucket["low"], delta["low"])
+            bucket["high"] = max(bucket["high"], delta["high"])
+            bucket["volume"] += delta["volume"]
+            bucket["count"] += delta["count"]
+
+    async def replace(self, collection: str, buckets: List[Document]):
+        for key in [key for key in self._series if key[0] == collection]:
+            del self._series[key]
+        for bucket in buckets:
+            self._series[(collection, bucket["interval"])][bucket["start"]] = dict(bucket)
+
+    async def list(self, collection: str, interval: str, limit: int = 100) -> List[Document]:
+        series = self._series.get((collection, interval), {})
+        return [dict(series[start]) for start in sorted(series)[-limit:]] if limit > 0 else []
+
+    async def collections(self) -> List[str]:
+        return sorted({collection for (collection, _), series in self._series.items() if series})
+
+
+class MemoryActivityRepository(ActivityRepository):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # {(scope, granularity, start, key): bucket}
+        self._buckets: Dict[Tuple[str, str, datetime, str], Document] = {}
+
+    def _expire(self, now: datetime):
+        for key in [key for key, bucket in self._buckets.items() if bucket["expires_at"] <= now]:
+            del self._buckets[key]
+
+    async def add(self, buckets: List[Document]):
+        for delta in buckets:
+            key = (delta["scope"], delta["granularity"], delta["start"], delta["key"])
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = {"expires_at": delta["expires_at"], "counts": {}}
+            for field, amount in delta["counts"].items():
+                bucket["counts"][field] = bucket["counts"].get(field, 0) + amount
+
+    async def totals(self, scope: str, granularity: str, since: datetime) -> Dict[str, Dict[str, float]]:
+        self._expire(datetime.utcnow())
+        totals: Dict[str, Dict[str, float]] = {}
+        for (bucket_scope, bucket_granularity, start, key), bucket in self._buckets.items():
+            if bucket_scope != scope or bucket_granularity != granularity or start < since:
+                continue
+            row = totals.setdefault(key, {field: 0 for field in ACTIVITY_COUNTERS})
+            for field, amount in bucket["counts"].items():
+                row[field] += amount
+        return totals
+
+
+class MemoryRepositories(Repositories):
+    def __init__(self):
+        self.nfts = MemoryNFTRepository()
+        self.collections = MemoryCollectionRepository()
+        self.users = MemoryUserRepository()
+        self.transactions = MemoryTransactionRepository(self.nfts)
+        self.settlement_jobs = MemorySettlementJobRepository()
+        self.sequences = MemorySequenceRepository()
+        self.snapshots = MemorySnapshotRepository()
+        self.price_history = MemoryPriceHistoryRepository()
+        self.trait_counts = MemoryTraitCountRepository()
+        self.activity = MemoryActivityRepository()
+
+    async def clear(self):
+        # Reset in place: workers and allocators hold references to the repositories
+        for repo in (
+            self.nfts, self.collections, self.users, self.transactions, self.settlement_jobs,
+            self.sequences, self.snapshots, self.price_history, self.trait_counts, self.activity
+        ):
+            repo.reset()
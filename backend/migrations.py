@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""One-off data migrations for the NFT marketplace database.
+
+Run from the backend directory, e.g. ``python migrations.py images``.
+Every command is idempotent and safe to re-run after an interruption.
+"""
+import asyncio
+import base64
+import binascii
+import logging
+from typing import List, Optional
+
+import typer
+from pymongo import UpdateOne
+
+from blob_store import image_url
+from collection_stats import recompute_collection_stats
+from price_history import backfill_price_history
+from rarity import rescore_collection
+from search import search_fields
+from server import blob_store, client, db, repositories, token_ids
+
+
+cli = typer.Typer(help="One-off data migrations for the NFT marketplace database")
+logger = logging.getLogger("migrations")
+
+
+async def _move_inline_images(collection, field: str, batch_size: int, dry_run: bool) -> int:
+    """Move base64 values of ``field`` into the blob store, in batches"""
+    query = {field: {"$nin": [None, ""], "$not": {"$regex": "^/api/images/"}}}
+    moved = 0
+    batch = []
+    async for doc in collection.find(query, {"id": 1, field: 1}):
+        try:
+            data = base64.b64decode(doc[field], validate=True)
+        except (binascii.Error, ValueError):
+            logger.warning(f"Skipping {collection.name} {doc.get('id')}: {field} is not base64")
+            continue
+        moved += 1
+        if dry_run:
+            continue
+        blob_hash = await blob_store.put(data)
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {field: image_url(blob_hash)}}))
+        if len(batch) >= batch_size:
+            await collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.bulk_write(batch, ordered=False)
+    return moved
+
+
+@cli.command()
+def images(
+    batch_size: int = typer.Option(100, help="Documents updated per bulk write"),
+    dry_run: bool = typer.Option(False, help="Count documents without changing anything"),
+):
+    """Move inline base64 images out of NFT and collection documents"""
+    async def run():
+        nfts = await _move_inline_images(db.nfts, "image", batch_size, dry_run)
+        collections = await _move_inline_images(db.collections, "banner_image", batch_size, dry_run)
+        typer.echo(f"NFT images moved: {nfts}")
+        typer.echo(f"Collection banners moved: {collections}")
+
+    asyncio.run(run())
+    client.close()
+
+
+@cli.command("search-terms")
+def search_terms(
+    batch_size: int = typer.Option(500, help="Documents updated per bulk write"),
+):
+    """Backfill the derived search fields on every NFT document"""
+    async def run():
+        updated = 0
+        batch = []
+        projection = {"name": 1, "description": 1, "collection": 1}
+        async for doc in db.nfts.find({}, projection):
+            fields = search_fields(doc.get("name", ""), doc.get("description", ""), doc.get("collection", ""))
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+            if len(batch) >= batch_size:
+                await db.nfts.bulk_write(batch, ordered=False)
+                updated += len(batch)
+                batch = []
+        if batch:
+            await db.nfts.bulk_write(batch, ordered=False)
+            updated += len(batch)
+        typer.echo(f"NFTs indexed for search: {updated}")
+
+    asyncio.run(run())
+    client.close()
+
+
+@cli.command("collection-stats")
+def collection_stats():
+    """Rebuild floor price, volume and item count of every collection"""
+    async def run():
+        updated = await recompute_collection_stats(repositories)
+        typer.echo(f"Collections updated: {updated}")
+
+    asyncio.run(run())
+    client.close()
+
+
+@cli.command("price-history")
+def price_history(
+    collection: Optional[List[str]] = typer.Option(None, help="Collection name; repeat for several (default: all)"),
+):
+    """Rebuild the OHLC price rollups from completed transactions"""
+    async def run():
+        buckets = await backfill_price_history(repositories, collection or None)
+        typer.echo(f"Price buckets written: {buckets}")
+
+    asyncio.run(run())
+    client.close()
+
+
+@cli.command()
+def rarity(
+    collection: Optional[List[str]] = typer.Option(None, help="Collection name; repeat for several (default: all)"),
+):
+    """Recompute trait rarity, rarity scores and ranks"""
+    async def run():
+        names = collection or [doc["name"] for doc in await repositories.collections.list(fields=["name"])]
+        scored = 0
+        for name in names:
+            scored += await rescore_collection(repositories, name)
+        typer.echo(f"NFTs scored: {scored} in {len(names)} collections")
+
+    asyncio.run(run())
+    client.close()
+
+
+@cli.command("dedupe-token-ids")
+def dedupe_token_ids():
+    """Give fresh token ids to NFTs sharing one, so the unique index can be built"""
+    async def run():
+        await token_ids.seed()
+        renumbered = 0
+        duplicates = db.nfts.aggregate([
+            {"$group": {"_id": "$token_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        async for group in duplicates:
+            # Keep the first holder, renumber the rest
+            extra = group["ids"][1:]
+            block = await token_ids.reserve(len(extra))
+            await db.nfts.bulk_write(
+                [UpdateOne({"_id": _id}, {"$set": {"token_id": token_id}}) for _id, token_id in zip(extra, block)],
+                ordered=False
+            )
+            renumbered += len(extra)
+        typer.echo(f"NFTs renumbered: {renumbered}")
+
+    asyncio.run(run())
+    client.close()
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,620 @@
+"""MongoDB implementation of the repositories.
+
+Every query shape here is served by an index declared in indexes.py.
+"""
+import uuid
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from indexes import ensure_indexes, index_usage
+from pagination import keyset_filter, merge_filters
+from repositories import (
+    ACTIVITY_COUNTERS, NFT_INTERNAL_FIELDS, TRANSACTION_INTERNAL_FIELDS, ActivityRepository, CollectionRepository,
+    Document, NFTFilter, NFTRepository, PriceHistoryRepository, Repositories, SequenceRepository,
+    SettlementJobRepository, SnapshotRepository, TraitCountRepository, TransactionFilter, TransactionRepository,
+    UserRepository
+)
+from search import search_filter
+
+
+def projection(fields: Optional[List[str]], hidden=()) -> Dict[str, int]:
+    """Projection returning ``fields``, or everything but ``hidden`` when None"""
+    if fields is None:
+        return {"_id": 0, **{name: 0 for name in hidden}}
+    return {"_id": 0, **{name: 1 for name in fields}}
+
+
+def trait_filter(traits: Dict[str, List[str]]) -> Dict[str, Any]:
+    """Filter requiring one of the values of every trait type in ``traits``"""
+    clauses = [
+        {"traits": {"$elemMatch": {"trait_type": trait_type, "value": {"$in": list(values)}}}}
+        for trait_type, values in traits.items()
+    ]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def trait_facet_branch(selected: Dict[str, List[str]], only_type: Optional[str] = None, skip_types=()) -> List[Dict[str, Any]]:
+    """$facet pipeline counting (trait_type, value) pairs of the NFTs holding ``selected``"""
+    stages: List[Dict[str, Any]] = [{"$match": trait_filter(selected)}] if selected else []
+    stages += [
+        # Each distinct pair once per NFT
+        {"$project": {"_id": 0, "pairs": {"$setUnion": [
+            {"$map": {"input": {"$ifNull": ["$traits", []]}, "in": {"t": "$$this.trait_type", "v": "$$this.value"}}},
+            []
+        ]}}},
+        {"$unwind": "$pairs"},
+    ]
+    if only_type is not None:
+        stages.append({"$match": {"pairs.t": only_type}})
+    elif skip_types:
+        stages.append({"$match": {"pairs.t": {"$nin": list(skip_types)}}})
+    stages.append({"$group": {"_id": "$pairs", "count": {"$sum": 1}}})
+    return stages
+
+
+def nft_query(query: NFTFilter) -> Dict[str, Any]:
+    filters: Dict[str, Any] = {}
+    for name in ("collection", "status", "owner", "creator"):
+        value = getattr(query, name)
+        if value:
+            filters[name] = value
+    if query.min_price is not None or query.max_price is not None:
+        filters["price"] = {}
+        if query.min_price is not None:
+            filters["price"]["$gte"] = query.min_price
+        if query.max_price is not None:
+            filters["price"]["$lte"] = query.max_price
+    if query.search is not None:
+        filters = merge_filters(filters, search_filter(query.search))
+    if query.traits:
+        filters = merge_filters(filters, trait_filter(query.traits))
+    return filters
+
+
+def transaction_query(query: TransactionFilter) -> Dict[str, Any]:
+    filters: Dict[str, Any] = {}
+    for name in ("status", "nft_id", "collection", "buyer", "seller"):
+        value = getattr(query, name)
+        if value:
+            filters[name] = value
+    if query.since or query.until:
+        filters["timestamp"] = {}
+        if query.since:
+            filters["timestamp"]["$gte"] = query.since
+        if query.until:
+            filters["timestamp"]["$lt"] = query.until
+    return filters
+
+
+def _lower_floor(price: float):
+    """Pipeline expression: the smaller of the current floor and ``price``"""
+    return {"$cond": [
+        {"$or": [{"$lte": [{"$ifNull": ["$floor_price", 0]}, 0]}, {"$gt": ["$floor_price", price]}]},
+        price,
+        "$floor_price"
+    ]}
+
+
+class MongoNFTRepository(NFTRepository):
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.nfts
+
+    async def get(self, nft_id: str) -> Optional[Document]:
+        return await self.collection.find_one({"id": nft_id}, projection(None, NFT_INTERNAL_FIELDS))
+
+    async def get_many(self, nft_ids: List[str], fields: Optional[List[str]] = None) -> List[Document]:
+        return await self.collection.find(
+            {"id": {"$in": nft_ids}}, projection(fields, NFT_INTERNAL_FIELDS)
+        ).to_list(len(nft_ids))
+
+    async def exists(self, nft_id: str) -> bool:
+        return await self.collection.find_one({"id": nft_id}, {"_id": 1}) is not None
+
+    async def find(self, query, sort_by, direction, after=None, skip=0, limit=20, fields=None) -> List[Document]:
+        filters = nft_query(query)
+        if after:
+            filters = merge_filters(filters, keyset_filter(sort_by, direction, after))
+        return await self.collection.find(
+            filters, projection(fields, NFT_INTERNAL_FIELDS)
+        ).sort([(sort_by, direction), ("id", direction)]).skip(skip).limit(limit).to_list(length=limit)
+
+    async def list(self, query: NFTFilter, fields=None, limit: int = 1000) -> List[Document]:
+        return await self.collection.find(nft_query(query), projection(fields, NFT_INTERNAL_FIELDS)).to_list(limit)
+
+    def search_candidates(self, query: NFTFilter, batch_size: int = 500):
+        return self.collection.find(
+            nft_query(query), {"_id": 0, "id": 1, "name_terms": 1, "search_terms": 1}, batch_size=batch_size
+        )
+
+    def iterate(self, query: NFTFilter, fields=None, batch_size: int = 500):
+        return self.collection.find(nft_query(query), projection(fields, NFT_INTERNAL_FIELDS), batch_size=batch_size)
+
+    async def count(self, query: NFTFilter) -> int:
+        return await self.collection.count_documents(nft_query(query))
+
+    async def estimated_count(self) -> int:
+        return await self.collection.estimated_document_count()
+
+    async def insert(self, doc: Document):
+        # Copied so the driver's _id does not leak into the caller's dict
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_many(self, docs: List[Document]):
+        await self.collection.insert_many([dict(doc) for doc in docs])
+
+    async def list_for_sale(self, nft_id: str, price: float) -> Optional[Document]:
+        return await self.collection.find_one_and_update(
+            {"id": nft_id},
+            {"$set": {"status": "listed", "price": price}},
+            projection=projection(None, NFT_INTERNAL_FIELDS)
+        )
+
+    async def unlist(self, nft_id: str) -> Optional[Document]:
+        return await self.collection.find_one_and_update(
+            {"id": nft_id, "status": "listed"},
+            {"$set": {"status": "unlisted"}},
+            projection=projection(None, NFT_INTERNAL_FIELDS)
+        )
+
+    async def update_many(self, changes: Dict[str, Document]):
+        await self.collection.bulk_write(
+            [UpdateOne({"id": nft_id}, {"$set": dict(fields)}) for nft_id, fields in changes.items()],
+            ordered=False
+        )
+
+    async def increment_many(self, deltas: Dict[str, Dict[str, int]]):
+        await self.collection.bulk_write(
+            [UpdateOne({"id": nft_id}, {"$inc": dict(fields)}) for nft_id, fields in deltas.items()],
+            ordered=False
+        )
+
+    async def transfer(
+        self, nft_id: str, seller: str, buyer: str, transaction_id: str, price: Optional[float] = None
+    ) -> bool:
+        listed = {"owner": seller, "status": "listed"}
+        if price is not None:
+            # A relisting at another price after the purchase voids it
+            listed["price"] = price
+        result = await self.collection.update_one(
+            {"id": nft_id, "$or": [
+                listed,
+                # Already transferred by an earlier attempt of this transaction
+                {"last_transaction_id": transaction_id},
+            ]},
+            {"$set": {"owner": buyer, "status": "sold", "last_transaction_id": transaction_id}}
+        )
+        return result.matched_count == 1
+
+    async def revert_transfer(self, nft_id: str, seller: str, transaction_id: str):
+        await self.collection.update_one(
+            {"id": nft_id, "last_transaction_id": transaction_id},
+            {"$set": {"owner": seller, "status": "listed"}, "$unset": {"last_transaction_id": ""}}
+        )
+
+    async def trait_facets(self, query: NFTFilter) -> Document:
+        selected = query.traits or {}
+        # One aggregation: the other filters once, then a branch per selected trait type
+        facets = {
+            "total": ([{"$match": trait_filter(selected)}] if selected else []) + [{"$count": "count"}],
+            "traits": trait_facet_branch(selected, skip_types=selected),
+        }
+        for i, trait_type in enumerate(selected):
+            others = {name: values for name, values in selected.items() if name != trait_type}
+            facets[f"selected_{i}"] = trait_facet_branch(others, only_type=trait_type)
+        result = (await self.collection.aggregate([
+            {"$match": nft_query(replace(query, traits=None))},
+            {"$facet": facets},
+        ]).to_list(1))[0]
+
+        counts: Dict[str, Dict[str, int]] = {}
+        for name, groups in result.items():
+            if name == "total":
+                continue
+            for group in groups:
+                counts.setdefault(group["_id"]["t"], {})[group["_id"]["v"]] = group["count"]
+        total = result["total"][0]["count"] if result["total"] else 0
+        return {"total": total, "traits": counts}
+
+    async def cheapest_listed_price(self, collection: str) -> Optional[float]:
+        # One seek on the collection_status_price index
+        cheapest = await self.collection.find_one(
+            {"collection": collection, "status": "listed"},
+            {"_id": 0, "price": 1},
+            sort=[("price", ASCENDING)]
+        )
+        return cheapest["price"] if cheapest else None
+
+    async def stats_by_collection(self, collections: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        stats = {}
+        async for row in self.collection.aggregate([
+            {"$match": {"collection": {"$in": collections}} if collections is not None else {}},
+            {"$group": {
+                "_id": "$collection",
+                "items_count": {"$sum": 1},
+                "floor_price": {"$min": {"$cond": [{"$eq": ["$status", "listed"]}, "$price", None]}}
+            }}
+        ]):
+            stats[row["_id"]] = {"items_count": row["items_count"], "floor_price": row["floor_price"] or 0.0}
+        return stats
+
+    async def max_token_id(self) -> int:
+        highest = await self.collection.find_one(
+            {"token_id": {"$type": "number"}},
+            {"_id": 0, "token_id": 1},
+            sort=[("token_id", DESCENDING)]
+        )
+        return highest["token_id"] if highest else 0
+
+
+class MongoCollectionRepository(CollectionRepository):
+    def __init__(self, db):
+        self.collection = db.collections
+
+    async def list(self, fields=None, limit: int = 1000) -> List[Document]:
+        return await self.collection.find({}, projection(fields)).to_list(limit)
+
+    async def get(self, collection_id: str) -> Optional[Document]:
+        return await self.collection.find_one({"id": collection_id}, {"_id": 0})
+
+    async def get_many(self, collection_ids: List[str]) -> List[Document]:
+        return await self.collection.find({"id": {"$in": collection_ids}}, {"_id": 0}).to_list(len(collection_ids))
+
+    async def get_many_by_name(self, names: List[str]) -> List[Document]:
+        return await self.collection.find({"name": {"$in": names}}, {"_id": 0}).to_list(None)
+
+    def iterate(self, fields=None, batch_size: int = 500):
+        return self.collection.find({}, projection(fields), batch_size=batch_size)
+
+    async def estimated_count(self) -> int:
+        return await self.collection.estimated_document_count()
+
+    async def insert(self, doc: Document):
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_many(self, docs: List[Document]):
+        await self.collection.insert_many([dict(doc) for doc in docs])
+
+    async def add_items(self, name: str, count: int, floor_candidate: Optional[float] = None):
+        update = {"items_count": {"$add": [{"$ifNull": ["$items_count", 0]}, count]}}
+        if floor_candidate is not None:
+            update["floor_price"] = _lower_floor(floor_candidate)
+        await self.collection.update_one({"name": name}, [{"$set": update}])
+
+    async def lower_floor(self, name: str, price: float):
+        await self.collection.update_one({"name": name}, [{"$set": {"floor_price": _lower_floor(price)}}])
+
+    async def get_floor(self, name: str) -> Optional[float]:
+        collection = await self.collection.find_one({"name": name}, {"_id": 0, "floor_price": 1})
+        return collection.get("floor_price", 0.0) if collection else None
+
+    async def replace_floor(self, name: str, expected: float, price: float) -> bool:
+        # A collection that never had a listing has no floor_price field yet
+        current = expected if expected else {"$in": [0, None]}
+        result = await self.collection.update_one(
+            {"name": name, "floor_price": current}, {"$set": {"floor_price": price}}
+        )
+        return result.matched_count == 1
+
+    async def add_volume(self, name: str, amount: float):
+        await self.collection.update_one({"name": name}, {"$inc": {"volume": amount}})
+
+    async def set_stats(self, stats: Dict[str, Dict[str, Any]]) -> int:
+        if not stats:
+            return 0
+        result = await self.collection.bulk_write(
+            [UpdateOne({"name": name}, {"$set": values}) for name, values in stats.items()],
+            ordered=False
+        )
+        return result.matched_count
+
+    async def total_volume(self) -> float:
+        # One row per collection, never a scan of transaction history
+        volume = await self.collection.aggregate([
+            {"$group": {"_id": None, "total": {"$sum": "$volume"}}}
+        ]).to_list(1)
+        return volume[0]["total"] if volume else 0.0
+
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, db):
+        self.collection = db.users
+
+    async def list(self, limit: int = 1000) -> List[Document]:
+        return await self.collection.find({}, {"_id": 0}).to_list(limit)
+
+    async def get(self, user_id: str) -> Optional[Document]:
+        return await self.collection.find_one({"id": user_id}, {"_id": 0})
+
+    async def get_many(self, user_ids: List[str]) -> List[Document]:
+        return await self.collection.find({"id": {"$in": user_ids}}, {"_id": 0}).to_list(len(user_ids))
+
+    def iterate(self, verified=None, fields=None, batch_size: int = 500):
+        query = {} if verified is None else {"verified": verified}
+        return self.collection.find(query, projection(fields), batch_size=batch_size)
+
+    async def estimated_count(self) -> int:
+        return await self.collection.estimated_document_count()
+
+    async def insert(self, doc: Document):
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_many(self, docs: List[Document]):
+        await self.collection.insert_many([dict(doc) for doc in docs])
+
+
+class MongoTransactionRepository(TransactionRepository):
+    def __init__(self, db):
+        self.collection = db.transactions
+
+    async def list(self, limit: int = 1000) -> List[Document]:
+        return await self.collection.find(
+            {}, projection(None, TRANSACTION_INTERNAL_FIELDS)
+        ).sort("timestamp", -1).to_list(limit)
+
+    def iterate(self, query: TransactionFilter, fields=None, batch_size: int = 500):
+        return self.collection.find(
+            transaction_query(query), projection(fields, TRANSACTION_INTERNAL_FIELDS), batch_size=batch_size
+        )
+
+    async def insert(self, doc: Document):
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_many(self, docs: List[Document]):
+        await self.collection.insert_many([dict(doc) for doc in docs])
+
+    async def _set_pending(self, transaction_ids: List[str], update: Document) -> List[str]:
+        if not transaction_ids:
+            return []
+        # One update_many for the batch; its marker tells which transactions this call moved
+        attempt = uuid.uuid4().hex
+        await self.collection.update_many(
+            {"id": {"$in": transaction_ids}, "status": "pending"},
+            {"$set": {**update, "settlement_attempt": attempt}}
+        )
+        moved = await self.collection.find(
+            {"id": {"$in": transaction_ids}, "settlement_attempt": attempt}, {"_id": 0, "id": 1}
+        ).to_list(None)
+        return [doc["id"] for doc in moved]
+
+    async def complete_many(self, transaction_ids: List[str], settled_at: datetime) -> List[str]:
+        return await self._set_pending(transaction_ids, {"status": "completed", "settled_at": settled_at})
+
+    async def fail_many(self, transaction_ids: List[str], settled_at: Optional[datetime] = None) -> List[str]:
+        update = {"status": "failed"}
+        if settled_at is not None:
+            update["settled_at"] = settled_at
+        return await self._set_pending(transaction_ids, update)
+
+    async def volume_by_collection(self, collections: Optional[List[str]] = None) -> Dict[str, float]:
+        volumes = {}
+        # Older transactions have no collection field; resolve it through the NFT
+        async for row in self.collection.aggregate([
+            {"$match": {"status": "completed"}},
+            {"$lookup": {"from": "nfts", "localField": "nft_id", "foreignField": "id", "as": "nft"}},
+            {"$project": {"price": 1, "collection": {
+                "$ifNull": ["$collection", {"$arrayElemAt": ["$nft.collection", 0]}]
+            }}},
+            {"$match": {"collection": {"$in": collections}} if collections is not None else {}},
+            {"$group": {"_id": "$collection", "volume": {"$sum": "$price"}}}
+        ]):
+            if row["_id"] is not None:
+                volumes[row["_id"]] = row["volume"]
+        return volumes
+
+
+class MongoSettlementJobRepository(SettlementJobRepository):
+    def __init__(self, db):
+        self.collection = db.settlement_jobs
+
+    async def enqueue(self, job: Document):
+        await self.collection.insert_one(dict(job))
+
+    async def claim_many(self, now: datetime, lease_until: datetime, limit: int) -> List[Document]:
+        # run_at doubles as the lease expiry of a processing job
+        due = {"state": {"$in": ["queued", "processing"]}, "run_at": {"$lte": now}}
+        candidates = await self.collection.find(due, {"_id": 1}).sort("run_at", ASCENDING).limit(limit).to_list(limit)
+        if not candidates:
+            return []
+        # The update re-checks due, so a job another worker leased meanwhile is skipped;
+        # the lease marker tells which jobs this claim took
+        lease = uuid.uuid4().hex
+        job_ids = [job["_id"] for job in candidates]
+        await self.collection.update_many(
+            {"_id": {"$in": job_ids}, **due},
+            {"$set": {"state": "processing", "run_at": lease_until, "lease": lease}, "$inc": {"attempts": 1}}
+        )
+        return await self.collection.find({"_id": {"$in": job_ids}, "lease": lease}).to_list(limit)
+
+    async def finish_many(self, job_ids: List[str], finished_at: datetime):
+        await self.collection.update_many(
+            {"_id": {"$in": job_ids}},
+            {"$set": {"state": "done", "finished_at": finished_at}}
+        )
+
+    async def requeue(self, job_id: str, run_at: datetime, error: str):
+        await self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"state": "queued", "error": error, "run_at": run_at}}
+        )
+
+    async def fail(self, job_id: str, error: str, finished_at: datetime):
+        await self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"state": "failed", "error": error, "finished_at": finished_at}}
+        )
+
+    async def count_by_state(self) -> Dict[str, int]:
+        return {
+            state: await self.collection.count_documents({"state": state})
+            for state in ("queued", "processing", "failed")
+        }
+
+    async def oldest_pending(self) -> Optional[datetime]:
+        oldest = await self.collection.find_one(
+            {"state": {"$in": ["queued", "processing"]}}, {"created_at": 1}, sort=[("created_at", ASCENDING)]
+        )
+        return oldest["created_at"] if oldest else None
+
+
+class MongoSequenceRepository(SequenceRepository):
+    def __init__(self, db):
+        self.collection = db.counters
+
+    async def advance(self, name: str, count: int) -> int:
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": name},
+                {"$inc": {"seq": count}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race on the very first use; the document exists now
+            return await self.advance(name, count)
+        return doc["seq"]
+
+    async def raise_to(self, name: str, value: int):
+        await self.collection.update_one({"_id": name}, {"$max": {"seq": value}}, upsert=True)
+
+
+class MongoSnapshotRepository(SnapshotRepository):
+    def __init__(self, db):
+        self.collection = db.stats
+
+    async def get(self, key: str) -> Optional[Document]:
+        return await self.collection.find_one({"_id": key}, {"_id": 0})
+
+    async def put(self, key: str, doc: Document):
+        await self.collection.replace_one({"_id": key}, doc, upsert=True)
+
+
+class MongoTraitCountRepository(TraitCountRepository):
+    def __init__(self, db):
+        self.collection = db.trait_counts
+
+    async def add_items(self, collection: str, items: List[List[Tuple[str, str]]]):
+        increments: Dict[Tuple, int] = {(None, None): len(items)}
+        for pairs in items:
+            for pair in pairs:
+                increments[pair] = increments.get(pair, 0) + 1
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"collection": collection, "trait_type": trait_type, "value": value},
+                {"$inc": {"count": count}},
+                upsert=True
+            )
+            for (trait_type, value), count in increments.items()
+        ], ordered=False)
+
+    async def get(self, collection: str) -> Document:
+        total, counts = 0, {}
+        async for doc in self.collection.find({"collection": collection}, {"_id": 0, "collection": 0}):
+            if doc["trait_type"] is None:
+                total = doc["count"]
+            else:
+                counts.setdefault(doc["trait_type"], {})[doc["value"]] = doc["count"]
+        return {"total": total, "counts": counts}
+
+    async def replace(self, collection: str, total: int, counts: Dict[str, Dict[str, int]]):
+        await self.collection.delete_many({"collection": collection})
+        await self.collection.insert_many(
+            [{"collection": collection, "trait_type": None, "value": None, "count": total}] + [
+                {"collection": collection, "trait_type": trait_type, "value": value, "count": count}
+                for trait_type, values in counts.items() for value, count in values.items()
+            ],
+            ordered=False
+        )
+
+
+class MongoPriceHistoryRepository(PriceHistoryRepository):
+    def __init__(self, db):
+        self.collection = db.price_history
+
+    async def merge(self, buckets: List[Document]):
+        # Every operator commutes, so concurrent batches need no ordering
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"collection": bucket["collection"], "interval": bucket["interval"], "start": bucket["start"]},
+                {
+                    "$min": {"open": bucket["open"], "low": bucket["low"]},
+                    "$max": {"close": bucket["close"], "high": bucket["high"]},
+                    "$inc": {"volume": bucket["volume"], "count": bucket["count"]},
+                },
+                upsert=True
+            )
+            for bucket in buckets
+        ], ordered=False)
+
+    async def replace(self, collection: str, buckets: List[Document]):
+        await self.collection.delete_many({"collection": collection})
+        if buckets:
+            await self.collection.insert_many([dict(bucket) for bucket in buckets], ordered=False)
+
+    async def list(self, collection: str, interval: str, limit: int = 100) -> List[Document]:
+        cursor = self.collection.find(
+            {"collection": collection, "interval": interval}, {"_id": 0}
+        ).sort("start", DESCENDING).limit(limit)
+        buckets = await cursor.to_list(limit)
+        buckets.reverse()
+        return buckets
+
+    async def collections(self) -> List[str]:
+        return await self.collection.distinct("collection")
+
+
+class MongoActivityRepository(ActivityRepository):
+    def __init__(self, db):
+        self.collection = db.activity
+
+    async def add(self, buckets: List[Document]):
+        await self.collection.bulk_write([
+            UpdateOne(
+                {
+                    "scope": bucket["scope"],
+                    "granularity": bucket["granularity"],
+                    "start": bucket["start"],
+                    "key": bucket["key"],
+                },
+                {"$inc": bucket["counts"], "$setOnInsert": {"expires_at": bucket["expires_at"]}},
+                upsert=True
+            )
+            for bucket in buckets
+        ], ordered=False)
+
+    async def totals(self, scope: str, granularity: str, since: datetime) -> Dict[str, Dict[str, float]]:
+        # The TTL monitor runs about once a minute; expired buckets are excluded here meanwhile
+        cursor = self.collection.aggregate([
+            {"$match": {"scope": scope, "granularity": granularity, "start": {"$gte": since}, "expires_at": {"$gt": datetime.utcnow()}}},
+            {"$group": {"_id": "$key", **{field: {"$sum": f"${field}"} for field in ACTIVITY_COUNTERS}}},
+        ])
+        return {row.pop("_id"): row async for row in cursor}
+
+
+class MongoRepositories(Repositories):
+    def __init__(self, db):
+        self.db = db
+        self.nfts = MongoNFTRepository(db)
+        self.collections = MongoCollectionRepository(db)
+        self.users = MongoUserRepository(db)
+        self.transactions = MongoTransactionRepository(db)
+        self.settlement_jobs = MongoSettlementJobRepository(db)
+        self.sequences = MongoSequenceRepository(db)
+        self.snapshots = MongoSnapshotRepository(db)
+        self.price_history = MongoPriceHistoryRepository(db)
+        self.trait_counts = MongoTraitCountRepository(db)
+        self.activity = MongoActivityRepository(db)
+
+    async def prepare(self):
+        await ensure_indexes(self.db)
+
+    async def clear(self):
+        for name in ("nfts", "collections", "users", "transactions", "settlement_jobs", "counters", "stats", "price_history", "trait_counts", "activity"):
+            await self.db[name].delete_many({})
+
+    async def index_usage(self) -> List[Document]:
+        return await index_usage(self.db)
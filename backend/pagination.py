@@ -0,0 +1,78 @@
+"""Opaque keyset cursors for sorted list endpoints.
+
+A cursor records the sort field, the direction and the last row's sort value
+and ``id``. The next page starts strictly after that row. Each page is then a
+single index seek, however deep, and rows inserted meanwhile do not shift
+later pages.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded or does not fit the request"""
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(sort_by: str, direction: int, doc: Dict[str, Any]) -> str:
+    """Build the cursor that continues after ``doc``"""
+    payload = {"k": sort_by, "d": direction, "v": _encode_value(doc.get(sort_by)), "i": doc["id"]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, direction: int) -> Dict[str, Any]:
+    """Decode a cursor and check it was issued for the same sort"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        value, last_id = _decode_value(payload["v"]), payload["i"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if payload.get("k") != sort_by or payload.get("d") != direction:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    return {"value": value, "id": last_id}
+
+
+def keyset_filter(sort_by: str, direction: int, position: Dict[str, Any]) -> Dict[str, Any]:
+    """Filter matching rows that sort after ``position`` on (sort_by, id)
+
+    Null and missing values sort first, as ``_sort_key`` orders them in the
+    memory engine. ``$lt``/``$gt`` never match them, so sparse fields such as
+    ``rarity_score`` need an explicit null branch when paging toward them.
+    """
+    op = "$lt" if direction < 0 else "$gt"
+    if position["value"] is None:
+        branches = [{sort_by: None, "id": {op: position["id"]}}]
+        if direction > 0:
+            branches.append({sort_by: {"$ne": None}})
+        return {"$or": branches}
+    branches = [
+        {sort_by: {op: position["value"]}},
+        {sort_by: position["value"], "id": {op: position["id"]}}
+    ]
+    if direction < 0:
+        branches.append({sort_by: None})
+    return {"$or": branches}
+
+
+def merge_filters(query: Dict[str, Any], extra: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """AND an extra filter onto a query without clobbering its keys"""
+    if not extra:
+        return query
+    if not query:
+        return extra
+    return {"$and": [query, extra]}
@@ -0,0 +1,189 @@
+"""Per-collection OHLC price history.
+
+Completed sales are rolled up into one document per collection, interval
+(1h, 1d, 1w) and bucket start (UTC; weeks start on Monday) holding
+open/high/low/close, volume and sale count. Price history reads a
+handful of these documents and never scans transactions.
+
+Each settled batch updates its buckets incrementally: sales are merged
+per bucket in process, then written with one upsert per bucket using only
+``$min``, ``$max`` and ``$inc``. Open and close are stored as
+``{"at", "price"}`` pairs, so ``$min``/``$max`` keep the earliest and
+latest sale whatever order batches settle in, and every update commutes.
+
+``backfill_price_history`` rebuilds the rollups of whole collections from
+completed transactions with pandas. It replaces the existing buckets, and
+without a list of names clears collections that no longer have sales, so
+sales settled while it runs can be missed; run it while settlement is
+quiet, or run it again.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from repositories import Document, Repositories, TransactionFilter
+
+
+INTERVALS = ("1h", "1d", "1w")
+# NFT ids per lookup when the backfill resolves collections of older transactions
+BACKFILL_LOOKUP_SIZE = 1000
+
+
+def bucket_start(at: datetime, interval: str) -> datetime:
+    """Start of the ``interval`` bucket holding ``at``"""
+    if interval == "1h":
+        return at.replace(minute=0, second=0, microsecond=0)
+    day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "1d":
+        return day
+    if interval == "1w":
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Unknown interval: {interval}")
+
+
+def sale_buckets(sales: Iterable[Tuple[str, float, datetime]]) -> List[Document]:
+    """Bucket deltas for ``(collection, price, sold_at)`` sales, merged per bucket"""
+    buckets: Dict[Tuple[str, str, datetime], Document] = {}
+    for collection, price, sold_at in sales:
+        point = {"at": sold_at, "price": price}
+        for interval in INTERVALS:
+            key = (collection, interval, bucket_start(sold_at, interval))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    "collection": collection,
+                    "interval": interval,
+                    "start": key[2],
+                    "open": point,
+                    "close": point,
+                    "high": price,
+                    "low": price,
+                    "volume": price,
+                    "count": 1,
+                }
+                continue
+            # Ties on time go to the lower price for open and the higher for close, as $min/$max do
+            if (sold_at, price) < (bucket["open"]["at"], bucket["open"]["price"]):
+                bucket["open"] = point
+            if (sold_at, price) > (bucket["close"]["at"], bucket["close"]["price"]):
+                bucket["close"] = point
+            bucket["high"] = max(bucket["high"], price)
+            bucket["low"] = min(bucket["low"], price)
+            bucket["volume"] += price
+            bucket["count"] += 1
+    return list(buckets.values())
+
+
+async def record_sales(repos: Repositories, sales: Iterable[Tuple[str, float, datetime]]):
+    """Fold completed sales into the rollups"""
+    buckets = sale_buckets(sales)
+    if buckets:
+        await repos.price_history.merge(buckets)
+
+
+def ohlc(bucket: Document) -> Dict[str, Any]:
+    """API shape of a rollup document"""
+    return {
+        "start": bucket["start"],
+        "open": bucket["open"]["price"],
+        "high": bucket["high"],
+        "low": bucket["low"],
+        "close": bucket["close"]["price"],
+        "volume": bucket["volume"],
+        "count": bucket["count"],
+    }
+
+
+def rollup_frame(frame) -> List[Document]:
+    """Rollup documents for a frame of sales with collection, price and sold_at columns"""
+    # Only the batch job needs pandas
+    import pandas as pd
+
+    # Same tie-breaking as the incremental updates: time, then price
+    frame = frame.sort_values(["sold_at", "price"])
+    buckets: List[Document] = []
+    for interval in INTERVALS:
+        if interval == "1w":
+            # Weekly periods ending on Sunday start on Monday
+            starts = frame["sold_at"].dt.to_period("W-SUN").dt.start_time
+        else:
+            starts = frame["sold_at"].dt.floor("h" if interval == "1h" else "D")
+        grouped = frame.assign(start=starts).groupby(["collection", "start"], sort=True)
+        rolled = grouped.agg(
+            open_price=("price", "first"),
+            open_at=("sold_at", "first"),
+            high=("price", "max"),
+            low=("price", "min"),
+            close_price=("price", "last"),
+            close_at=("sold_at", "last"),
+            volume=("price", "sum"),
+            count=("price", "size"),
+        ).reset_index()
+        for row in rolled.itertuples(index=False):
+            buckets.append({
+                "collection": row.collection,
+                "interval": interval,
+                "start": pd.Timestamp(row.start).to_pydatetime(),
+                "open": {"at": pd.Timestamp(row.open_at).to_pydatetime(), "price": float(row.open_price)},
+                "close": {"at": pd.Timestamp(row.close_at).to_pydatetime(), "price": float(row.close_price)},
+                "high": float(row.high),
+                "low": float(row.low),
+                "volume": float(row.volume),
+                "count": int(row.count),
+            })
+    return buckets
+
+
+async def backfill_price_history(repos: Repositories, collection_names: Optional[Iterable[str]] = None) -> int:
+    """Rebuild rollups from completed transactions; returns buckets written"""
+    import pandas as pd
+
+    names = set(collection_names) if collection_names is not None else None
+    rows: Dict[str, list] = {"collection": [], "price": [], "sold_at": []}
+    # Older transactions have no collection field; they are resolved through
+    # their NFTs in chunked lookups once the cursor is drained
+    legacy: List[Tuple[str, Any, datetime]] = []
+    cursor = repos.transactions.iterate(
+        TransactionFilter(status="completed"), ["nft_id", "collection", "price", "timestamp", "settled_at"]
+    )
+    try:
+        async for doc in cursor:
+            sold_at = doc.get("settled_at") or doc["timestamp"]
+            collection = doc.get("collection")
+            if collection is None:
+                legacy.append((doc["nft_id"], doc["price"], sold_at))
+                continue
+            if names is not None and collection not in names:
+                continue
+            rows["collection"].append(collection)
+            rows["price"].append(doc["price"])
+            rows["sold_at"].append(sold_at)
+    finally:
+        await cursor.close()
+
+    nft_ids = list(dict.fromkeys(nft_id for nft_id, _, _ in legacy))
+    nft_collections: Dict[str, Optional[str]] = {}
+    for offset in range(0, len(nft_ids), BACKFILL_LOOKUP_SIZE):
+        found = await repos.nfts.get_many(nft_ids[offset:offset + BACKFILL_LOOKUP_SIZE], fields=["id", "collection"])
+        nft_collections.update((nft["id"], nft.get("collection")) for nft in found)
+    for nft_id, price, sold_at in legacy:
+        collection = nft_collections.get(nft_id)
+        if collection is None or (names is not None and collection not in names):
+            continue
+        rows["collection"].append(collection)
+        rows["price"].append(price)
+        rows["sold_at"].append(sold_at)
+
+    frame = pd.DataFrame(rows)
+    if not frame.empty:
+        frame["sold_at"] = pd.to_datetime(frame["sold_at"])
+        frame["price"] = frame["price"].astype(float)
+    buckets = rollup_frame(frame) if not frame.empty else []
+
+    # Collections left without sales still get replaced, which clears stale rollups
+    stale = names if names is not None else await repos.price_history.collections()
+    by_collection: Dict[str, List[Document]] = {name: [] for name in stale}
+    for bucket in buckets:
+        by_collection.setdefault(bucket["collection"], []).append(bucket)
+    for name, collection_buckets in by_collection.items():
+        await repos.price_history.replace(name, collection_buckets)
+    return len(buckets)
@@ -0,0 +1,283 @@
+"""Trait rarity scores and ranks.
+
+Each trait gets ``rarity``: the fraction of the collection sharing its
+value. Each NFT gets ``rarity_score``: the information content of its
+traits, summed as ``-log2(fraction)`` over every trait type of the collection.
+An NFT lacking a trait type scores the rarity of lacking it, so rare
+omissions count too. ``rarity_rank`` is 1 for the highest score in the
+collection, and ties share a rank.
+
+``rescore_collection`` is the batch job. It reads the traits of one
+collection, computes frequencies, scores and ranks with pandas and numpy
+in a worker thread, and writes them back together with the collection's
+trait counts.
+
+Mints are incremental. The new NFTs are scored against the stored counts
+plus their own traits before they are inserted, so they sort by rarity
+right away, and their traits are added to the stored counts once the
+insert succeeded. The scores of the other NFTs and all ranks shift with
+every mint. ``RarityScorer`` recomputes them with a debounced incremental
+rescore of each touched collection. It computes everything again, but
+writes an NFT only where a field moved materially: a changed rank, a score
+off by more than ``SCORE_TOLERANCE`` bits, or a trait rarity off by more
+than ``RARITY_TOLERANCE`` of its value. Growth shifts every fraction a
+little; those drifts are absorbed until they add up, so steady minting
+rewrites the NFTs sharing a rare value with the new ones and the ranks
+that moved, not the whole collection. The full rewrite is left to the
+admin endpoint, the import and the migration.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from repositories import Document, NFTFilter, Repositories
+
+
+logger = logging.getLogger(__name__)
+
+# NFTs updated per write of the batch job
+WRITE_BATCH_SIZE = 1000
+
+# An incremental rescore leaves a stored score within this many bits alone
+SCORE_TOLERANCE = 0.05
+
+# ... and a stored trait rarity within this fraction of its new value
+RARITY_TOLERANCE = 0.05
+
+
+def trait_pairs(traits: Iterable[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Distinct (trait_type, value) pairs of one NFT"""
+    return list(dict.fromkeys((str(trait["trait_type"]), str(trait["value"])) for trait in traits or ()))
+
+
+def score_traits(traits: List[Dict[str, Any]], total: int, counts: Dict[str, Dict[str, int]]) -> Tuple[List[Dict[str, Any]], float]:
+    """``traits`` with their rarity, and the NFT's score, from a collection's trait counts"""
+    if total <= 0:
+        return traits, 0.0
+    own = dict(trait_pairs(traits))
+    score = 0.0
+    for trait_type, values in counts.items():
+        if trait_type in own:
+            count = values.get(own[trait_type], 0)
+        else:
+            count = total - sum(values.values())
+        if count > 0:
+            score -= math.log2(count / total)
+    scored = [
+        {**trait, "rarity": counts.get(str(trait["trait_type"]), {}).get(str(trait["value"]), 0) / total}
+        for trait in traits
+    ]
+    return scored, score
+
+
+def score_frame(frame, total: int):
+    """Vectorized scores for a long (id, trait_type, value) frame of ``total`` NFTs
+
+    Returns the count of each (trait_type, value), the score of each id with
+    at least one trait, and the score of an NFT without any trait.
+    """
+    import numpy as np
+
+    counts = frame.groupby(["trait_type", "value"]).size()
+    # Lacking a type is a value of its own; a type every NFT has costs nothing
+    missing = total - frame.groupby("trait_type").size()
+    with np.errstate(divide="ignore"):
+        missing_bits = np.where(missing > 0, -np.log2(missing / total), 0.0)
+    missing_bits = dict(zip(missing.index, missing_bits))
+    lacking_all = float(sum(missing_bits.values()))
+
+    held = frame.join(counts.rename("held"), on=["trait_type", "value"])["held"].to_numpy()
+    bits = -np.log2(held / total)
+    # Score = bits of every trait held + bits of every type lacked
+    #       = sum(bits - bits of lacking that type) + bits of lacking every type
+    offset = frame["trait_type"].map(missing_bits).to_numpy()
+    scores = frame.assign(bits=bits - offset).groupby("id")["bits"].sum() + lacking_all
+    return counts, scores, lacking_all
+
+
+def score_collection(docs: List[Document]) -> Tuple[Dict[str, Dict[str, int]], Dict[str, Document]]:
+    """Trait counts of a whole collection and the rarity fields to set on each NFT"""
+    import pandas as pd
+
+    total = len(docs)
+    rows = [(doc["id"], trait_type, value) for doc in docs for trait_type, value in trait_pairs(doc.get("traits"))]
+    frame = pd.DataFrame(rows, columns=["id", "trait_type", "value"])
+    if frame.empty:
+        pair_counts: Dict[Tuple[str, str], int] = {}
+        scores = pd.Series(0.0, index=[doc["id"] for doc in docs], dtype=float)
+    else:
+        counts_series, scores, lacking_all = score_frame(frame, total)
+        pair_counts = {pair: int(count) for pair, count in counts_series.items()}
+        scores = scores.reindex([doc["id"] for doc in docs]).fillna(lacking_all)
+    # Equal scores summed in a different order differ in the last bits; they share a rank
+    ranks = scores.round(9).rank(ascending=False, method="min").astype(int).to_dict()
+    scores = scores.to_dict()
+
+    counts: Dict[str, Dict[str, int]] = {}
+    for (trait_type, value), count in pair_counts.items():
+        counts.setdefault(trait_type, {})[value] = count
+    changes = {
+        doc["id"]: {
+            "traits": [
+                {**trait, "rarity": pair_counts.get((str(trait["trait_type"]), str(trait["value"])), 0) / total}
+                for trait in doc.get("traits") or ()
+            ],
+            "rarity_score": float(scores[doc["id"]]),
+            "rarity_rank": ranks[doc["id"]],
+        }
+        for doc in docs
+    }
+    return counts, changes
+
+
+def _rarity_moved(old: Optional[float], new: float) -> bool:
+    return old is None or abs(new - old) > RARITY_TOLERANCE * max(abs(old), abs(new))
+
+
+def material_changes(stored: Document, fresh: Document) -> Document:
+    """The rarity fields of ``fresh`` that moved enough from ``stored`` to be written"""
+    changes = {}
+    if stored.get("rarity_rank") != fresh["rarity_rank"]:
+        changes["rarity_rank"] = fresh["rarity_rank"]
+    score = stored.get("rarity_score")
+    if score is None or abs(score - fresh["rarity_score"]) > SCORE_TOLERANCE:
+        changes["rarity_score"] = fresh["rarity_score"]
+    old_traits = stored.get("traits") or []
+    if len(old_traits) != len(fresh["traits"]) or any(
+        _rarity_moved(old.get("rarity"), new["rarity"]) for old, new in zip(old_traits, fresh["traits"])
+    ):
+        changes["traits"] = fresh["traits"]
+    return changes
+
+
+async def rescore_collection(repos: Repositories, name: str, incremental: bool = False) -> int:
+    """Recompute trait counts, scores and ranks of a collection; returns NFTs scored
+
+    ``incremental`` writes only the NFTs whose rarity fields moved materially.
+    """
+    fields = ["id", "traits", "rarity_score", "rarity_rank"] if incremental else ["id", "traits"]
+    docs: List[Document] = []
+    cursor = repos.nfts.iterate(NFTFilter(collection=name), fields, batch_size=WRITE_BATCH_SIZE)
+    try:
+        async for doc in cursor:
+            docs.append(doc)
+    finally:
+        await cursor.close()
+
+    # Scoring is CPU bound; keep it off the event loop
+    counts, changes = await asyncio.to_thread(score_collection, docs)
+    await repos.trait_counts.replace(name, len(docs), counts)
+    if incremental:
+        moved = ((doc["id"], material_changes(doc, changes[doc["id"]])) for doc in docs)
+        changes = {nft_id: fields for nft_id, fields in moved if fields}
+    ids = list(changes)
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        await repos.nfts.update_many({nft_id: changes[nft_id] for nft_id in ids[start:start + WRITE_BATCH_SIZE]})
+    return len(docs)
+
+
+def _by_collection(docs: List[Document]) -> Dict[str, List[Document]]:
+    by_collection: Dict[str, List[Document]] = {}
+    for doc in docs:
+        by_collection.setdefault(doc["collection"], []).append(doc)
+    return by_collection
+
+
+async def score_mints(repos: Repositories, docs: List[Document]):
+    """Score new NFT documents in place, against the stored counts plus their own traits"""
+    for name, group in _by_collection(docs).items():
+        stored = await repos.trait_counts.get(name)
+        counts = {trait_type: dict(values) for trait_type, values in stored["counts"].items()}
+        for doc in group:
+            for trait_type, value in trait_pairs(doc.get("traits")):
+                values = counts.setdefault(trait_type, {})
+                values[value] = values.get(value, 0) + 1
+        total = stored["total"] + len(group)
+        for doc in group:
+            doc["traits"], doc["rarity_score"] = score_traits(doc.get("traits") or [], total, counts)
+
+
+async def count_mints(repos: Repositories, docs: List[Document]):
+    """Add the traits of inserted NFT documents to their collections' counts"""
+    for name, group in _by_collection(docs).items():
+        await repos.trait_counts.add_items(name, [trait_pairs(doc.get("traits")) for doc in group])
+
+
+class RarityScorer:
+    def __init__(self, repos: Repositories, delay: float = 10.0, on_rescored: Optional[Callable[[str], None]] = None):
+        self.repos = repos
+        # Mints within this many seconds of the first one share a rescore
+        self.delay = delay
+        # Called with the collection name after each rescore
+        self.on_rescored = on_rescored
+        self._pending: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {
+            "rescores": 0,
+            "nfts_scored": 0,
+            "failures": 0,
+            "last_duration_ms": 0.0,
+        }
+
+    async def score(self, docs: List[Document]):
+        """Score new NFT documents before they are inserted"""
+        await score_mints(self.repos, docs)
+
+    async def minted(self, docs: List[Document]):
+        """Count the traits of inserted NFT documents and schedule an incremental rescore"""
+        await count_mints(self.repos, docs)
+        for name in {doc["collection"] for doc in docs}:
+            self.mark(name)
+
+    def mark(self, name: str):
+        """Rescore ``name`` on the next run"""
+        self._pending.add(name)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def rescore(self, name: str, incremental: bool = False) -> int:
+        started = time.perf_counter()
+        scored = await rescore_collection(self.repos, name, incremental)
+        self._stats["rescores"] += 1
+        self._stats["nfts_scored"] += scored
+        self._stats["last_duration_ms"] = (time.perf_counter() - started) * 1000
+        if self.on_rescored is not None:
+            self.on_rescored(name)
+        return scored
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            names, self._pending = self._pending, set()
+            for name in sorted(names):
+                try:
+                    await self.rescore(name, incremental=True)
+                except Exception as e:
+                    self._stats["failures"] += 1
+                    logger.error(f"Rarity rescore of {name} failed: {e}")
+                    self.mark(name)
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"pending_collections": len(self._pending), "delay": self.delay, **self._stats}
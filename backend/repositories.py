@@ -0,0 +1,476 @@
+"""Storage interfaces used by the API and its background workers.
+
+Routes receive repositories through FastAPI dependencies and never touch a
+database handle. Two engines implement the interfaces, selected by the
+STORAGE_ENGINE environment variable:
+
+* ``mongo`` (default): MongoDB through Motor, see mongo_repositories.py;
+* ``memory``: indexed in-process dictionaries, see memory_repositories.py.
+  It has the same filter, sort, keyset pagination and atomic update
+  semantics. It is meant for benchmarks and tests, and its data lives only
+  as long as the process.
+
+Documents are plain dicts shaped like the API models and never carry
+``_id``. ``fields`` arguments select top-level fields (None means every
+public field). ``after`` is a keyset position ``{"value", "id"}`` as
+produced by pagination.decode_cursor.
+
+Interfaces are abstract base classes, so an engine missing a method fails
+when it is constructed rather than on the first request that calls it.
+"""
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+Document = Dict[str, Any]
+
+# Derived fields stored on NFT documents but never returned by the API
+NFT_INTERNAL_FIELDS = ("search_terms", "name_terms", "last_transaction_id")
+
+# Marker of the settlement update that last moved a transaction, never returned by the API
+TRANSACTION_INTERNAL_FIELDS = ("settlement_attempt",)
+
+# Counters kept per activity bucket
+ACTIVITY_COUNTERS = ("views", "likes", "sales", "volume")
+
+
+@dataclass
+class NFTFilter:
+    collection: Optional[str] = None
+    status: Optional[str] = None
+    owner: Optional[str] = None
+    creator: Optional[str] = None
+    # Query tokens that must each prefix-match a search term; [] matches nothing
+    search: Optional[List[str]] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    # {trait_type: values}: an NFT must hold one of the values of every listed type
+    traits: Optional[Dict[str, List[str]]] = None
+
+
+@dataclass
+class TransactionFilter:
+    status: Optional[str] = None
+    nft_id: Optional[str] = None
+    collection: Optional[str] = None
+    buyer: Optional[str] = None
+    seller: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+
+class DocumentCursor(ABC):
+    """Async iterator over query results that must be closed when abandoned"""
+
+    @abstractmethod
+    def __aiter__(self) -> AsyncIterator[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+
+class NFTRepository(ABC):
+    @abstractmethod
+    async def get(self, nft_id: str) -> Optional[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_many(self, nft_ids: List[str], fields: Optional[List[str]] = None) -> List[Document]:
+        """NFTs among ``nft_ids``, in no particular order"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def exists(self, nft_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def find(
+        self,
+        query: NFTFilter,
+        sort_by: str,
+        direction: int,
+        after: Optional[Dict[str, Any]] = None,
+        skip: int = 0,
+        limit: int = 20,
+        fields: Optional[List[str]] = None,
+    ) -> List[Document]:
+        """One page sorted on (sort_by, id), starting strictly after ``after``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list(self, query: NFTFilter, fields: Optional[List[str]] = None, limit: int = 1000) -> List[Document]:
+        """Up to ``limit`` matches in storage order"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search_candidates(self, query: NFTFilter, batch_size: int = 500) -> DocumentCursor:
+        """Every match, with only id, name_terms and search_terms"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iterate(self, query: NFTFilter, fields: Optional[List[str]] = None, batch_size: int = 500) -> DocumentCursor:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count(self, query: NFTFilter) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def estimated_count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert(self, doc: Document):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_many(self, docs: List[Document]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_for_sale(self, nft_id: str, price: float) -> Optional[Document]:
+        """Mark listed at ``price``; returns the NFT as it was before, or None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def unlist(self, nft_id: str) -> Optional[Document]:
+        """Unlist a listed NFT; returns it as it was before, or None if not listed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_many(self, changes: Dict[str, Document]):
+        """Set fields per NFT: ``{nft_id: {field: value}}``; unknown ids are ignored"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def increment_many(self, deltas: Dict[str, Dict[str, int]]):
+        """Atomically add ``{nft_id: {field: amount}}`` in one batch"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def transfer(
+        self, nft_id: str, seller: str, buyer: str, transaction_id: str, price: Optional[float] = None
+    ) -> bool:
+        """Give a listed NFT owned by ``seller`` to ``buyer``
+
+        Idempotent per transaction: repeating a transfer that already
+        happened succeeds again. False when the seller no longer has it
+        listed, or no longer at ``price`` when one is given.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def revert_transfer(self, nft_id: str, seller: str, transaction_id: str):
+        """Undo ``transfer`` if the NFT is still held through ``transaction_id``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def cheapest_listed_price(self, collection: str) -> Optional[float]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def trait_facets(self, query: NFTFilter) -> Document:
+        """``{"total": n, "traits": {trait_type: {value: n}}}`` for the NFTs matching ``query``
+
+        Counts for a trait type listed in ``query.traits`` ignore that type's
+        own selection, so every alternative value of the type keeps its count.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stats_by_collection(self, collections: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """``{collection: {"items_count", "floor_price"}}``; floor 0 when nothing is listed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def max_token_id(self) -> int:
+        raise NotImplementedError
+
+
+class CollectionRepository(ABC):
+    @abstractmethod
+    async def list(self, fields: Optional[List[str]] = None, limit: int = 1000) -> List[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, collection_id: str) -> Optional[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_many(self, collection_ids: List[str]) -> List[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_many_by_name(self, names: List[str]) -> List[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iterate(self, fields: Optional[List[str]] = None, batch_size: int = 500) -> DocumentCursor:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def estimated_count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert(self, doc: Document):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_many(self, docs: List[Document]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_items(self, name: str, count: int, floor_candidate: Optional[float] = None):
+        """Add to items_count and, given a listed price, lower the floor to it"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def lower_floor(self, name: str, price: float):
+        """Set the floor to ``price`` if nothing is listed or it is cheaper"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_floor(self, name: str) -> Optional[float]:
+        """Current floor price, None for an unknown collection"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def replace_floor(self, name: str, expected: float, price: float) -> bool:
+        """Set the floor to ``price`` if it is still ``expected``; returns whether it was"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_volume(self, name: str, amount: float):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_stats(self, stats: Dict[str, Dict[str, Any]]) -> int:
+        """Overwrite stats fields per collection name; returns collections matched"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def total_volume(self) -> float:
+        raise NotImplementedError
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def list(self, limit: int = 1000) -> List[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, user_id: str) -> Optional[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_many(self, user_ids: List[str]) -> List[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iterate(self, verified: Optional[bool] = None, fields: Optional[List[str]] = None, batch_size: int = 500) -> DocumentCursor:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def estimated_count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert(self, doc: Document):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_many(self, docs: List[Document]):
+        raise NotImplementedError
+
+
+class TransactionRepository(ABC):
+    @abstractmethod
+    async def list(self, limit: int = 1000) -> List[Document]:
+        """Newest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iterate(self, query: TransactionFilter, fields: Optional[List[str]] = None, batch_size: int = 500) -> DocumentCursor:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert(self, doc: Document):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def insert_many(self, docs: List[Document]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete_many(self, transaction_ids: List[str], settled_at: datetime) -> List[str]:
+        """Mark the pending ones among ``transaction_ids`` completed; returns the ids this call completed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fail_many(self, transaction_ids: List[str], settled_at: Optional[datetime] = None) -> List[str]:
+        """Mark the pending ones among ``transaction_ids`` failed; returns the ids this call failed"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def volume_by_collection(self, collections: Optional[List[str]] = None) -> Dict[str, float]:
+        """Completed sale volume per collection"""
+        raise NotImplementedError
+
+
+class SettlementJobRepository(ABC):
+    @abstractmethod
+    async def enqueue(self, job: Document):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim_many(self, now: datetime, lease_until: datetime, limit: int) -> List[Document]:
+        """Lease up to ``limit`` of the most overdue queued or lease-expired jobs, counting an attempt on each"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def finish_many(self, job_ids: List[str], finished_at: datetime):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def requeue(self, job_id: str, run_at: datetime, error: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fail(self, job_id: str, error: str, finished_at: datetime):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_by_state(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def oldest_pending(self) -> Optional[datetime]:
+        """Creation time of the oldest job not finished yet"""
+        raise NotImplementedError
+
+
+class SequenceRepository(ABC):
+    @abstractmethod
+    async def advance(self, name: str, count: int) -> int:
+        """Atomically add ``count`` to a sequence and return its new value"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def raise_to(self, name: str, value: int):
+        """Make the sequence at least ``value``"""
+        raise NotImplementedError
+
+
+class SnapshotRepository(ABC):
+    """Small named documents holding materialized results"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Document]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def put(self, key: str, doc: Document):
+        raise NotImplementedError
+
+
+class TraitCountRepository(ABC):
+    """Per collection: how many NFTs there are and how many hold each trait value"""
+
+    @abstractmethod
+    async def add_items(self, collection: str, items: List[List[Tuple[str, str]]]):
+        """Count new NFTs, each given as its distinct (trait_type, value) pairs"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, collection: str) -> Document:
+        """``{"total": n, "counts": {trait_type: {value: n}}}``, zero when never counted"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def replace(self, collection: str, total: int, counts: Dict[str, Dict[str, int]]):
+        raise NotImplementedError
+
+
+class PriceHistoryRepository(ABC):
+    """OHLC rollup documents, one per collection, interval and bucket start"""
+
+    @abstractmethod
+    async def merge(self, buckets: List[Document]):
+        """Fold bucket deltas in: min/max of open, close, low and high, sum of volume and count"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def replace(self, collection: str, buckets: List[Document]):
+        """Swap every bucket of ``collection`` for ``buckets``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list(self, collection: str, interval: str, limit: int = 100) -> List[Document]:
+        """The latest ``limit`` buckets, oldest first"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def collections(self) -> List[str]:
+        """Names of every collection holding buckets"""
+        raise NotImplementedError
+
+
+class ActivityRepository(ABC):
+    """Time-bucketed activity counters, one document per scope, key, granularity and bucket start
+
+    ``scope`` is "nft" (keyed by NFT id) or "collection" (keyed by name).
+    Every bucket carries an ``expires_at`` after which it is dropped.
+    """
+
+    @abstractmethod
+    async def add(self, buckets: List[Document]):
+        """Add each bucket's ``counts`` to the stored bucket, creating it when missing"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def totals(self, scope: str, granularity: str, since: datetime) -> Dict[str, Dict[str, float]]:
+        """Per key, the counters summed over unexpired buckets starting at or after ``since``"""
+        raise NotImplementedError
+
+
+class Repositories(ABC):
+    nfts: NFTRepository
+    collections: CollectionRepository
+    users: UserRepository
+    transactions: TransactionRepository
+    settlement_jobs: SettlementJobRepository
+    sequences: SequenceRepository
+    snapshots: SnapshotRepository
+    price_history: PriceHistoryRepository
+    trait_counts: TraitCountRepository
+    activity: ActivityRepository
+
+    async def prepare(self):
+        """Get storage ready before serving, e.g. create indexes"""
+
+    @abstractmethod
+    async def clear(self):
+        """Delete every document; used to reset load-test databases"""
+        raise NotImplementedError
+
+    async def index_usage(self) -> List[Document]:
+        """Per-index access counters; empty for engines without them"""
+        return []
+
+
+def create_repositories(db) -> Repositories:
+    """Build the repositories selected by the STORAGE_ENGINE environment variable"""
+    engine = os.environ.get("STORAGE_ENGINE", "mongo")
+    if engine == "mongo":
+        from mongo_repositories import MongoRepositories
+        return MongoRepositories(db)
+    if engine == "memory":
+        from memory_repositories import MemoryRepositories
+        return MemoryRepositories()
+    raise ValueError(f"Unknown STORAGE_ENGINE: {engine}")
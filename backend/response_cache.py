@@ -0,0 +1,95 @@
+"""In-process response cache with per-entry TTL, LRU eviction and tags.
+
+Entries are keyed by route name plus normalised query parameters. Each entry
+carries tags naming the data it was built from, e.g. ``"nfts"`` for any NFT
+listing and ``"nft:<id>"`` for every page that contains that NFT. Write paths
+invalidate exactly the tags they affect. The cache is per process: other
+workers only see a write once their own entry expires, so TTLs bound the
+cross-worker staleness.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+
+MISSING = object()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1000, enabled: bool = True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, Any, Set[str]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def key(route: str, params: Dict[str, Any]) -> str:
+        """Cache key for a route; None-valued params are dropped and order is irrelevant"""
+        items = sorted((name, str(value)) for name, value in params.items() if value is not None)
+        return f"{route}?{urlencode(items)}"
+
+    def get(self, key: str) -> Any:
+        """Cached value for ``key`` or MISSING"""
+        if not self.enabled:
+            return MISSING
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return MISSING
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float, tags: Iterable[str] = ()):
+        if not self.enabled:
+            return
+        if key in self._entries:
+            self._remove(key)
+        tag_set = set(tags)
+        self._entries[key] = (time.monotonic() + ttl, value, tag_set)
+        for tag in tag_set:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, *tags: str):
+        """Drop every entry carrying any of ``tags``"""
+        for tag in tags:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "tags": len(self._tags),
+            **self._stats,
+            "hit_ratio": self._stats["hits"] / lookups if lookups else None,
+        }
@@ -0,0 +1,91 @@
+"""Token-based NFT search backed by a multikey index.
+
+Every NFT document carries ``search_terms`` (normalised tokens of its name,
+description and collection) and ``name_terms`` (tokens of the name alone).
+A query is tokenised the same way. Each query token must prefix-match one of
+the document's terms. Prefix matches are anchored regexes over the
+lower-case, punctuation-free ``search_terms`` index, so MongoDB answers them
+with an index range scan. User input is never interpreted as a pattern.
+
+Relevance weighs name matches above other matches and whole-word matches
+above prefix matches. Every match is scored, streamed from the index; only
+the rows that can still make the requested page are held in memory.
+"""
+import heapq
+import re
+import unicodedata
+from typing import Any, AsyncIterable, Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+_NAME_EXACT, _NAME_PREFIX = 4.0, 2.0
+_TERM_EXACT, _TERM_PREFIX = 1.0, 0.5
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case, accent-free word tokens of ``text``"""
+    if not text:
+        return []
+    normalized = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(stripped.lower())
+
+
+def search_fields(name: str, description: str, collection: str) -> Dict[str, List[str]]:
+    """Derived fields stored on an NFT document to make it searchable"""
+    name_terms = set(tokenize(name))
+    terms = name_terms | set(tokenize(description)) | set(tokenize(collection))
+    return {"search_terms": sorted(terms), "name_terms": sorted(name_terms)}
+
+
+def search_filter(query_tokens: Iterable[str]) -> Dict[str, Any]:
+    """Filter requiring every query token to prefix-match a search term"""
+    clauses = [{"search_terms": {"$regex": f"^{re.escape(token)}"}} for token in query_tokens]
+    if not clauses:
+        # Nothing searchable in the input, so nothing can match
+        return {"search_terms": {"$in": []}}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _match_score(token: str, terms: List[str], exact: float, prefix: float) -> float:
+    best = 0.0
+    for term in terms:
+        if term == token:
+            return exact
+        if term.startswith(token):
+            best = prefix
+    return best
+
+
+def relevance(query_tokens: Iterable[str], doc: Dict[str, Any]) -> float:
+    """Score a candidate document against the query tokens"""
+    name_terms = doc.get("name_terms") or []
+    terms = doc.get("search_terms") or []
+    score = 0.0
+    for token in query_tokens:
+        score += max(
+            _match_score(token, name_terms, _NAME_EXACT, _NAME_PREFIX),
+            _match_score(token, terms, _TERM_EXACT, _TERM_PREFIX)
+        )
+    return score
+
+
+async def rank_candidates(
+    candidates: AsyncIterable[Dict[str, Any]],
+    query_tokens: List[str],
+    descending: bool,
+    after: Optional[Tuple[float, str]],
+    keep: int,
+) -> List[Dict[str, Any]]:
+    """The first ``keep`` ``{"id", "relevance"}`` rows past ``after`` in (relevance, id) order"""
+    select = heapq.nlargest if descending else heapq.nsmallest
+    rows: List[Tuple[float, str]] = []
+    async for doc in candidates:
+        row = (relevance(query_tokens, doc), doc["id"])
+        if after is not None and (row >= after if descending else row <= after):
+            continue
+        rows.append(row)
+        # Prune from time to time: memory stays proportional to the page
+        if len(rows) >= 2 * keep + 1000:
+            rows = select(keep, rows)
+    return [{"id": doc_id, "relevance": score} for score, doc_id in select(keep, rows)]
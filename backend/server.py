@@ -1,27 +1,157 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime
 from enum import Enum
-import base64
-import requests
+
+from activity import WINDOWS, ActivityBoards, ActivityRecorder
+from blob_store import IMAGE_SECURITY_HEADERS, INLINE_CONTENT_TYPES, create_blob_store, image_url, is_blob_hash
+from collection_stats import (
+    record_delisting, record_listing, record_mint, recompute_collection_stats
+)
+from counters import CounterBuffer
+from events import CLOSED, DROPPED, EventBus, EventStreamResponse, sse_events
+from exports import NDJSONResponse, ndjson_lines
+from facets import trait_facets
+from image_ingest import ImageFetcher, ImageTooLarge, UnsafeImageURL
+from loaders import Loaders
+from marketplace_stats import MarketplaceStats
+from pagination import InvalidCursor, decode_cursor, encode_cursor
+from price_history import INTERVALS, ohlc
+from rarity import RarityScorer
+from repositories import (
+    CollectionRepository, DocumentCursor, NFTFilter, NFTRepository, Repositories,
+    TransactionFilter, TransactionRepository, UserRepository, create_repositories
+)
+from response_cache import MISSING, ResponseCache
+from search import rank_candidates, search_fields, tokenize
+from settlement import SettlementQueue
+from slow_queries import SlowQueryLog
+from telemetry import CommandMetrics, RequestMetricsMiddleware, Telemetry
+from token_ids import TokenIdAllocator
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Per-route request metrics and MongoDB command metrics, served at /metrics
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+telemetry = Telemetry()
+
+# Mongo operations slower than SLOW_QUERY_MS are logged by shape, with sampled explain plans
+slow_queries = SlowQueryLog(
+    threshold_ms=float(os.environ.get("SLOW_QUERY_MS", 100)),
+    explain_rate=float(os.environ.get("SLOW_QUERY_EXPLAIN_RATE", 0.1)),
+    explain_interval=float(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", 60))
+)
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    event_listeners=[slow_queries] + ([CommandMetrics(telemetry)] if METRICS_ENABLED else [])
+)
 db = client[os.environ['DB_NAME']]
 
+# Routes and workers go through repositories; STORAGE_ENGINE=memory keeps all data in process
+repositories = create_repositories(db)
+
+# Image blobs live outside the documents, keyed by content hash
+blob_store = create_blob_store(db, ROOT_DIR / 'blobs')
+
+# Shared, pooled HTTP client for remote image downloads
+image_fetcher = ImageFetcher.from_env()
+
+# Hot read responses are cached in process and invalidated by the write paths
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 1000)),
+    enabled=os.environ.get("RESPONSE_CACHE_ENABLED", "1") != "0"
+)
+
+# Read endpoints encode trusted database documents directly with orjson
+FAST_RESPONSES = os.environ.get("FAST_RESPONSES", "0") == "1"
+
+# Views and likes are buffered in process and flushed in bulk
+nft_counters = CounterBuffer(
+    repositories.nfts,
+    flush_interval=float(os.environ.get("COUNTER_FLUSH_INTERVAL", 1.0)),
+    max_pending=int(os.environ.get("COUNTER_MAX_PENDING", 1000)),
+    on_flush=lambda nft_ids: response_cache.invalidate(*(f"nft:{nft_id}" for nft_id in nft_ids))
+)
+
+# The same hits, bucketed by time for trending and leaderboards
+activity_counters = CounterBuffer(
+    ActivityRecorder(repositories),
+    flush_interval=float(os.environ.get("COUNTER_FLUSH_INTERVAL", 1.0)),
+    max_pending=int(os.environ.get("COUNTER_MAX_PENDING", 1000))
+)
+
+# Token ids come from an atomic counter, optionally reserved in blocks per worker
+token_ids = TokenIdAllocator(
+    repositories.nfts,
+    repositories.sequences,
+    block_size=int(os.environ.get("TOKEN_ID_BLOCK_SIZE", 1))
+)
+
+# Marketplace totals are served from a periodically refreshed document
+marketplace_stats = MarketplaceStats(
+    repositories,
+    max_staleness=float(os.environ.get("STATS_MAX_STALENESS", 30.0))
+)
+
+# Trending NFTs and collection leaderboards per window, materialized in the background
+ACTIVITY_BOARD_SIZE = int(os.environ.get("ACTIVITY_BOARD_SIZE", 100))
+activity_boards = ActivityBoards(
+    repositories,
+    max_staleness=float(os.environ.get("ACTIVITY_MAX_STALENESS", 30.0)),
+    size=ACTIVITY_BOARD_SIZE
+)
+
+# Trait rarity: new NFTs are scored on mint, their collections rescored incrementally shortly after
+rarity_scorer = RarityScorer(
+    repositories,
+    delay=float(os.environ.get("RARITY_RESCORE_DELAY", 10.0)),
+    on_rescored=lambda name: response_cache.invalidate("nfts", f"nfts:{name}")
+)
+
+# Marketplace events fanned out to WebSocket and SSE subscribers
+event_bus = EventBus(
+    buffer_size=int(os.environ.get("EVENT_BUFFER_SIZE", 256)),
+    coalesce_interval=float(os.environ.get("EVENT_COALESCE_INTERVAL", 0.5))
+)
+EVENT_HEARTBEAT = float(os.environ.get("EVENT_HEARTBEAT", 15.0))
+
+def on_settled(jobs):
+    """Drop cached reads of the sold NFTs and announce the completed sales"""
+    response_cache.invalidate("nfts", "collections", *(f"nft:{job['nft_id']}" for job in jobs))
+    for job in jobs:
+        event_bus.publish("transaction.completed", {
+            "transaction_id": job["_id"],
+            "nft_id": job["nft_id"],
+            "buyer": job["buyer"],
+            "seller": job["seller"],
+            "price": job["price"],
+        }, job["collection"])
+
+# Purchases are settled by background workers fed from a persistent queue
+settlement = SettlementQueue(
+    repositories,
+    workers=int(os.environ.get("SETTLEMENT_WORKERS", 2)),
+    batch_size=int(os.environ.get("SETTLEMENT_BATCH_SIZE", 50)),
+    poll_interval=float(os.environ.get("SETTLEMENT_POLL_INTERVAL", 0.5)),
+    max_attempts=int(os.environ.get("SETTLEMENT_MAX_ATTEMPTS", 5)),
+    on_settled=on_settled
+)
+
 # Create the main app without a prefix
 app = FastAPI(title="NFT Marketplace API", version="1.0.0")
 
@@ -39,6 +169,31 @@ class TransactionStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+# get_nfts sort_by values and the fields they sort and page on; each is paired with "id" as a tiebreaker
+NFT_SORT_FIELDS = {
+    "created_at": "created_at",
+    "price": "price",
+    "likes": "likes",
+    "views": "views",
+    "rarity": "rarity_score",
+}
+
+# Documents fetched per cursor batch by the NDJSON exports
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 500))
+
+# Most NFTs one batch request may read or mint
+NFT_BATCH_LIMIT = int(os.environ.get("NFT_BATCH_LIMIT", 100))
+
+# Seconds a cached response may be served before it is rebuilt
+CACHE_TTLS = {
+    "get_nfts": 5,
+    "get_nft": 10,
+    "get_collections": 60,
+    "get_collection": 60,
+    "get_price_history": 60,
+    "get_nft_facets": 10,
+}
+
 # Models
 class NFTTrait(BaseModel):
     trait_type: str
@@ -49,7 +204,7 @@ class NFT(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     description: str
-    image: str  # base64 encoded image
+    image: str  # /api/images/{hash} URL of the stored image
     price: float
     owner: str
     creator: str
@@ -61,15 +216,20 @@ class NFT(BaseModel):
     status: NFTStatus = NFTStatus.LISTED
     likes: int = 0
     views: int = 0
+    rarity_score: Optional[float] = None
+    rarity_rank: Optional[int] = None
 
 class NFTCreate(BaseModel):
     name: str
     description: str
     image_url: str
-    price: float
+    price: float = Field(gt=0)
     collection: str
     traits: List[NFTTrait] = []
 
+class NFTBatchGet(BaseModel):
+    ids: List[str]
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
@@ -90,7 +250,7 @@ class Collection(BaseModel):
     name: str
     description: str
     creator: str
-    banner_image: Optional[str] = None
+    banner_image: Optional[str] = None  # /api/images/{hash} URL of the stored image
     floor_price: float = 0.0
     volume: float = 0.0
     items_count: int = 0
@@ -104,6 +264,7 @@ class CollectionCreate(BaseModel):
 class Transaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     nft_id: str
+    collection: Optional[str] = None
     buyer: str
     seller: str
     price: float
@@ -117,71 +278,417 @@ class TransactionCreate(BaseModel):
     seller: str
     price: float
 
+class NFTListing(BaseModel):
+    price: float = Field(gt=0)
+
+class PriceBucket(BaseModel):
+    start: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+    count: int
+
+class TrendingNFT(BaseModel):
+    id: str
+    name: str
+    image: str
+    collection: str
+    price: float
+    status: NFTStatus
+    views: int
+    likes: int
+    sales: int
+    volume: float
+    score: float
+
+class TrendingNFTs(BaseModel):
+    window: str
+    as_of: datetime
+    nfts: List[TrendingNFT]
+
+class CollectionActivity(BaseModel):
+    name: str
+    id: Optional[str] = None
+    banner_image: Optional[str] = None
+    floor_price: Optional[float] = None
+    views: int
+    likes: int
+    sales: int
+    volume: float
+
+class CollectionLeaderboard(BaseModel):
+    window: str
+    as_of: datetime
+    collections: List[CollectionActivity]
+
+class FacetValue(BaseModel):
+    value: str
+    count: int
+
+class TraitFacet(BaseModel):
+    trait_type: str
+    values: List[FacetValue]
+
+class NFTFacets(BaseModel):
+    total: int
+    traits: List[TraitFacet]
+
+def partial_model(model):
+    """Copy of ``model`` with every field optional, for sparse fieldset responses"""
+    return create_model(
+        f"Partial{model.__name__}",
+        **{name: (Optional[field.annotation], None) for name, field in model.model_fields.items()}
+    )
+
+PartialNFT = partial_model(NFT)
+PartialCollection = partial_model(Collection)
+
+# Default shapes for list endpoints: what a card grid needs
+NFT_SUMMARY_FIELDS = (
+    "id", "name", "image", "price", "owner", "creator", "collection",
+    "token_id", "status", "likes", "views", "created_at", "rarity_rank"
+)
+COLLECTION_SUMMARY_FIELDS = (
+    "id", "name", "creator", "banner_image", "floor_price", "volume", "items_count", "created_at"
+)
+
 # Utility functions
-async def download_and_encode_image(image_url: str) -> str:
-    """Download image from URL and encode to base64"""
+def parse_fields(fields: Optional[str], model, summary) -> List[str]:
+    """Resolve a ``fields=`` parameter: "summary" (default), "all" or a comma list"""
+    if not fields or fields == "summary":
+        return list(summary)
+    if fields == "all":
+        return list(model.model_fields)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in model.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [name for name in requested if name != "id"]
+
+def parse_traits(traits: Optional[str]) -> Optional[Dict[str, List[str]]]:
+    """Resolve a ``traits=Type:Value,Type:Value`` parameter to values per trait type
+
+    Values of one type are alternatives; every type must match.
+    """
+    if not traits:
+        return None
+    selected: Dict[str, List[str]] = {}
+    for item in traits.split(","):
+        trait_type, separator, value = item.partition(":")
+        trait_type, value = trait_type.strip(), value.strip()
+        if not separator or not trait_type or not value:
+            raise HTTPException(status_code=400, detail=f"traits must be Type:Value pairs, got {item!r}")
+        values = selected.setdefault(trait_type, [])
+        if value not in values:
+            values.append(value)
+    # Stable order, so equal selections share cache entries
+    return {trait_type: sorted(values) for trait_type, values in sorted(selected.items())}
+
+def read_response(docs, model, headers: Optional[Dict[str, str]] = None):
+    """Response body for documents read from storage (a list or a single one)
+
+    With FAST_RESPONSES the documents are trusted as stored and encoded with
+    orjson, skipping both the model and the response_model validation pass.
+    They must already be projected without ``_id``.
+    """
+    if FAST_RESPONSES:
+        return ORJSONResponse(docs, headers=headers)
+    if isinstance(docs, list):
+        return [model(**doc) for doc in docs]
+    return model(**docs)
+
+def get_repositories() -> Repositories:
+    """Dependency: every repository of the configured storage engine"""
+    return repositories
+
+def get_nft_repository() -> NFTRepository:
+    return repositories.nfts
+
+def get_collection_repository() -> CollectionRepository:
+    return repositories.collections
+
+def get_user_repository() -> UserRepository:
+    return repositories.users
+
+def get_transaction_repository() -> TransactionRepository:
+    return repositories.transactions
+
+def get_loaders(repos: Repositories = Depends(get_repositories)) -> Loaders:
+    """Dependency: loaders scoped to the current request"""
+    return Loaders(repos)
+
+def with_pending_counters(nft: Dict[str, Any]) -> Dict[str, Any]:
+    """NFT document with views and likes that are not flushed yet added in"""
+    return {
+        **nft,
+        "views": nft.get("views", 0) + nft_counters.pending(nft["id"], "views"),
+        "likes": nft.get("likes", 0) + nft_counters.pending(nft["id"], "likes")
+    }
+
+def nft_document(nft: NFT) -> Dict[str, Any]:
+    """Stored document for an NFT, including its derived search fields"""
+    return {**nft.dict(), **search_fields(nft.name, nft.description, nft.collection)}
+
+async def download_and_store_image(url: str) -> str:
+    """Download image from URL into the blob store and return its URL"""
     try:
-        response = requests.get(image_url)
-        response.raise_for_status()
-        return base64.b64encode(response.content).decode('utf-8')
+        blob_hash = await image_fetcher.fetch_into(url, blob_store)
+        return image_url(blob_hash)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsafeImageURL as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logging.error(f"Error downloading image: {e}")
         return ""
 
+async def download_images(urls: List[str], concurrency: int = 8) -> List[str]:
+    """Download several images concurrently, at most ``concurrency`` at a time
+
+    A URL that fails, including an image over the size limit, yields "" so
+    one bad row never fails the whole batch.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    
+    async def fetch(url: str) -> str:
+        if not url:
+            return ""
+        async with slots:
+            try:
+                return image_url(await image_fetcher.fetch_into(url, blob_store))
+            except Exception as e:
+                logging.error(f"Error downloading image {url}: {e}")
+                return ""
+    
+    return await asyncio.gather(*(fetch(url) for url in urls))
+
+def parse_range_header(range_header: str, size: int):
+    """Parse a single-range ``bytes=`` header into inclusive (start, end)
+
+    Returns None when the header is malformed (the whole blob is served) and
+    raises HTTPException 416 when the range cannot be satisfied.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "NFT Marketplace API"}
 
+# Image Routes
+@api_router.get("/images/{blob_hash}")
+async def get_image(blob_hash: str, request: Request):
+    if not is_blob_hash(blob_hash):
+        raise HTTPException(status_code=404, detail="Image not found")
+    info = await blob_store.stat(blob_hash)
+    if not info:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Content never changes for a given hash, so clients may cache forever
+    etag = f'"{blob_hash}"'
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        **IMAGE_SECURITY_HEADERS
+    }
+    if info.content_type not in INLINE_CONTENT_TYPES:
+        # <img> ignores this; opening the URL downloads instead of rendering
+        headers["Content-Disposition"] = f'attachment; filename="{blob_hash}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    
+    start, end = 0, info.size - 1
+    status_code = 200
+    range_header = request.headers.get("range")
+    if range_header and info.size > 0:
+        byte_range = parse_range_header(range_header, info.size)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    headers["Content-Length"] = str(max(end - start + 1, 0))
+    
+    return StreamingResponse(
+        blob_store.read(blob_hash, start, end),
+        status_code=status_code,
+        media_type=info.content_type,
+        headers=headers
+    )
+
 # NFT Routes
-@api_router.get("/nfts", response_model=List[NFT])
+@api_router.get("/nfts", response_model=List[PartialNFT], response_model_exclude_unset=True)
 async def get_nfts(
+    response: Response,
     skip: int = 0,
     limit: int = 20,
     collection: Optional[str] = None,
     status: Optional[NFTStatus] = None,
     search: Optional[str] = None,
+    traits: Optional[str] = None,
     sort_by: Optional[str] = "created_at",
-    order: Optional[str] = "desc"
+    order: Optional[str] = "desc",
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    nfts_repo: NFTRepository = Depends(get_nft_repository)
 ):
-    query = {}
-    if collection:
-        query["collection"] = collection
-    if status:
-        query["status"] = status
-    if search:
-        query["$or"] = [
-            {"name": {"$regex": search, "$options": "i"}},
-            {"description": {"$regex": search, "$options": "i"}},
-            {"collection": {"$regex": search, "$options": "i"}}
-        ]
+    """List NFTs; pass the X-Next-Cursor header back as ``cursor`` for the next page
+
+    ``traits`` filters by trait, e.g. ``Background:Blue,Background:Red,Eyes:Laser``.
+    """
+    if sort_by == "relevance" and not search:
+        raise HTTPException(status_code=400, detail="sort_by=relevance requires search")
+    if sort_by not in NFT_SORT_FIELDS and sort_by != "relevance":
+        raise HTTPException(status_code=400, detail=f"sort_by must be one of {', '.join(NFT_SORT_FIELDS)}, relevance")
     
+    field_names = parse_fields(fields, NFT, NFT_SUMMARY_FIELDS)
+    selected_traits = parse_traits(traits)
+    tokens = tokenize(search) if search else []
     sort_order = -1 if order == "desc" else 1
     
-    nfts = await db.nfts.find(query).sort(sort_by, sort_order).skip(skip).limit(limit).to_list(length=limit)
-    return [NFT(**nft) for nft in nfts]
+    cache_key = response_cache.key("get_nfts", {
+        "skip": skip, "limit": limit, "collection": collection, "status": status,
+        "search": " ".join(tokens) if search else None, "traits": selected_traits, "sort_by": sort_by,
+        "order": sort_order, "cursor": cursor, "fields": ",".join(sorted(field_names))
+    })
+    cached = response_cache.get(cache_key)
+    if cached is MISSING:
+        nfts, next_cursor = await find_nfts(
+            nfts_repo, skip, limit, collection, status, search, tokens, selected_traits,
+            sort_by, sort_order, cursor, field_names
+        )
+        cached = (nfts, next_cursor)
+        response_cache.set(
+            cache_key, cached, CACHE_TTLS["get_nfts"],
+            tags=["nfts", *(f"nft:{nft['id']}" for nft in nfts)]
+        )
+    
+    nfts, next_cursor = cached
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    response.headers.update(headers)
+    return read_response(nfts, PartialNFT, headers)
 
-@api_router.get("/nfts/{nft_id}", response_model=NFT)
-async def get_nft(nft_id: str):
-    nft = await db.nfts.find_one({"id": nft_id})
-    if not nft:
-        raise HTTPException(status_code=404, detail="NFT not found")
+async def find_nfts(nfts_repo, skip, limit, collection, status, search, tokens, traits, sort_by, sort_order, cursor, field_names):
+    """Query one page of NFTs and the cursor continuing after it"""
+    query = NFTFilter(collection=collection, status=status, search=tokens if search else None, traits=traits)
+    
+    # Keyset pagination: continue strictly after the last row of the previous page
+    sort_field = NFT_SORT_FIELDS.get(sort_by, sort_by)
+    position = None
+    if cursor:
+        try:
+            position = decode_cursor(cursor, sort_field, sort_order)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    if sort_by == "relevance":
+        page, nfts = await rank_search_results(nfts_repo, query, tokens, sort_order, position, skip, limit, field_names)
+        next_cursor = encode_cursor(sort_by, sort_order, page[-1]) if len(page) == limit else None
+        return nfts, next_cursor
+    
+    # The sort key is fetched for the cursor even when it was not requested
+    nfts = await nfts_repo.find(
+        query, sort_field, sort_order, after=position, skip=skip, limit=limit, fields=field_names + [sort_field]
+    )
+    next_cursor = encode_cursor(sort_field, sort_order, nfts[-1]) if nfts and len(nfts) == limit else None
+    if sort_field not in field_names:
+        for nft in nfts:
+            nft.pop(sort_field, None)
+    return nfts, next_cursor
+
+async def rank_search_results(nfts_repo, query, tokens, sort_order, position, skip, limit, field_names):
+    """Page of search results ordered by relevance, with its score rows
+
+    Every match from the search_terms index is scored in process, and only
+    the rows up to the end of the page are kept.
+    """
+    after = (position["value"], position["id"]) if position else None
+    cursor = nfts_repo.search_candidates(query)
+    try:
+        ranked = await rank_candidates(cursor, tokens, sort_order < 0, after, skip + limit)
+    finally:
+        await cursor.close()
+    page = ranked[skip:skip + limit]
     
-    # Increment views
-    await db.nfts.update_one({"id": nft_id}, {"$inc": {"views": 1}})
-    nft["views"] = nft.get("views", 0) + 1
+    docs = await nfts_repo.get_many([row["id"] for row in page], fields=field_names)
+    by_id = {doc["id"]: doc for doc in docs}
+    return page, [by_id[row["id"]] for row in page if row["id"] in by_id]
+
+@api_router.get("/nfts/facets", response_model=NFTFacets)
+async def get_nft_facets(
+    collection: Optional[str] = None,
+    status: Optional[NFTStatus] = None,
+    search: Optional[str] = None,
+    traits: Optional[str] = None,
+    repos: Repositories = Depends(get_repositories)
+):
+    """Counts per trait type and value of the NFTs matching the same filters as /nfts
+
+    Counts of a type named in ``traits`` ignore that type's own selection.
+    """
+    selected_traits = parse_traits(traits)
+    tokens = tokenize(search) if search else []
+    cache_key = response_cache.key("get_nft_facets", {
+        "collection": collection, "status": status,
+        "search": " ".join(tokens) if search else None, "traits": selected_traits
+    })
+    facets = response_cache.get(cache_key)
+    if facets is MISSING:
+        query = NFTFilter(collection=collection, status=status, search=tokens if search else None, traits=selected_traits)
+        facets = await trait_facets(repos, query, on_stale=rarity_scorer.mark)
+        response_cache.set(cache_key, facets, CACHE_TTLS["get_nft_facets"], tags=["nfts"])
+    return facets
+
+@api_router.get("/nfts/{nft_id}", response_model=NFT)
+async def get_nft(nft_id: str, nfts_repo: NFTRepository = Depends(get_nft_repository)):
+    cache_key = response_cache.key("get_nft", {"id": nft_id})
+    nft = response_cache.get(cache_key)
+    if nft is MISSING:
+        nft = await nfts_repo.get(nft_id)
+        if not nft:
+            raise HTTPException(status_code=404, detail="NFT not found")
+        # Tagged with its collection too, for changes that touch every NFT of it (rescores)
+        response_cache.set(
+            cache_key, nft, CACHE_TTLS["get_nft"], tags=[f"nft:{nft_id}", f"nfts:{nft.get('collection')}"]
+        )
     
-    return NFT(**nft)
+    # Increment views; the write happens on the next counter flush
+    nft_counters.incr(nft_id, "views")
+    activity_counters.incr(nft_id, "views")
+    return read_response(with_pending_counters(nft), NFT)
 
 @api_router.post("/nfts", response_model=NFT)
-async def create_nft(nft_data: NFTCreate):
-    # Download and encode image
-    image_base64 = await download_and_encode_image(nft_data.image_url)
+async def create_nft(nft_data: NFTCreate, repos: Repositories = Depends(get_repositories)):
+    # Download image into the blob store
+    image = await download_and_store_image(nft_data.image_url)
     
     nft = NFT(
         name=nft_data.name,
         description=nft_data.description,
-        image=image_base64,
+        image=image,
         price=nft_data.price,
         owner="0x" + uuid.uuid4().hex[:40],  # Mock owner
         creator="0x" + uuid.uuid4().hex[:40],  # Mock creator
@@ -190,73 +697,199 @@ async def create_nft(nft_data: NFTCreate):
         token_id=await get_next_token_id()
     )
     
-    await db.nfts.insert_one(nft.dict())
+    # Trait rarity and score against the collection's counts, this NFT included;
+    # the counts themselves only change once the insert succeeded
+    doc = nft_document(nft)
+    await rarity_scorer.score([doc])
+    await repos.nfts.insert(doc)
+    await rarity_scorer.minted([doc])
+    nft = NFT(**doc)
     
     # Update collection stats
-    await update_collection_stats(nft.collection)
+    await record_mint(repos, nft.collection, nft.price, listed=nft.status == NFTStatus.LISTED)
+    response_cache.invalidate("nfts", "collections")
+    event_bus.publish("nft.minted", nft_event(nft), nft.collection)
     
     return nft
 
+@api_router.post("/nfts/batch-get", response_model=List[NFT])
+async def get_nfts_by_ids(batch: NFTBatchGet, loaders: Loaders = Depends(get_loaders)):
+    """NFTs for ``ids`` in request order, fetched with one query; unknown ids are skipped"""
+    if len(batch.ids) > NFT_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {NFT_BATCH_LIMIT} ids per request")
+    nfts = await loaders.nfts.load_many(batch.ids)
+    return read_response([with_pending_counters(nft) for nft in nfts if nft], NFT)
+
+@api_router.post("/nfts/batch", response_model=List[NFT])
+async def create_nfts(
+    nfts_data: List[NFTCreate],
+    loaders: Loaders = Depends(get_loaders),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Mint several NFTs with one insert and one stats update per collection"""
+    if not nfts_data:
+        raise HTTPException(status_code=400, detail="No NFTs to mint")
+    if len(nfts_data) > NFT_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {NFT_BATCH_LIMIT} NFTs per request")
+    
+    names = list(dict.fromkeys(nft_data.collection for nft_data in nfts_data))
+    collections = await loaders.collections_by_name.load_many(names)
+    missing = [name for name, collection in zip(names, collections) if collection is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Collection not found: {', '.join(missing)}")
+    
+    images = await download_images([nft_data.image_url for nft_data in nfts_data])
+    block = await token_ids.reserve(len(nfts_data))
+    nfts = [
+        NFT(
+            name=nft_data.name,
+            description=nft_data.description,
+            image=image,
+            price=nft_data.price,
+            owner="0x" + uuid.uuid4().hex[:40],  # Mock owner
+            creator="0x" + uuid.uuid4().hex[:40],  # Mock creator
+            collection=nft_data.collection,
+            traits=nft_data.traits,
+            token_id=token_id
+        )
+        for nft_data, image, token_id in zip(nfts_data, images, block)
+    ]
+    docs = [nft_document(nft) for nft in nfts]
+    await rarity_scorer.score(docs)
+    await repos.nfts.insert_many(docs)
+    await rarity_scorer.minted(docs)
+    nfts = [NFT(**doc) for doc in docs]
+    
+    # One stats update per collection; all new NFTs are listed
+    minted: Dict[str, List[NFT]] = {}
+    for nft in nfts:
+        minted.setdefault(nft.collection, []).append(nft)
+    await asyncio.gather(*(
+        record_mint(repos, name, min(nft.price for nft in group), count=len(group))
+        for name, group in minted.items()
+    ))
+    response_cache.invalidate("nfts", "collections")
+    for nft in nfts:
+        event_bus.publish("nft.minted", nft_event(nft), nft.collection)
+    
+    return nfts
+
 @api_router.post("/nfts/{nft_id}/like")
-async def like_nft(nft_id: str):
-    result = await db.nfts.update_one(
-        {"id": nft_id},
-        {"$inc": {"likes": 1}}
-    )
-    if result.matched_count == 0:
+async def like_nft(nft_id: str, nfts_repo: NFTRepository = Depends(get_nft_repository)):
+    found = await nfts_repo.get_many([nft_id], fields=["collection"])
+    if not found:
         raise HTTPException(status_code=404, detail="NFT not found")
+    nft_counters.incr(nft_id, "likes")
+    activity_counters.incr(nft_id, "likes")
+    response_cache.invalidate(f"nft:{nft_id}")
+    event_bus.count(nft_id, found[0].get("collection"), "likes")
     return {"message": "NFT liked successfully"}
 
+@api_router.post("/nfts/{nft_id}/list", response_model=NFT)
+async def list_nft(nft_id: str, listing: NFTListing, repos: Repositories = Depends(get_repositories)):
+    previous = await repos.nfts.list_for_sale(nft_id, listing.price)
+    if not previous:
+        raise HTTPException(status_code=404, detail="NFT not found")
+    
+    # Update collection floor price
+    if previous.get("status") == NFTStatus.LISTED and listing.price > previous["price"]:
+        await record_delisting(repos, previous["collection"], previous["price"])
+    else:
+        await record_listing(repos, previous["collection"], listing.price)
+    response_cache.invalidate("nfts", "collections", f"nft:{nft_id}")
+    event_bus.publish("nft.listed", {"nft_id": nft_id, "price": listing.price}, previous["collection"])
+    
+    return NFT(**{**previous, "status": NFTStatus.LISTED, "price": listing.price})
+
+@api_router.post("/nfts/{nft_id}/unlist", response_model=NFT)
+async def unlist_nft(nft_id: str, repos: Repositories = Depends(get_repositories)):
+    previous = await repos.nfts.unlist(nft_id)
+    if not previous:
+        if await repos.nfts.exists(nft_id):
+            raise HTTPException(status_code=409, detail="NFT is not listed")
+        raise HTTPException(status_code=404, detail="NFT not found")
+    
+    # Update collection floor price
+    await record_delisting(repos, previous["collection"], previous["price"])
+    response_cache.invalidate("nfts", "collections", f"nft:{nft_id}")
+    event_bus.publish("nft.unlisted", {"nft_id": nft_id}, previous["collection"])
+    
+    return NFT(**{**previous, "status": NFTStatus.UNLISTED})
+
 # User Routes
 @api_router.get("/users", response_model=List[User])
-async def get_users():
-    users = await db.users.find().to_list(1000)
-    return [User(**user) for user in users]
+async def get_users(users_repo: UserRepository = Depends(get_user_repository)):
+    users = await users_repo.list()
+    return read_response(users, User)
 
 @api_router.get("/users/{user_id}", response_model=User)
-async def get_user(user_id: str):
-    user = await db.users.find_one({"id": user_id})
+async def get_user(user_id: str, users_repo: UserRepository = Depends(get_user_repository)):
+    user = await users_repo.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return User(**user)
+    return read_response(user, User)
 
 @api_router.post("/users", response_model=User)
-async def create_user(user_data: UserCreate):
+async def create_user(user_data: UserCreate, users_repo: UserRepository = Depends(get_user_repository)):
     user = User(
         username=user_data.username,
         email=user_data.email,
         bio=user_data.bio
     )
-    await db.users.insert_one(user.dict())
+    await users_repo.insert(user.dict())
     return user
 
-@api_router.get("/users/{user_id}/nfts", response_model=List[NFT])
-async def get_user_nfts(user_id: str):
-    user = await db.users.find_one({"id": user_id})
+@api_router.get("/users/{user_id}/nfts", response_model=List[PartialNFT], response_model_exclude_unset=True)
+async def get_user_nfts(
+    user_id: str,
+    fields: Optional[str] = None,
+    loaders: Loaders = Depends(get_loaders),
+    nfts_repo: NFTRepository = Depends(get_nft_repository)
+):
+    field_names = parse_fields(fields, NFT, NFT_SUMMARY_FIELDS)
+    user = await loaders.users.load(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    nfts = await db.nfts.find({"owner": user["wallet_address"]}).to_list(1000)
-    return [NFT(**nft) for nft in nfts]
+    nfts = await nfts_repo.list(NFTFilter(owner=user["wallet_address"]), fields=field_names)
+    return read_response(nfts, PartialNFT)
 
 # Collection Routes
-@api_router.get("/collections", response_model=List[Collection])
-async def get_collections():
-    collections = await db.collections.find().to_list(1000)
-    return [Collection(**collection) for collection in collections]
+@api_router.get("/collections", response_model=List[PartialCollection], response_model_exclude_unset=True)
+async def get_collections(
+    fields: Optional[str] = None,
+    collections_repo: CollectionRepository = Depends(get_collection_repository)
+):
+    field_names = parse_fields(fields, Collection, COLLECTION_SUMMARY_FIELDS)
+    cache_key = response_cache.key("get_collections", {"fields": ",".join(sorted(field_names))})
+    collections = response_cache.get(cache_key)
+    if collections is MISSING:
+        collections = await collections_repo.list(fields=field_names)
+        response_cache.set(cache_key, collections, CACHE_TTLS["get_collections"], tags=["collections"])
+    return read_response(collections, PartialCollection)
 
 @api_router.get("/collections/{collection_id}", response_model=Collection)
-async def get_collection(collection_id: str):
-    collection = await db.collections.find_one({"id": collection_id})
-    if not collection:
-        raise HTTPException(status_code=404, detail="Collection not found")
-    return Collection(**collection)
+async def get_collection(
+    collection_id: str,
+    collections_repo: CollectionRepository = Depends(get_collection_repository)
+):
+    cache_key = response_cache.key("get_collection", {"id": collection_id})
+    collection = response_cache.get(cache_key)
+    if collection is MISSING:
+        collection = await collections_repo.get(collection_id)
+        if not collection:
+            raise HTTPException(status_code=404, detail="Collection not found")
+        response_cache.set(cache_key, collection, CACHE_TTLS["get_collection"], tags=["collections"])
+    return read_response(collection, Collection)
 
 @api_router.post("/collections", response_model=Collection)
-async def create_collection(collection_data: CollectionCreate):
+async def create_collection(
+    collection_data: CollectionCreate,
+    collections_repo: CollectionRepository = Depends(get_collection_repository)
+):
     banner_image = ""
     if collection_data.banner_image_url:
-        banner_image = await download_and_encode_image(collection_data.banner_image_url)
+        banner_image = await download_and_store_image(collection_data.banner_image_url)
     
     collection = Collection(
         name=collection_data.name,
@@ -264,114 +897,306 @@ async def create_collection(collection_data: CollectionCreate):
         creator="0x" + uuid.uuid4().hex[:40],  # Mock creator
         banner_image=banner_image
     )
-    await db.collections.insert_one(collection.dict())
+    await collections_repo.insert(collection.dict())
+    response_cache.invalidate("collections")
     return collection
 
-@api_router.get("/collections/{collection_id}/nfts", response_model=List[NFT])
-async def get_collection_nfts(collection_id: str):
-    collection = await db.collections.find_one({"id": collection_id})
+@api_router.get("/collections/{collection_id}/nfts", response_model=List[PartialNFT], response_model_exclude_unset=True)
+async def get_collection_nfts(
+    collection_id: str,
+    fields: Optional[str] = None,
+    loaders: Loaders = Depends(get_loaders),
+    nfts_repo: NFTRepository = Depends(get_nft_repository)
+):
+    field_names = parse_fields(fields, NFT, NFT_SUMMARY_FIELDS)
+    collection = await loaders.collections.load(collection_id)
     if not collection:
         raise HTTPException(status_code=404, detail="Collection not found")
     
-    nfts = await db.nfts.find({"collection": collection["name"]}).to_list(1000)
-    return [NFT(**nft) for nft in nfts]
+    nfts = await nfts_repo.list(NFTFilter(collection=collection["name"]), fields=field_names)
+    return read_response(nfts, PartialNFT)
+
+@api_router.get("/collections/{collection_id}/price-history", response_model=List[PriceBucket])
+async def get_price_history(
+    collection_id: str,
+    interval: str = "1d",
+    limit: int = Query(100, ge=1, le=1000),
+    loaders: Loaders = Depends(get_loaders),
+    repos: Repositories = Depends(get_repositories)
+):
+    """OHLC buckets of completed sales, oldest first, read from the settlement rollups"""
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(INTERVALS)}")
+    cache_key = response_cache.key("get_price_history", {"id": collection_id, "interval": interval, "limit": limit})
+    buckets = response_cache.get(cache_key)
+    if buckets is MISSING:
+        collection = await loaders.collections.load(collection_id)
+        if not collection:
+            raise HTTPException(status_code=404, detail="Collection not found")
+        buckets = [ohlc(bucket) for bucket in await repos.price_history.list(collection["name"], interval, limit)]
+        response_cache.set(cache_key, buckets, CACHE_TTLS["get_price_history"], tags=["collections"])
+    return read_response(buckets, PriceBucket)
 
 # Transaction Routes
 @api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions():
-    transactions = await db.transactions.find().sort("timestamp", -1).to_list(1000)
-    return [Transaction(**transaction) for transaction in transactions]
+async def get_transactions(transactions_repo: TransactionRepository = Depends(get_transaction_repository)):
+    transactions = await transactions_repo.list()
+    return read_response(transactions, Transaction)
 
 @api_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction_data: TransactionCreate):
-    # Simulate blockchain transaction
+async def create_transaction(transaction_data: TransactionCreate, repos: Repositories = Depends(get_repositories)):
+    """Validate a purchase and queue it; the transaction is returned pending"""
+    nft = await repos.nfts.get(transaction_data.nft_id)
+    if not nft:
+        raise HTTPException(status_code=404, detail="NFT not found")
+    if transaction_data.seller != nft["owner"]:
+        raise HTTPException(status_code=400, detail="Seller does not own this NFT")
+    if nft.get("status") != NFTStatus.LISTED:
+        raise HTTPException(status_code=409, detail="NFT is not listed")
+    if transaction_data.buyer == transaction_data.seller:
+        raise HTTPException(status_code=400, detail="Buyer and seller are the same")
+    if transaction_data.price < nft["price"]:
+        raise HTTPException(status_code=400, detail="Price is below the listing price")
+    
     transaction = Transaction(
         nft_id=transaction_data.nft_id,
+        collection=nft["collection"],
         buyer=transaction_data.buyer,
         seller=transaction_data.seller,
         price=transaction_data.price,
         status=TransactionStatus.PENDING
     )
     
-    await db.transactions.insert_one(transaction.dict())
-    
-    # Update NFT ownership and status
-    await db.nfts.update_one(
-        {"id": transaction_data.nft_id},
-        {
-            "$set": {
-                "owner": transaction_data.buyer,
-                "status": NFTStatus.SOLD
-            }
-        }
-    )
+    await repos.transactions.insert(transaction.dict())
     
-    # Simulate transaction completion after a delay
-    await complete_transaction(transaction.id)
+    # Ownership, completion and collection stats are applied by the settlement workers
+    await settlement.enqueue(transaction.dict(), listed_price=nft["price"])
+    event_bus.publish("transaction.created", {
+        "transaction_id": transaction.id,
+        "nft_id": transaction.nft_id,
+        "buyer": transaction.buyer,
+        "seller": transaction.seller,
+        "price": transaction.price,
+    }, transaction.collection)
     
     return transaction
 
 @api_router.get("/stats")
 async def get_marketplace_stats():
-    total_nfts = await db.nfts.count_documents({})
-    total_users = await db.users.count_documents({})
-    total_collections = await db.collections.count_documents({})
-    
-    # Calculate total volume
-    transactions = await db.transactions.find({"status": TransactionStatus.COMPLETED}).to_list(1000)
-    total_volume = sum(transaction.get("price", 0) for transaction in transactions)
-    
+    stats = await marketplace_stats.get()
     return {
-        "total_nfts": total_nfts,
-        "total_users": total_users,
-        "total_collections": total_collections,
-        "total_volume": total_volume,
-        "active_listings": await db.nfts.count_documents({"status": NFTStatus.LISTED})
+        "total_nfts": stats["total_nfts"],
+        "total_users": stats["total_users"],
+        "total_collections": stats["total_collections"],
+        "total_volume": stats["total_volume"],
+        "active_listings": stats["active_listings"],
+        "as_of": stats["refreshed_at"]
     }
 
+def check_window(window: str):
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(WINDOWS)}")
+
+@api_router.get("/trending/nfts", response_model=TrendingNFTs)
+async def get_trending_nfts(window: str = "24h", limit: int = Query(20, ge=1, le=ACTIVITY_BOARD_SIZE)):
+    """NFTs with the most weighted views, likes and sales in the window, from the materialized boards"""
+    check_window(window)
+    boards = await activity_boards.get(window)
+    return {"window": window, "as_of": boards["refreshed_at"], "nfts": boards["nfts"][:limit]}
+
+@api_router.get("/leaderboard/collections", response_model=CollectionLeaderboard)
+async def get_collection_leaderboard(window: str = "24h", limit: int = Query(20, ge=1, le=ACTIVITY_BOARD_SIZE)):
+    """Collections by sales volume in the window, from the materialized boards"""
+    check_window(window)
+    boards = await activity_boards.get(window)
+    return {"window": window, "as_of": boards["refreshed_at"], "collections": boards["collections"][:limit]}
+
 # Utility functions
 async def get_next_token_id():
     """Get the next token ID for NFT minting"""
-    count = await db.nfts.count_documents({})
-    return count + 1
+    return await token_ids.next()
 
 async def update_collection_stats(collection_name: str):
-    """Update collection statistics"""
-    nfts = await db.nfts.find({"collection": collection_name}).to_list(1000)
-    if not nfts:
-        return
-    
-    # Calculate floor price
-    listed_nfts = [nft for nft in nfts if nft.get("status") == NFTStatus.LISTED]
-    floor_price = min(nft.get("price", 0) for nft in listed_nfts) if listed_nfts else 0
-    
-    # Calculate volume
-    transactions = await db.transactions.find({"status": TransactionStatus.COMPLETED}).to_list(1000)
-    collection_transactions = [t for t in transactions if any(nft.get("id") == t.get("nft_id") for nft in nfts)]
-    volume = sum(transaction.get("price", 0) for transaction in collection_transactions)
-    
-    # Update collection
-    await db.collections.update_one(
-        {"name": collection_name},
-        {
-            "$set": {
-                "floor_price": floor_price,
-                "volume": volume,
-                "items_count": len(nfts)
-            }
-        }
+    """Recompute collection statistics from scratch (repair path)"""
+    await recompute_collection_stats(repositories, [collection_name])
+    response_cache.invalidate("collections")
+
+# Export Routes
+def export_response(cursor: DocumentCursor, name: str) -> NDJSONResponse:
+    """Stream every document of ``cursor`` as NDJSON"""
+    return NDJSONResponse(
+        ndjson_lines(cursor, chunk_rows=EXPORT_BATCH_SIZE),
+        headers={"Content-Disposition": f'attachment; filename="{name}.ndjson"'}
     )
 
-async def complete_transaction(transaction_id: str):
-    """Complete a pending transaction"""
-    await db.transactions.update_one(
-        {"id": transaction_id},
-        {"$set": {"status": TransactionStatus.COMPLETED}}
+@api_router.get("/export/nfts")
+async def export_nfts(
+    collection: Optional[str] = None,
+    status: Optional[NFTStatus] = None,
+    owner: Optional[str] = None,
+    creator: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    fields: Optional[str] = "all",
+    nfts_repo: NFTRepository = Depends(get_nft_repository)
+):
+    query = NFTFilter(
+        collection=collection, status=status, owner=owner, creator=creator,
+        min_price=min_price, max_price=max_price
+    )
+    field_names = parse_fields(fields, NFT, NFT_SUMMARY_FIELDS)
+    return export_response(nfts_repo.iterate(query, field_names, batch_size=EXPORT_BATCH_SIZE), "nfts")
+
+@api_router.get("/export/transactions")
+async def export_transactions(
+    status: Optional[TransactionStatus] = None,
+    nft_id: Optional[str] = None,
+    collection: Optional[str] = None,
+    buyer: Optional[str] = None,
+    seller: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[str] = "all",
+    transactions_repo: TransactionRepository = Depends(get_transaction_repository)
+):
+    query = TransactionFilter(
+        status=status, nft_id=nft_id, collection=collection, buyer=buyer, seller=seller,
+        since=since, until=until
+    )
+    field_names = parse_fields(fields, Transaction, Transaction.model_fields)
+    return export_response(transactions_repo.iterate(query, field_names, batch_size=EXPORT_BATCH_SIZE), "transactions")
+
+@api_router.get("/export/users")
+async def export_users(
+    verified: Optional[bool] = None,
+    fields: Optional[str] = "all",
+    users_repo: UserRepository = Depends(get_user_repository)
+):
+    field_names = parse_fields(fields, User, User.model_fields)
+    return export_response(users_repo.iterate(verified, field_names, batch_size=EXPORT_BATCH_SIZE), "users")
+
+@api_router.get("/export/collections")
+async def export_collections(
+    fields: Optional[str] = "all",
+    collections_repo: CollectionRepository = Depends(get_collection_repository)
+):
+    field_names = parse_fields(fields, Collection, COLLECTION_SUMMARY_FIELDS)
+    return export_response(collections_repo.iterate(field_names, batch_size=EXPORT_BATCH_SIZE), "collections")
+
+# Event Routes
+def nft_event(nft: NFT) -> Dict[str, Any]:
+    """The fields of a minted NFT that feed subscribers show"""
+    return nft.dict(include={"id", "name", "image", "price", "owner", "collection", "token_id", "status"})
+
+def parse_topics(collections: Optional[str]) -> Optional[List[str]]:
+    """Collection names from a comma separated query parameter; None follows everything"""
+    names = [name.strip() for name in (collections or "").split(",") if name.strip()]
+    return names or None
+
+@api_router.websocket("/events/ws")
+async def events_websocket(websocket: WebSocket, collections: Optional[str] = None):
+    """Marketplace events as JSON text frames, optionally for some collections only"""
+    await websocket.accept()
+    subscription = event_bus.subscribe(parse_topics(collections))
+
+    async def wait_for_disconnect():
+        # Clients send nothing; reading only notices when they go away
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            subscription.end(CLOSED)
+
+    reader = asyncio.create_task(wait_for_disconnect())
+    try:
+        while True:
+            payload = await subscription.get()
+            if payload is CLOSED:
+                break
+            if payload is DROPPED:
+                # 1013: try again later
+                await websocket.close(code=1013, reason="Too slow, events dropped")
+                break
+            await websocket.send_text(payload.decode())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        reader.cancel()
+        event_bus.unsubscribe(subscription)
+
+@api_router.get("/events/stream")
+async def events_stream(collections: Optional[str] = None):
+    """Marketplace events as server-sent events, optionally for some collections only"""
+    return EventStreamResponse(
+        sse_events(event_bus, parse_topics(collections), heartbeat=EVENT_HEARTBEAT),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
+# Admin Routes
+@api_router.get("/admin/indexes")
+async def get_index_usage(repos: Repositories = Depends(get_repositories)):
+    """Index usage counters, to spot indexes that never pay for themselves"""
+    return await repos.index_usage()
+
+@api_router.post("/admin/collections/recompute-stats")
+async def repair_collection_stats(collection: Optional[str] = None, repos: Repositories = Depends(get_repositories)):
+    """Rebuild floor price, volume and item count of one or every collection"""
+    if collection:
+        await update_collection_stats(collection)
+        return {"collections_updated": 1}
+    updated = await recompute_collection_stats(repos)
+    response_cache.invalidate("collections")
+    return {"collections_updated": updated}
+
+@api_router.get("/admin/counters")
+async def get_counter_metrics():
+    """Pending view/like deltas and flush latency of the write-behind buffer"""
+    return nft_counters.metrics()
+
+@api_router.get("/admin/activity")
+async def get_activity_metrics():
+    """Pending deltas and flush latency of the activity bucket buffer"""
+    return activity_counters.metrics()
+
+@api_router.get("/admin/cache")
+async def get_cache_metrics():
+    """Hit/miss/eviction counters of the response cache"""
+    return response_cache.metrics()
+
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(limit: int = 20, sort_by: str = "total_ms"):
+    """Slowest Mongo query shapes since startup, with their routes and plan flags"""
+    if sort_by not in ("total_ms", "max_ms", "count"):
+        raise HTTPException(status_code=400, detail="sort_by must be one of total_ms, max_ms, count")
+    return {**slow_queries.metrics(), "top": slow_queries.top(limit, sort_by)}
+
+@api_router.get("/admin/rarity")
+async def get_rarity_metrics():
+    """Collections waiting for a rarity rescore and rescore timings"""
+    return rarity_scorer.metrics()
+
+@api_router.post("/admin/rarity/rescore")
+async def rescore_rarity(collection: Optional[str] = None, repos: Repositories = Depends(get_repositories)):
+    """Recompute trait rarity, scores and ranks of one or every collection now"""
+    names = [collection] if collection else [doc["name"] for doc in await repos.collections.list(fields=["name"])]
+    scored = 0
+    for name in names:
+        scored += await rarity_scorer.rescore(name)
+    return {"collections_rescored": len(names), "nfts_scored": scored}
+
+@api_router.get("/admin/events")
+async def get_event_metrics():
+    """Event feed subscribers, deliveries and dropped slow consumers"""
+    return event_bus.metrics()
+
+@api_router.get("/admin/settlement")
+async def get_settlement_metrics():
+    """Settlement queue depth, outcomes and latency"""
+    return await settlement.metrics()
+
 # Initialize sample data
 @api_router.post("/init-sample-data")
-async def init_sample_data():
+async def init_sample_data(repos: Repositories = Depends(get_repositories)):
     """Initialize the marketplace with sample NFTs and collections"""
     
     # Sample NFT images (from vision expert)
@@ -394,13 +1219,14 @@ async def init_sample_data():
         {"name": "DigitalPortraits", "description": "AI-generated portrait collection"}
     ]
     
-    for coll in collections:
-        collection = Collection(
+    await repos.collections.insert_many([
+        Collection(
             name=coll["name"],
             description=coll["description"],
             creator="0x" + uuid.uuid4().hex[:40]
-        )
-        await db.collections.insert_one(collection.dict())
+        ).dict()
+        for coll in collections
+    ])
     
     # Create sample NFTs
     nft_data = [
@@ -414,29 +1240,35 @@ async def init_sample_data():
         {"name": "Neon Portal", "description": "3D rendered portal with neon effects", "price": 3.5, "collection": "Abstract3D"}
     ]
     
-    for i, nft in enumerate(nft_data):
-        image_base64 = await download_and_encode_image(sample_images[i])
-        
+    # Fetch all images concurrently
+    images = await download_images(sample_images[:len(nft_data)])
+    token_id_block = await token_ids.reserve(len(nft_data))
+    
+    nft_docs = []
+    for i, (nft, image, token_id) in enumerate(zip(nft_data, images, token_id_block)):
         nft_obj = NFT(
             name=nft["name"],
             description=nft["description"],
-            image=image_base64,
+            image=image,
             price=nft["price"],
             owner="0x" + uuid.uuid4().hex[:40],
             creator="0x" + uuid.uuid4().hex[:40],
             collection=nft["collection"],
-            token_id=i + 1,
+            token_id=token_id,
             traits=[
                 NFTTrait(trait_type="Rarity", value="Common" if i % 3 == 0 else "Rare"),
                 NFTTrait(trait_type="Style", value=nft["collection"])
             ]
         )
-        
-        await db.nfts.insert_one(nft_obj.dict())
+        nft_docs.append(nft_document(nft_obj))
     
-    # Update collection stats
+    await repos.nfts.insert_many(nft_docs)
+    
+    # Update collection stats and rarity
+    await recompute_collection_stats(repos, [coll["name"] for coll in collections])
     for coll in collections:
-        await update_collection_stats(coll["name"])
+        await rarity_scorer.rescore(coll["name"])
+    response_cache.invalidate("nfts", "collections")
     
     return {"message": "Sample data initialized successfully"}
 
@@ -449,8 +1281,18 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Outermost, so latency covers the other middleware too
+if METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware, telemetry=telemetry)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus text exposition of request and MongoDB command metrics"""
+    return Response(telemetry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -458,6 +1300,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    # Runs before the server starts accepting requests
+    await repositories.prepare()
+    slow_queries.start(client)
+    await token_ids.seed()
+    await nft_counters.start()
+    await activity_counters.start()
+    await marketplace_stats.start()
+    await activity_boards.start()
+    await settlement.start()
+    await event_bus.start()
+    await rarity_scorer.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await event_bus.stop()
+    await rarity_scorer.stop()
+    await settlement.stop()
+    await activity_boards.stop()
+    await marketplace_stats.stop()
+    await activity_counters.stop()
+    await nft_counters.stop()
+    await image_fetcher.aclose()
+    slow_queries.stop()
     client.close()
\ No newline at end of file
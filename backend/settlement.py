@@ -0,0 +1,247 @@
+"""Background settlement of marketplace transactions.
+
+``POST /api/transactions`` validates a purchase, stores the transaction as
+pending and enqueues a settlement job (``_id`` is the transaction id; the
+``settlement_jobs`` collection on Mongo). A pool of workers claims due jobs in batches and
+settles them:
+
+* a claim leases up to ``batch_size`` due jobs with one ``update_many``
+  (plus a read of the candidates and of the jobs it took);
+* ownership moves with one conditional update per NFT. It only applies
+  while the seller still has the NFT listed at the purchase price, so of
+  two competing purchases exactly one wins, and the loser is marked failed;
+* the batch's transactions move from pending to completed with one
+  ``update_many``, and the losers to failed with another. Each stamps a
+  marker that is read back to learn which transactions that call moved;
+* for the transactions this attempt completed, and only those, collection
+  volume and floor price get one ``record_sale`` per collection, and the
+  price history and activity rollups get one upsert per touched bucket.
+
+A claim is a lease: the job moves to "processing" and its ``run_at`` is
+pushed ``lease`` seconds ahead. A worker that dies mid-batch leaves jobs
+that become due again once the lease runs out. Errors requeue the jobs
+they hit, not the whole batch, with exponential backoff until
+``max_attempts``. After that the job fails, and so does its transaction
+unless an earlier attempt completed it; only then is the transfer undone.
+Every step is conditional on state already written, so a retried job
+cannot transfer an NFT or count a sale twice. A failure while recording
+a completed sale is logged, not retried.
+
+On Mongo the queue survives restarts. Each process wakes its
+own workers on enqueue, and the other processes pick jobs up on their
+next poll.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from activity import record_activity
+from collection_stats import record_sale
+from price_history import record_sales
+from repositories import Repositories
+
+
+logger = logging.getLogger(__name__)
+
+
+class SettlementQueue:
+    def __init__(
+        self,
+        repos: Repositories,
+        workers: int = 2,
+        batch_size: int = 50,
+        poll_interval: float = 0.5,
+        lease: float = 30.0,
+        max_attempts: int = 5,
+        retry_backoff: float = 1.0,
+        on_settled: Optional[Callable[[Iterable[Dict[str, Any]]], None]] = None,
+    ):
+        self.repos = repos
+        self.workers = max(workers, 1)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        # Called with the jobs whose NFTs changed hands in each batch
+        self.on_settled = on_settled
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stats = {
+            "batches": 0,
+            "settled": 0,
+            "rejected": 0,
+            "retried": 0,
+            "failed": 0,
+            "accounting_failures": 0,
+            "last_latency_ms": 0.0,
+            "max_latency_ms": 0.0,
+            "total_latency_ms": 0.0,
+        }
+
+    async def enqueue(self, transaction: Dict[str, Any], listed_price: Optional[float]):
+        """Queue a pending transaction for settlement"""
+        now = datetime.utcnow()
+        await self.repos.settlement_jobs.enqueue({
+            "_id": transaction["id"],
+            "nft_id": transaction["nft_id"],
+            "collection": transaction["collection"],
+            "buyer": transaction["buyer"],
+            "seller": transaction["seller"],
+            "price": transaction["price"],
+            "listed_price": listed_price,
+            "state": "queued",
+            "attempts": 0,
+            "run_at": now,
+            "created_at": now,
+        })
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def claim(self) -> List[Dict[str, Any]]:
+        """Lease up to batch_size due jobs"""
+        now = datetime.utcnow()
+        return await self.repos.settlement_jobs.claim_many(now, now + timedelta(seconds=self.lease), self.batch_size)
+
+    async def _transfer(self, job: Dict[str, Any]) -> bool:
+        """Move the NFT to the buyer; False when the seller no longer has it listed at the purchase price"""
+        return await self.repos.nfts.transfer(
+            job["nft_id"], job["seller"], job["buyer"], job["_id"], job.get("listed_price")
+        )
+
+    async def settle(self, jobs: List[Dict[str, Any]]):
+        """Settle a claimed batch; jobs that fail are requeued with backoff, the others finish"""
+        transferred = await asyncio.gather(*(self._transfer(job) for job in jobs), return_exceptions=True)
+        for job, result in zip(jobs, transferred):
+            if isinstance(result, Exception):
+                logger.error(f"Transfer for settlement job {job['_id']} failed: {result}")
+                await self._retry([job], str(result))
+        settled = [job for job, result in zip(jobs, transferred) if result is True]
+        rejected = [job for job, result in zip(jobs, transferred) if result is False]
+        done = settled + rejected
+        if not done:
+            return
+
+        now = datetime.utcnow()
+        try:
+            completed = await self.repos.transactions.complete_many([job["_id"] for job in settled], now) if settled else []
+            if rejected:
+                await self.repos.transactions.fail_many([job["_id"] for job in rejected], now)
+        except Exception as e:
+            logger.error(f"Settlement of {len(done)} transactions failed: {e}")
+            await self._retry(done, str(e))
+            return
+        # Only sales this call completed are counted, so a retried batch never counts one twice
+        completed_ids = set(completed)
+        sold = [job for job in settled if job["_id"] in completed_ids]
+        if sold:
+            try:
+                await self._record_sales(sold, now)
+            except Exception as e:
+                # Retrying would count them again; volume and price history can be rebuilt by migrations.py
+                self._stats["accounting_failures"] += 1
+                logger.error(f"Recording {len(sold)} sales failed: {e}")
+        try:
+            await self.repos.settlement_jobs.finish_many([job["_id"] for job in done], now)
+        except Exception as e:
+            logger.error(f"Finishing {len(done)} settlement jobs failed: {e}")
+            await self._retry(done, str(e))
+            return
+
+        self._stats["batches"] += 1
+        self._stats["settled"] += len(settled)
+        self._stats["rejected"] += len(rejected)
+        for job in settled:
+            latency_ms = (now - job["created_at"]).total_seconds() * 1000
+            self._stats["last_latency_ms"] = latency_ms
+            self._stats["max_latency_ms"] = max(self._stats["max_latency_ms"], latency_ms)
+            self._stats["total_latency_ms"] += latency_ms
+        if settled and self.on_settled is not None:
+            self.on_settled(settled)
+
+    async def _record_sales(self, jobs: List[Dict[str, Any]], sold_at: datetime):
+        """One volume and floor update per collection in the batch, then the price and activity rollups"""
+        sales: Dict[str, Dict[str, Any]] = {}
+        for job in jobs:
+            sale = sales.setdefault(job["collection"], {"volume": 0.0, "listed_price": None})
+            sale["volume"] += job["price"]
+            if job["listed_price"] is not None:
+                sale["listed_price"] = min(job["listed_price"], sale["listed_price"] or job["listed_price"])
+        await asyncio.gather(*(
+            record_sale(self.repos, name, sale["volume"], sale["listed_price"]) for name, sale in sales.items()
+        ))
+        await record_sales(self.repos, [(job["collection"], job["price"], sold_at) for job in jobs])
+        await record_activity(
+            self.repos, [(job["nft_id"], job["collection"], {"sales": 1, "volume": job["price"]}) for job in jobs], sold_at
+        )
+
+    async def _retry(self, jobs: List[Dict[str, Any]], error: str):
+        now = datetime.utcnow()
+        for job in jobs:
+            try:
+                if job["attempts"] >= self.max_attempts:
+                    await self.repos.settlement_jobs.fail(job["_id"], error, now)
+                    # A transaction completed by an earlier attempt stands, and so does its transfer
+                    if await self.repos.transactions.fail_many([job["_id"]]):
+                        # Undo the transfer if an earlier step got that far
+                        await self.repos.nfts.revert_transfer(job["nft_id"], job["seller"], job["_id"])
+                    self._stats["failed"] += 1
+                else:
+                    delay = self.retry_backoff * 2 ** (job["attempts"] - 1)
+                    await self.repos.settlement_jobs.requeue(job["_id"], now + timedelta(seconds=delay), error)
+                    self._stats["retried"] += 1
+            except Exception as e:
+                # The lease expires and the job is claimed again
+                logger.error(f"Could not requeue settlement job {job['_id']}: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                jobs = await self.claim()
+            except Exception as e:
+                logger.error(f"Settlement claim failed: {e}")
+                jobs = []
+            if jobs:
+                await self.settle(jobs)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self):
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers; claimed jobs are picked up again after their lease"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def metrics(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        counts, oldest = await asyncio.gather(
+            self.repos.settlement_jobs.count_by_state(),
+            self.repos.settlement_jobs.oldest_pending(),
+        )
+        queued, processing, failed = counts["queued"], counts["processing"], counts["failed"]
+        settled = self._stats["settled"]
+        return {
+            "queue_depth": queued + processing,
+            "queued": queued,
+            "processing": processing,
+            "failed_jobs": failed,
+            "oldest_pending_age_ms": (now - oldest).total_seconds() * 1000 if oldest else 0.0,
+            "workers": len(self._tasks),
+            **self._stats,
+            "avg_latency_ms": self._stats["total_latency_ms"] / settled if settled else 0.0,
+        }
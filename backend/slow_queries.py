@@ -0,0 +1,265 @@
+"""Slow MongoDB operation log with sampled explain plans.
+
+``SlowQueryLog`` is a pymongo command listener. A query command (find,
+aggregate, count, distinct, findAndModify, update, delete) that takes at
+least ``threshold_ms`` is logged with the route that issued it and its
+shape: the filter, sort and pipeline structure with every value replaced
+by "?". Field names, operators, sort directions and ``$field`` references
+are kept. Occurrences are aggregated per shape for the admin endpoint.
+
+The first slow occurrence of each shape, then a sample of later ones
+(``explain_rate``, at most once per shape per ``explain_interval``
+seconds), is re-run as ``explain`` with the queryPlanner verbosity on the
+event loop. The stages of the winning plan are stored on the shape. A plan
+scanning the whole collection (COLLSCAN) or sorting in memory (SORT) is
+flagged and logged as a warning.
+
+Only shapes seen since startup are kept, at most ``max_shapes`` of them.
+When full, the shape with the least total time makes room.
+"""
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from telemetry import current_route
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_COMMANDS = ("find", "aggregate", "count", "distinct", "findAndModify", "update", "delete")
+
+# Command fields that belong to the session or connection, not the operation
+SESSION_FIELDS = ("lsid", "txnNumber", "readConcern", "writeConcern", "autocommit", "startTransaction")
+
+PLAN_FLAGS = {"COLLSCAN": "collection_scan", "SORT": "in_memory_sort"}
+
+
+def redact(value: Any) -> Any:
+    """Structure of a filter or update with the values replaced by "?" """
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        # $or/$and branches and update pipelines are structure too
+        return [redact(item) for item in value]
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+
+def _redact_stage(stage: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: spec if name == "$sort" else redact(spec) for name, spec in stage.items()}
+
+
+def query_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """What distinguishes one kind of query from another, without its values"""
+    shape: Dict[str, Any] = {}
+    if command_name == "find":
+        shape["filter"] = redact(command.get("filter", {}))
+        if command.get("sort"):
+            shape["sort"] = dict(command["sort"])
+    elif command_name == "aggregate":
+        shape["pipeline"] = [_redact_stage(stage) for stage in command.get("pipeline", [])]
+    elif command_name in ("count", "distinct"):
+        shape["filter"] = redact(command.get("query", {}))
+        if command_name == "distinct":
+            shape["key"] = command.get("key")
+    elif command_name == "findAndModify":
+        shape["filter"] = redact(command.get("query", {}))
+        if command.get("sort"):
+            shape["sort"] = dict(command["sort"])
+        shape["update"] = redact(command.get("update", {}))
+    elif command_name == "update":
+        statements = command.get("updates") or [{}]
+        shape["filter"] = redact(statements[0].get("q", {}))
+        shape["update"] = redact(statements[0].get("u", {}))
+    elif command_name == "delete":
+        statements = command.get("deletes") or [{}]
+        shape["filter"] = redact(statements[0].get("q", {}))
+    return shape
+
+
+def plan_stages(explain: Any) -> List[str]:
+    """Stage names of every winning plan in an explain result, outermost first"""
+    stages: List[str] = []
+
+    def walk_plan(plan: Any):
+        if not isinstance(plan, dict):
+            return
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        # Newer servers nest the classic tree under queryPlan
+        for key in ("queryPlan", "inputStage"):
+            walk_plan(plan.get(key))
+        for child in plan.get("inputStages", []):
+            walk_plan(child)
+
+    def find_plans(value: Any):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key == "winningPlan":
+                    walk_plan(item)
+                else:
+                    find_plans(item)
+        elif isinstance(value, list):
+            for item in value:
+                find_plans(item)
+
+    find_plans(explain)
+    return stages
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(
+        self,
+        threshold_ms: float = 100.0,
+        explain_rate: float = 0.1,
+        explain_interval: float = 60.0,
+        max_shapes: int = 500,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self.explain_interval = explain_interval
+        self.max_shapes = max_shapes
+        self._client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Query commands in flight; finished events carry neither the command nor its route
+        self._pending: Dict[Tuple, Tuple[Dict[str, Any], str]] = {}
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"slow_operations": 0, "explains": 0, "explain_failures": 0}
+
+    def start(self, client):
+        """Enable explains, which run on the current event loop through ``client``"""
+        self._client = client
+        self._loop = asyncio.get_running_loop()
+
+    def stop(self):
+        self._client = None
+        self._loop = None
+
+    # Listener callbacks run on the thread that ran the command
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in QUERY_COMMANDS:
+            self._pending[(event.connection_id, event.request_id)] = (event.command, current_route())
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event)
+
+    def _finished(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+        command, route = pending
+        self.record(event.database_name, event.command_name, command, route, duration_ms)
+
+    def record(self, database: str, command_name: str, command: Dict[str, Any], route: str, duration_ms: float):
+        collection = command.get(command_name) if isinstance(command.get(command_name), str) else ""
+        shape = query_shape(command_name, command)
+        key = json.dumps([collection, command_name, shape], default=str)
+        logger.warning(
+            f"Slow {command_name} on {collection} from {route}: {duration_ms:.1f} ms, shape {json.dumps(shape, default=str)}"
+        )
+
+        now = time.monotonic()
+        with self._lock:
+            self._stats["slow_operations"] += 1
+            entry = self._shapes.get(key)
+            if entry is None:
+                if len(self._shapes) >= self.max_shapes:
+                    del self._shapes[min(self._shapes, key=lambda k: self._shapes[k]["total_ms"])]
+                entry = self._shapes[key] = {
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": {},
+                    "first_seen": datetime.utcnow(),
+                    "last_seen": None,
+                    "plan": None,
+                    "flags": [],
+                    "_explained_at": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["routes"][route] = entry["routes"].get(route, 0) + 1
+            entry["last_seen"] = datetime.utcnow()
+            explain = (
+                self._loop is not None
+                and (entry["_explained_at"] is None or now - entry["_explained_at"] >= self.explain_interval)
+                and (entry["_explained_at"] is None or random.random() < self.explain_rate)
+            )
+            if explain:
+                entry["_explained_at"] = now
+
+        if explain:
+            try:
+                asyncio.run_coroutine_threadsafe(self._explain(key, database, command_name, command), self._loop)
+            except RuntimeError:
+                # The loop is shutting down
+                pass
+
+    async def _explain(self, key: str, database: str, command_name: str, command: Dict[str, Any]):
+        explained = {
+            name: value for name, value in command.items()
+            if not name.startswith("$") and name not in SESSION_FIELDS
+        }
+        # Only single-statement writes can be explained
+        for statements in ("updates", "deletes"):
+            if statements in explained:
+                explained[statements] = explained[statements][:1]
+        try:
+            result = await self._client[database].command({"explain": explained, "verbosity": "queryPlanner"})
+        except Exception as e:
+            self._stats["explain_failures"] += 1
+            logger.error(f"Explain of slow {command_name} failed: {e}")
+            return
+        stages = plan_stages(result)
+        flags = sorted({PLAN_FLAGS[stage] for stage in stages if stage in PLAN_FLAGS})
+        with self._lock:
+            self._stats["explains"] += 1
+            entry = self._shapes.get(key)
+            if entry is not None:
+                entry["plan"] = stages
+                entry["flags"] = flags
+        if flags:
+            logger.warning(
+                f"Slow {command_name} on {command.get(command_name)} uses {', '.join(flags)}: plan {' <- '.join(stages)}"
+            )
+
+    def top(self, limit: int = 20, sort_by: str = "total_ms") -> List[Dict[str, Any]]:
+        """Slow shapes with the highest ``sort_by`` (total_ms, max_ms or count)"""
+        with self._lock:
+            entries = [
+                {name: value for name, value in entry.items() if not name.startswith("_")}
+                for entry in self._shapes.values()
+            ]
+        for entry in entries:
+            entry["avg_ms"] = entry["total_ms"] / entry["count"]
+            entry["routes"] = dict(sorted(entry["routes"].items(), key=lambda item: -item[1]))
+        entries.sort(key=lambda entry: entry[sort_by], reverse=True)
+        return entries[:limit]
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "explain_rate": self.explain_rate,
+            "shapes": len(self._shapes),
+            **self._stats,
+        }
@@ -0,0 +1,80 @@
+"""Computed documents materialized in the snapshot store.
+
+A ``SnapshotRefresher`` keeps the result of one ``compute`` callable under
+one snapshot key (the ``stats`` collection on Mongo). A background loop
+refreshes it every half ``max_staleness`` seconds. A read that finds it
+older than ``max_staleness`` (e.g. no worker has refreshed it yet)
+refreshes it first, so a response is never staler than the bound.
+Concurrent stale reads share one refresh.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from repositories import Repositories
+
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotRefresher:
+    def __init__(
+        self,
+        repos: Repositories,
+        key: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        max_staleness: float = 30.0,
+    ):
+        self.repos = repos
+        self.key = key
+        self.compute = compute
+        self.max_staleness = max_staleness
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> Dict[str, Any]:
+        """Recompute and store the snapshot"""
+        doc = {**await self.compute(), "refreshed_at": datetime.utcnow()}
+        await self.repos.snapshots.put(self.key, doc)
+        return doc
+
+    def _is_fresh(self, doc: Optional[Dict[str, Any]]) -> bool:
+        if not doc:
+            return False
+        return datetime.utcnow() - doc["refreshed_at"] <= timedelta(seconds=self.max_staleness)
+
+    async def get(self) -> Dict[str, Any]:
+        """Current snapshot, refreshed first if older than max_staleness"""
+        doc = await self.repos.snapshots.get(self.key)
+        if self._is_fresh(doc):
+            return doc
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Another request may have refreshed while this one waited
+            doc = await self.repos.snapshots.get(self.key)
+            if self._is_fresh(doc):
+                return doc
+            return await self.refresh()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Refresh of snapshot {self.key} failed: {e}")
+            await asyncio.sleep(self.max_staleness / 2)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,275 @@
+"""Request and MongoDB command metrics in the Prometheus text format.
+
+``RequestMetricsMiddleware`` times every HTTP request and records its
+status and request/response body sizes per route template (``/api/nfts/{nft_id}``,
+never the raw path, so label cardinality stays bounded). ``CommandMetrics``
+is a pymongo command listener. It counts and times every command per
+collection and command name, and attributes it to the request that issued
+it through a context variable. Motor copies the context into its executor
+threads, so each route gets the number of commands one request issues.
+
+Recording costs two clock reads and a few dictionary updates under a lock
+per request or command, and memory is bounded by the number of label
+combinations. It is meant to stay on in production. ``render`` produces
+the ``/metrics`` payload.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import monitoring
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# Route label for commands issued outside any request (settlement, counter flushes, startup)
+BACKGROUND_ROUTE = "background"
+# Route label for requests that matched no route
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: Tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: a count per bucket (the last one is +Inf), sum and count
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        # bisect_left puts a value equal to a bound in that bucket (le is inclusive)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(state[0]), state[1], state[2])) for labels, state in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class RequestStats:
+    """What one request did, filled in while it runs"""
+
+    __slots__ = ("scope", "status", "request_bytes", "response_bytes", "commands")
+
+    def __init__(self, scope: Dict):
+        self.scope = scope
+        self.status = 500
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.commands: Dict[Tuple[str, str], int] = {}
+
+    @property
+    def route(self) -> str:
+        # Routing stores the matched route in the scope before the endpoint runs
+        return getattr(self.scope.get("route"), "path", None) or UNMATCHED_ROUTE
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def current_route() -> str:
+    """Route template of the request being served, or BACKGROUND_ROUTE"""
+    stats = current_request.get()
+    return stats.route if stats is not None else BACKGROUND_ROUTE
+
+
+class Telemetry:
+    def __init__(self):
+        self.requests = Counter(
+            "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+        )
+        self.in_progress = Gauge(
+            "http_requests_in_progress", "HTTP requests being served", ("method",)
+        )
+        self.latency = Histogram(
+            "http_request_duration_seconds", "Time to serve a request, body included", ("method", "route")
+        )
+        self.request_size = Histogram(
+            "http_request_size_bytes", "Request body size", ("method", "route"), SIZE_BUCKETS
+        )
+        self.response_size = Histogram(
+            "http_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS
+        )
+        self.request_commands = Histogram(
+            "http_request_mongodb_commands", "MongoDB commands issued while serving one request",
+            ("method", "route"), COMMAND_COUNT_BUCKETS
+        )
+        self.commands = Counter(
+            "mongodb_commands_total", "MongoDB commands by collection and command", ("collection", "command")
+        )
+        self.command_failures = Counter(
+            "mongodb_command_failures_total", "Failed MongoDB commands by collection and command", ("collection", "command")
+        )
+        self.command_latency = Histogram(
+            "mongodb_command_duration_seconds", "MongoDB command round trip time", ("collection", "command")
+        )
+        self.route_commands = Counter(
+            "mongodb_route_commands_total", "MongoDB commands by the route that issued them",
+            ("route", "collection", "command")
+        )
+        # Guards per-request command counts, updated from Motor's executor threads
+        self._request_lock = threading.Lock()
+        self.metrics = [
+            self.requests, self.in_progress, self.latency, self.request_size, self.response_size,
+            self.request_commands, self.commands, self.command_failures, self.command_latency, self.route_commands,
+        ]
+
+    def observe_request(self, method: str, route: str, stats: RequestStats, seconds: float):
+        labels = (method, route)
+        self.requests.inc((method, route, stats.status))
+        self.latency.observe(labels, seconds)
+        self.request_size.observe(labels, stats.request_bytes)
+        self.response_size.observe(labels, stats.response_bytes)
+        self.request_commands.observe(labels, sum(stats.commands.values()))
+        for (collection, command), count in stats.commands.items():
+            self.route_commands.inc((route, collection, command), count)
+
+    def observe_command(self, collection: str, command: str, seconds: float, failed: bool = False):
+        labels = (collection, command)
+        self.commands.inc(labels)
+        self.command_latency.observe(labels, seconds)
+        if failed:
+            self.command_failures.inc(labels)
+        stats = current_request.get()
+        if stats is None:
+            self.route_commands.inc((BACKGROUND_ROUTE, collection, command))
+        else:
+            with self._request_lock:
+                stats.commands[labels] = stats.commands.get(labels, 0) + 1
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """pymongo listener feeding command counts and durations into ``telemetry``"""
+
+    def __init__(self, telemetry: Telemetry):
+        self.telemetry = telemetry
+        # Collection of each in-flight command; finished events do not carry it
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def _finished(self, event, failed: bool):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        self.telemetry.observe_command(collection, event.command_name, event.duration_micros / 1e6, failed)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event, failed=True)
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording latency, status and body sizes per route"""
+
+    def __init__(self, app, telemetry: Telemetry):
+        self.app = app
+        self.telemetry = telemetry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        method = scope["method"]
+        self.telemetry.in_progress.inc((method,))
+        started = time.perf_counter()
+
+        async def receive_counting():
+            message = await receive()
+            if message["type"] == "http.request":
+                stats.request_bytes += len(message.get("body", b""))
+            return message
+
+        async def send_counting(message):
+            if message["type"] == "http.response.start":
+                stats.status = message["status"]
+            elif message["type"] == "http.response.body":
+                stats.response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counting, send_counting)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            self.telemetry.in_progress.dec((method,))
+            self.telemetry.observe_request(method, stats.route, stats, elapsed)
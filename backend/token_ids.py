@@ -0,0 +1,48 @@
+"""Atomic NFT token id allocation.
+
+Ids come from the ``nft_token_id`` sequence, advanced atomically (a
+``counters`` document bumped with ``find_one_and_update`` + ``$inc`` on
+Mongo), so concurrent mints can never receive the same id. A process may reserve a block of ids in one round trip and hand them
+out locally (``block_size``). Bulk mints and imports reserve exactly the
+block they need. Ids stay unique, but across workers they are no longer
+strictly in mint order, and unused ids in a block are lost on restart.
+
+The unique ``token_id`` index on nfts (a unique check in the memory engine)
+is the final guarantee against duplicates.
+"""
+import asyncio
+from typing import Optional
+
+from repositories import NFTRepository, SequenceRepository
+
+
+class TokenIdAllocator:
+    def __init__(self, nfts: NFTRepository, sequences: SequenceRepository, name: str = "nft_token_id", block_size: int = 1):
+        self.nfts = nfts
+        self.sequences = sequences
+        self.name = name
+        self.block_size = max(block_size, 1)
+        self._next = 0
+        self._end = 0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def seed(self):
+        """Make sure the counter is at least the highest token id in use"""
+        await self.sequences.raise_to(self.name, await self.nfts.max_token_id())
+
+    async def reserve(self, count: int) -> range:
+        """Reserve ``count`` consecutive ids in one round trip"""
+        end = await self.sequences.advance(self.name, count)
+        return range(end - count + 1, end + 1)
+
+    async def next(self) -> int:
+        """Next id, drawn from this worker's current block"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._next >= self._end:
+                block = await self.reserve(self.block_size)
+                self._next, self._end = block.start, block.stop
+            token_id = self._next
+            self._next += 1
+            return token_id
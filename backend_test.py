@@ -92,9 +92,9 @@ class NFTMarketplaceTests(unittest.TestCase):
         self.assertTrue(len(nfts) > 0)
         print(f"✅ Retrieved {len(nfts)} NFTs successfully")
         
-        # Verify NFT structure
+        # Verify NFT summary structure
         nft = nfts[0]
-        required_fields = ["id", "name", "description", "image", "price", "owner", 
+        required_fields = ["id", "name", "image", "price", "owner", 
                           "creator", "collection", "token_id", "status"]
         for field in required_fields:
             self.assertIn(field, nft)
@@ -243,7 +243,7 @@ class NFTMarketplaceTests(unittest.TestCase):
         
         # Verify collection structure
         collection = collections[0]
-        required_fields = ["id", "name", "description", "creator", "floor_price", "volume", "items_count"]
+        required_fields = ["id", "name", "creator", "floor_price", "volume", "items_count"]
         for field in required_fields:
             self.assertIn(field, collection)
         print("✅ Collection data structure is correct")
@@ -324,8 +324,19 @@ class NFTMarketplaceTests(unittest.TestCase):
         self.assertEqual(new_transaction["price"], transaction_data["price"])
         print(f"✅ Created new transaction for NFT: {self.test_nft['name']} (ID: {self.test_nft['id']})")
         
+        # Settlement is asynchronous; wait for the transaction to complete
+        deadline = time.monotonic() + 30
+        while True:
+            response = requests.get(f"{BASE_URL}/transactions")
+            self.assertEqual(response.status_code, 200)
+            status = next((t["status"] for t in response.json() if t["id"] == new_transaction["id"]), None)
+            if status != TransactionStatus.PENDING or time.monotonic() > deadline:
+                break
+            time.sleep(0.2)
+        self.assertEqual(status, TransactionStatus.COMPLETED)
+        print("✅ Transaction settled")
+
         # Verify NFT ownership and status updated
-        time.sleep(1)  # Wait for transaction to complete
         response = requests.get(f"{BASE_URL}/nfts/{self.test_nft['id']}")
         updated_nft = response.json()
         self.assertEqual(updated_nft["owner"], transaction_data["buyer"])
@@ -339,7 +350,7 @@ class NFTMarketplaceTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         stats = response.json()
         
-        required_fields = ["total_nfts", "total_users", "total_collections", "total_volume", "active_listings"]
+        required_fields = ["total_nfts", "total_users", "total_collections", "total_volume", "active_listings", "as_of"]
         for field in required_fields:
             self.assertIn(field, stats)
         
@@ -355,22 +366,422 @@ class NFTMarketplaceTests(unittest.TestCase):
         print(f"   - Active Listings: {stats['active_listings']}")
     
     def test_16_image_processing(self):
-        """Test image processing and base64 encoding"""
+        """Test image storage and the blob serving endpoint"""
         print("\n=== Testing Image Processing ===")
         if not hasattr(self, 'test_nft'):
             self.fail("No test NFT available")
         
-        # Verify image is base64 encoded
-        self.assertTrue(len(self.test_nft["image"]) > 0)
-        
-        # Try to decode the base64 image
-        try:
-            import base64
-            image_data = base64.b64decode(self.test_nft["image"])
-            self.assertTrue(len(image_data) > 0)
-            print(f"✅ Image is properly base64 encoded ({len(image_data)} bytes)")
-        except Exception as e:
-            self.fail(f"Failed to decode base64 image: {e}")
+        # Verify the NFT references a stored blob instead of inline data
+        image = self.test_nft["image"]
+        self.assertTrue(image.startswith("/api/images/"))
+        image_url = BASE_URL[:-len("/api")] + image
+        
+        response = requests.get(image_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(len(response.content) > 0)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertEqual(response.headers["X-Content-Type-Options"], "nosniff")
+        self.assertIn("sandbox", response.headers["Content-Security-Policy"])
+        etag = response.headers["ETag"]
+        print(f"✅ Image served from blob store ({len(response.content)} bytes)")
+        
+        # Conditional request
+        response = requests.get(image_url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        print("✅ 304 response for matching ETag")
+        
+        # Range request
+        response = requests.get(image_url, headers={"Range": "bytes=0-9"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(len(response.content), 10)
+        print("✅ 206 response for byte range")
+
+    def test_17_cursor_pagination(self):
+        """Test keyset pagination with next cursors"""
+        print("\n=== Testing GET /nfts cursor pagination ===")
+        for sort_by in ["created_at", "price", "likes", "views"]:
+            expected = requests.get(f"{BASE_URL}/nfts?limit=1000&sort_by={sort_by}").json()
+            seen = []
+            params = {"limit": 3, "sort_by": sort_by}
+            while True:
+                response = requests.get(f"{BASE_URL}/nfts", params=params)
+                self.assertEqual(response.status_code, 200)
+                seen += [nft["id"] for nft in response.json()]
+                next_cursor = response.headers.get("X-Next-Cursor")
+                if not next_cursor:
+                    break
+                params["cursor"] = next_cursor
+            self.assertEqual(seen, [nft["id"] for nft in expected])
+            print(f"✅ Cursor pages by {sort_by} match the full listing ({len(seen)} NFTs)")
+        
+        # Malformed cursor
+        response = requests.get(f"{BASE_URL}/nfts?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 400)
+        print("✅ 400 response for malformed cursor")
+
+    def test_18_index_usage(self):
+        """Test the index usage admin endpoint"""
+        print("\n=== Testing GET /admin/indexes ===")
+        response = requests.get(f"{BASE_URL}/admin/indexes")
+        self.assertEqual(response.status_code, 200)
+        indexes = response.json()
+        names = {(index["collection"], index["name"]) for index in indexes}
+        for collection in ["nfts", "users", "collections", "transactions"]:
+            self.assertIn((collection, "id_unique"), names)
+        self.assertFalse(any(index.get("missing") for index in indexes))
+        print(f"✅ {len(indexes)} indexes reported, none missing")
+
+    def test_19_relevance_search(self):
+        """Test token search with prefix matching and relevance ranking"""
+        print("\n=== Testing NFT search relevance ===")
+        response = requests.get(f"{BASE_URL}/nfts", params={"search": "abstr", "sort_by": "relevance"})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertTrue(len(results) > 0)
+        for nft in results:
+            text = f"{nft['name']} {nft['description']} {nft['collection']}".lower()
+            self.assertIn("abstr", text)
+        print(f"✅ Prefix search 'abstr' returned {len(results)} ranked results")
+        
+        # Regex metacharacters are treated as plain text
+        response = requests.get(f"{BASE_URL}/nfts", params={"search": "(.*)"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        print("✅ Regex metacharacters do not match everything")
+        
+        # Relevance needs a search term
+        response = requests.get(f"{BASE_URL}/nfts", params={"sort_by": "relevance"})
+        self.assertEqual(response.status_code, 400)
+        print("✅ 400 response for relevance sort without search")
+
+    def test_20_sparse_fieldsets(self):
+        """Test fields= projections on list endpoints"""
+        print("\n=== Testing sparse fieldsets ===")
+        response = requests.get(f"{BASE_URL}/nfts?fields=name,price")
+        self.assertEqual(response.status_code, 200)
+        for nft in response.json():
+            self.assertEqual(set(nft), {"id", "name", "price"})
+        print("✅ fields=name,price returns only the requested fields")
+        
+        response = requests.get(f"{BASE_URL}/nfts?fields=all")
+        self.assertEqual(response.status_code, 200)
+        nft = response.json()[0]
+        for field in ["description", "traits", "contract_address"]:
+            self.assertIn(field, nft)
+        print("✅ fields=all returns full NFT documents")
+        
+        # Summary listings leave detail-only fields out
+        response = requests.get(f"{BASE_URL}/nfts")
+        self.assertNotIn("traits", response.json()[0])
+        response = requests.get(f"{BASE_URL}/collections")
+        self.assertNotIn("description", response.json()[0])
+        print("✅ Default listings use the summary shape")
+        
+        response = requests.get(f"{BASE_URL}/nfts?fields=not_a_field")
+        self.assertEqual(response.status_code, 400)
+        print("✅ 400 response for unknown field")
+
+    def test_21_counter_buffer(self):
+        """Test buffered view/like counters and their metrics"""
+        print("\n=== Testing write-behind counters ===")
+        nft_id = self.nfts[0]["id"]
+        before = requests.get(f"{BASE_URL}/nfts/{nft_id}").json()
+        for _ in range(3):
+            response = requests.post(f"{BASE_URL}/nfts/{nft_id}/like")
+            self.assertEqual(response.status_code, 200)
+        after = requests.get(f"{BASE_URL}/nfts/{nft_id}").json()
+        self.assertEqual(after["likes"], before["likes"] + 3)
+        self.assertEqual(after["views"], before["views"] + 1)
+        print("✅ Likes and views reflect buffered increments immediately")
+        
+        response = requests.post(f"{BASE_URL}/nfts/nonexistent-id/like")
+        self.assertEqual(response.status_code, 404)
+        
+        response = requests.get(f"{BASE_URL}/admin/counters")
+        self.assertEqual(response.status_code, 200)
+        metrics = response.json()
+        for field in ["pending_documents", "pending_increments", "flushes", "last_flush_ms"]:
+            self.assertIn(field, metrics)
+        print(f"✅ Counter metrics: {metrics['flushes']} flushes, {metrics['pending_increments']} pending")
+
+    def test_22_incremental_collection_stats(self):
+        """Test floor price maintenance on list/unlist and the repair job"""
+        print("\n=== Testing incremental collection stats ===")
+        collection = self.collections[0]
+        nft_data = {
+            "name": "Floor Test NFT",
+            "description": "Created during API testing",
+            "image_url": "https://images.unsplash.com/photo-1635377090186-036bca445c6b",
+            "price": 0.001,
+            "collection": collection["name"]
+        }
+        nft = requests.post(f"{BASE_URL}/nfts", json=nft_data).json()
+        stats = requests.get(f"{BASE_URL}/collections/{collection['id']}").json()
+        self.assertEqual(stats["floor_price"], 0.001)
+        print("✅ Minting a cheaper NFT lowered the floor price")
+        
+        response = requests.post(f"{BASE_URL}/nfts/{nft['id']}/unlist")
+        self.assertEqual(response.status_code, 200)
+        stats = requests.get(f"{BASE_URL}/collections/{collection['id']}").json()
+        self.assertTrue(stats["floor_price"] > 0.001 or stats["floor_price"] == 0)
+        print(f"✅ Unlisting the floor NFT moved the floor to {stats['floor_price']}")
+        
+        response = requests.post(f"{BASE_URL}/nfts/{nft['id']}/unlist")
+        self.assertEqual(response.status_code, 409)
+        
+        response = requests.post(f"{BASE_URL}/nfts/{nft['id']}/list", json={"price": 0.002})
+        self.assertEqual(response.status_code, 200)
+        stats = requests.get(f"{BASE_URL}/collections/{collection['id']}").json()
+        self.assertEqual(stats["floor_price"], 0.002)
+        print("✅ Relisting updated the floor price")
+        
+        response = requests.post(f"{BASE_URL}/admin/collections/recompute-stats")
+        self.assertEqual(response.status_code, 200)
+        repaired = requests.get(f"{BASE_URL}/collections/{collection['id']}").json()
+        self.assertEqual(repaired["floor_price"], stats["floor_price"])
+        self.assertEqual(repaired["items_count"], stats["items_count"])
+        print("✅ Full recompute agrees with the incremental stats")
+
+    def test_23_unique_token_ids(self):
+        """Test concurrent mints receive distinct token ids"""
+        print("\n=== Testing concurrent token id allocation ===")
+        from concurrent.futures import ThreadPoolExecutor
+        nft_data = {
+            "name": "Concurrent Mint",
+            "description": "Created during API testing",
+            "image_url": "https://images.unsplash.com/photo-1635377090186-036bca445c6b",
+            "price": 1.0,
+            "collection": self.collections[0]["name"]
+        }
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            responses = list(pool.map(lambda _: requests.post(f"{BASE_URL}/nfts", json=nft_data), range(5)))
+        token_ids = [response.json()["token_id"] for response in responses]
+        self.assertEqual(len(set(token_ids)), len(token_ids))
+        print(f"✅ Concurrent mints got distinct token ids: {sorted(token_ids)}")
+
+    def test_24_response_cache(self):
+        """Test cached listings are invalidated by writes"""
+        print("\n=== Testing response cache ===")
+        before = requests.get(f"{BASE_URL}/admin/cache").json()
+        requests.get(f"{BASE_URL}/collections")
+        requests.get(f"{BASE_URL}/collections")
+        after = requests.get(f"{BASE_URL}/admin/cache").json()
+        self.assertTrue(after["hits"] > before["hits"])
+        print(f"✅ Repeated listing served from cache (hit ratio {after['hit_ratio']})")
+        
+        # A new collection must show up immediately despite the cache
+        collection_data = {"name": "Cache Test Collection", "description": "Created during API testing"}
+        new_collection = requests.post(f"{BASE_URL}/collections", json=collection_data).json()
+        ids = [collection["id"] for collection in requests.get(f"{BASE_URL}/collections").json()]
+        self.assertIn(new_collection["id"], ids)
+        print("✅ Creating a collection invalidated the cached listing")
+
+    def test_25_read_responses(self):
+        """Test list endpoints return stored documents without Mongo ids"""
+        print("\n=== Testing read response serialization ===")
+        for path in ("transactions", "users", "collections"):
+            response = requests.get(f"{BASE_URL}/{path}")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.headers["content-type"].startswith("application/json"))
+            for row in response.json():
+                self.assertNotIn("_id", row)
+            print(f"✅ /{path} returned {len(response.json())} rows without _id")
+
+    def test_26_ndjson_export(self):
+        """Test streaming NDJSON exports"""
+        print("\n=== Testing NDJSON export ===")
+        response = requests.get(f"{BASE_URL}/export/nfts", params={"status": "listed"}, stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+        rows = [json.loads(line) for line in response.iter_lines() if line]
+        self.assertTrue(all(row["status"] == "listed" for row in rows))
+        self.assertTrue(all("_id" not in row for row in rows))
+        print(f"✅ Exported {len(rows)} listed NFTs")
+        
+        response = requests.get(f"{BASE_URL}/export/transactions", params={"fields": "price"})
+        for line in response.text.splitlines():
+            self.assertEqual(set(json.loads(line)), {"id", "price"})
+        print("✅ Transaction export honours the projection")
+
+    def test_27_batch_endpoints(self):
+        """Test batch mint and batch get"""
+        print("\n=== Testing batch NFT endpoints ===")
+        items = [{
+            "name": f"Batch NFT {i}",
+            "description": "Created during API testing",
+            "image_url": "https://images.unsplash.com/photo-1635377090186-036bca445c6b",
+            "price": 1.0 + i,
+            "collection": self.collections[0]["name"]
+        } for i in range(3)]
+        response = requests.post(f"{BASE_URL}/nfts/batch", json=items)
+        self.assertEqual(response.status_code, 200)
+        minted = response.json()
+        self.assertEqual([nft["name"] for nft in minted], [item["name"] for item in items])
+        self.assertEqual(len({nft["token_id"] for nft in minted}), 3)
+        print(f"✅ Minted {len(minted)} NFTs in one request")
+        
+        ids = [minted[2]["id"], "does-not-exist", minted[0]["id"]]
+        response = requests.post(f"{BASE_URL}/nfts/batch-get", json={"ids": ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([nft["id"] for nft in response.json()], [minted[2]["id"], minted[0]["id"]])
+        print("✅ Batch get preserved request order and skipped unknown ids")
+        
+        response = requests.post(f"{BASE_URL}/nfts/batch", json=[{**items[0], "collection": "No Such Collection"}])
+        self.assertEqual(response.status_code, 404)
+        print("✅ Batch mint rejected an unknown collection")
+
+    def test_28_settlement_queue(self):
+        """Test purchase validation and settlement metrics"""
+        print("\n=== Testing settlement queue ===")
+        nft = self.nfts[0]
+        transaction_data = {
+            "nft_id": nft["id"],
+            "buyer": "0x" + "2" * 40,
+            "seller": "0x" + "3" * 40,  # Not the owner
+            "price": nft["price"]
+        }
+        response = requests.post(f"{BASE_URL}/transactions", json=transaction_data)
+        self.assertEqual(response.status_code, 400)
+        print("✅ Purchase from a non-owner rejected")
+        
+        response = requests.get(f"{BASE_URL}/admin/settlement")
+        self.assertEqual(response.status_code, 200)
+        metrics = response.json()
+        for field in ["queue_depth", "settled", "failed", "avg_latency_ms"]:
+            self.assertIn(field, metrics)
+        print(f"✅ Settlement metrics: depth {metrics['queue_depth']}, avg latency {metrics['avg_latency_ms']:.1f} ms")
+
+    def test_29_metrics_endpoint(self):
+        """Test the Prometheus metrics endpoint"""
+        print("\n=== Testing metrics endpoint ===")
+        requests.get(f"{BASE_URL}/nfts")
+        response = requests.get(f"{BASE_URL.rsplit('/api', 1)[0]}/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn("# TYPE http_request_duration_seconds histogram", response.text)
+        self.assertIn('route="/api/nfts"', response.text)
+        self.assertIn("mongodb_commands_total", response.text)
+        print("✅ Request and MongoDB command metrics exposed")
+
+    def test_30_slow_queries(self):
+        """Test the slow query shapes endpoint"""
+        print("\n=== Testing slow query log ===")
+        response = requests.get(f"{BASE_URL}/admin/slow-queries", params={"limit": 5})
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        for field in ["threshold_ms", "slow_operations", "top"]:
+            self.assertIn(field, report)
+        self.assertLessEqual(len(report["top"]), 5)
+        for entry in report["top"]:
+            for field in ["collection", "command", "shape", "count", "avg_ms", "routes", "flags"]:
+                self.assertIn(field, entry)
+        
+        response = requests.get(f"{BASE_URL}/admin/slow-queries", params={"sort_by": "name"})
+        self.assertEqual(response.status_code, 400)
+        print(f"✅ {report['slow_operations']} slow operations over {report['threshold_ms']} ms in {len(report['top'])} shapes")
+
+    def test_31_event_stream(self):
+        """Test the server-sent event feed and its metrics"""
+        print("\n=== Testing event stream ===")
+        with requests.get(f"{BASE_URL}/events/stream", params={"collections": "Digital Dreams"}, stream=True, timeout=10) as response:
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+            first = next(response.iter_lines())
+            self.assertEqual(first, b": connected")
+        
+        response = requests.get(f"{BASE_URL}/admin/events")
+        self.assertEqual(response.status_code, 200)
+        metrics = response.json()
+        for field in ["subscribers", "published", "delivered", "dropped_subscribers"]:
+            self.assertIn(field, metrics)
+        print(f"✅ {metrics['subscribers']} subscribers, {metrics['published']} events published")
+
+    def test_32_price_history(self):
+        """Test collection price history buckets"""
+        print("\n=== Testing price history ===")
+        collections = requests.get(f"{BASE_URL}/collections").json()
+        self.assertGreater(len(collections), 0)
+        collection_id = collections[0]["id"]
+        
+        for interval in ["1h", "1d", "1w"]:
+            response = requests.get(f"{BASE_URL}/collections/{collection_id}/price-history", params={"interval": interval})
+            self.assertEqual(response.status_code, 200)
+            buckets = response.json()
+            starts = [bucket["start"] for bucket in buckets]
+            self.assertEqual(starts, sorted(starts))
+            for bucket in buckets:
+                self.assertLessEqual(bucket["low"], min(bucket["open"], bucket["close"]))
+                self.assertGreaterEqual(bucket["high"], max(bucket["open"], bucket["close"]))
+                self.assertGreater(bucket["count"], 0)
+        
+        response = requests.get(f"{BASE_URL}/collections/{collection_id}/price-history", params={"interval": "5m"})
+        self.assertEqual(response.status_code, 400)
+        print(f"✅ {len(buckets)} weekly buckets for {collections[0]['name']}")
+
+    def test_33_rarity_sort(self):
+        """Test rarity scores and rarity-sorted listings"""
+        print("\n=== Testing rarity sort ===")
+        response = requests.get(f"{BASE_URL}/nfts", params={"sort_by": "rarity", "limit": 10, "fields": "id,rarity_score,rarity_rank,traits"})
+        self.assertEqual(response.status_code, 200)
+        nfts = response.json()
+        scores = [nft["rarity_score"] for nft in nfts if nft.get("rarity_score") is not None]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        for nft in nfts:
+            for trait in nft.get("traits", []):
+                if trait.get("rarity") is not None:
+                    self.assertGreater(trait["rarity"], 0)
+                    self.assertLessEqual(trait["rarity"], 1)
+        
+        response = requests.post(f"{BASE_URL}/admin/rarity/rescore")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("nfts_scored", response.json())
+        print(f"✅ {len(nfts)} NFTs sorted by rarity, top score {scores[0] if scores else None}")
+
+    def test_34_trait_facets(self):
+        """Test trait filters and trait facets"""
+        print("\n=== Testing trait facets ===")
+        response = requests.get(f"{BASE_URL}/nfts/facets")
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()
+        self.assertIn("total", facets)
+        self.assertIsInstance(facets["traits"], list)
+        if facets["traits"] and facets["traits"][0]["values"]:
+            trait_type = facets["traits"][0]["trait_type"]
+            top = facets["traits"][0]["values"][0]
+            selected = f"{trait_type}:{top['value']}"
+            response = requests.get(f"{BASE_URL}/nfts", params={"traits": selected, "limit": 100, "fields": "id,traits"})
+            self.assertEqual(response.status_code, 200)
+            nfts = response.json()
+            self.assertEqual(len(nfts), min(top["count"], 100))
+            for nft in nfts:
+                self.assertIn((trait_type, top["value"]), [(t["trait_type"], t["value"]) for t in nft["traits"]])
+            response = requests.get(f"{BASE_URL}/nfts/facets", params={"traits": selected})
+            self.assertEqual(response.json()["total"], top["count"])
+        
+        response = requests.get(f"{BASE_URL}/nfts", params={"traits": "no-separator"})
+        self.assertEqual(response.status_code, 400)
+        print(f"✅ {len(facets['traits'])} trait types faceted over {facets['total']} NFTs")
+
+    def test_35_trending_and_leaderboard(self):
+        """Test trending NFTs and collection leaderboards"""
+        print("\n=== Testing trending and leaderboards ===")
+        for window in ("1h", "24h", "7d"):
+            response = requests.get(f"{BASE_URL}/trending/nfts", params={"window": window, "limit": 5})
+            self.assertEqual(response.status_code, 200)
+            trending = response.json()
+            self.assertEqual(trending["window"], window)
+            self.assertLessEqual(len(trending["nfts"]), 5)
+            scores = [nft["score"] for nft in trending["nfts"]]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            
+            response = requests.get(f"{BASE_URL}/leaderboard/collections", params={"window": window})
+            self.assertEqual(response.status_code, 200)
+            volumes = [collection["volume"] for collection in response.json()["collections"]]
+            self.assertEqual(volumes, sorted(volumes, reverse=True))
+        
+        response = requests.get(f"{BASE_URL}/leaderboard/collections", params={"window": "30d"})
+        self.assertEqual(response.status_code, 400)
+        print(f"✅ Trending and leaderboards served for every window")
 
 def run_tests():
     """Run all tests"""
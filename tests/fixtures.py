@@ -0,0 +1,43 @@
+"""Shared memory-engine catalog for the test modules"""
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from memory_repositories import MemoryRepositories
+from search import search_fields
+
+NOW = datetime(2024, 1, 1)
+
+
+def nft(i: int, **fields) -> dict:
+    doc = {
+        "id": f"nft-{i:03d}",
+        "name": f"Token {i}",
+        "description": "Test NFT",
+        "collection": "A" if i % 2 else "B",
+        "status": "listed",
+        "owner": "alice",
+        "creator": "carol",
+        "price": float(i % 5 + 1),
+        "likes": 0,
+        "views": 0,
+        "token_id": i + 1,
+        "created_at": NOW - timedelta(minutes=i),
+    }
+    doc.update(fields)
+    return {**doc, **search_fields(doc["name"], doc["description"], doc["collection"])}
+
+
+class CatalogTestCase(unittest.IsolatedAsyncioTestCase):
+    """Memory repositories holding 30 listed NFTs split between collections A and B"""
+
+    async def asyncSetUp(self):
+        self.repos = MemoryRepositories()
+        await self.repos.nfts.insert_many([nft(i) for i in range(30)])
+        await self.repos.collections.insert_many([
+            {"id": "col-a", "name": "A", "floor_price": 0.0, "volume": 0.0, "items_count": 0},
+            {"id": "col-b", "name": "B", "floor_price": 0.0, "volume": 0.0, "items_count": 0},
+        ])
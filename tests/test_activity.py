@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""Tests for activity windows, trending NFTs and leaderboards on the memory engine"""
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from activity import ActivityBoards, ActivityRecorder, record_activity
+from tests.fixtures import CatalogTestCase
+
+
+class ActivityTests(CatalogTestCase):
+    """Windowed totals and the boards built from them"""
+
+    async def test_activity_windows(self):
+        """Activity is summed per window, ranked on the boards and expires with its buckets"""
+        now = datetime.utcnow()
+        await ActivityRecorder(self.repos).increment_many({"nft-001": {"views": 3}, "nft-002": {"likes": 2}})
+        await record_activity(self.repos, [("nft-003", "A", {"sales": 1, "volume": 4.0})], now - timedelta(hours=3))
+        await record_activity(self.repos, [("nft-004", "B", {"views": 50})], now - timedelta(days=9))
+
+        hourly = await self.repos.activity.totals("collection", "5m", now - timedelta(hours=1))
+        self.assertEqual(hourly, {"A": {"views": 3, "likes": 0, "sales": 0, "volume": 0}, "B": {"views": 0, "likes": 2, "sales": 0, "volume": 0}})
+
+        boards = await ActivityBoards(self.repos, size=2).get("24h")
+        self.assertEqual([entry["id"] for entry in boards["nfts"]], ["nft-003", "nft-002"])
+        self.assertEqual(boards["nfts"][0]["score"], 20.0)
+        self.assertEqual([(entry["name"], entry["id"], entry["volume"]) for entry in boards["collections"]], [("A", "col-a", 4.0), ("B", "col-b", 0)])
+        # The 9 day old buckets expired
+        self.assertNotIn("nft-004", await self.repos.activity.totals("nft", "1d", now - timedelta(days=30)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Tests for incrementally maintained collection stats on the memory engine"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from collection_stats import record_delisting, record_listing
+from tests.fixtures import CatalogTestCase
+
+
+class CollectionStatsTests(CatalogTestCase):
+    """Floor maintenance on listing changes"""
+
+    async def test_delisting_keeps_concurrent_lower_floor(self):
+        """A listing made while the floor is recomputed is not overwritten"""
+        await self.repos.collections.lower_floor("A", 1.0)
+        for nft_id in ("nft-005", "nft-015", "nft-025"):
+            await self.repos.nfts.unlist(nft_id)
+        cheapest_listed_price = self.repos.nfts.cheapest_listed_price
+
+        async def racing_cheapest_listed_price(collection):
+            cheapest = await cheapest_listed_price(collection)
+            self.repos.nfts.cheapest_listed_price = cheapest_listed_price
+            await self.repos.nfts.list_for_sale("nft-001", 0.5)
+            await record_listing(self.repos, "A", 0.5)
+            return cheapest
+        self.repos.nfts.cheapest_listed_price = racing_cheapest_listed_price
+
+        await record_delisting(self.repos, "A", 1.0)
+        self.assertEqual(await self.repos.collections.get_floor("A"), 0.5)
+        await self.repos.nfts.unlist("nft-001")
+        await record_delisting(self.repos, "A", 0.5)
+        self.assertEqual(await self.repos.collections.get_floor("A"), 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
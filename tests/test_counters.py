@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Tests for the write-behind counter buffer on the memory engine"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from counters import CounterBuffer
+from tests.fixtures import CatalogTestCase
+
+
+class CounterBufferTests(CatalogTestCase):
+    """Flushing and shutdown of buffered increments"""
+
+    async def test_stop_keeps_inflight_flush(self):
+        """Stopping during a flush waits for it, and a failing on_flush does not stop the loop"""
+        increment_many = self.repos.nfts.increment_many
+        writing = asyncio.Event()
+
+        async def slow_increment_many(deltas):
+            writing.set()
+            await asyncio.sleep(0.05)
+            await increment_many(deltas)
+        self.repos.nfts.increment_many = slow_increment_many
+
+        def failing_on_flush(nft_ids):
+            raise RuntimeError("cache unavailable")
+        counters = CounterBuffer(self.repos.nfts, flush_interval=0.01, on_flush=failing_on_flush)
+        await counters.start()
+        counters.incr("nft-001", "views", 3)
+        await writing.wait()
+        await asyncio.sleep(0.06)
+        writing.clear()
+        counters.incr("nft-001", "views", 2)
+        # Stop while the second batch is being written
+        await writing.wait()
+        await counters.stop()
+        self.assertEqual((await self.repos.nfts.get("nft-001"))["views"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Tests for remote image ingestion; served from a local HTTP server"""
+import asyncio
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from blob_store import LocalBlobStore
+from image_ingest import ImageFetcher, UnsafeImageURL
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"x" * 64
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers["Host"]))
+        if self.path == "/hop":
+            self.send_response(302)
+            self.send_header("Location", "/image.png")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(PNG)))
+        self.end_headers()
+        self.wfile.write(PNG)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageFetcherTests(unittest.IsolatedAsyncioTestCase):
+    """Connections go to the address that passed the check"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def asyncSetUp(self):
+        _ImageHandler.requests.clear()
+        self.store = LocalBlobStore(Path(tempfile.mkdtemp()))
+        self.fetcher = ImageFetcher()
+        # images.test resolves to the local server, which the check is told to accept
+        loop = asyncio.get_running_loop()
+
+        async def getaddrinfo(host, port, **kwargs):
+            self.assertEqual(host, "images.test")
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))]
+        patches = [
+            mock.patch.object(loop, "getaddrinfo", getaddrinfo),
+            mock.patch("image_ingest.is_public_address", lambda address: address == "127.0.0.1"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def asyncTearDown(self):
+        await self.fetcher.aclose()
+
+    async def test_connects_to_checked_address_with_host_header(self):
+        """The request never resolves the host again, and redirects keep the original host"""
+        port = self.server.server_address[1]
+        blob_hash = await self.fetcher.fetch_into(f"http://images.test:{port}/hop", self.store)
+        self.assertIsNotNone(await self.store.stat(blob_hash))
+        self.assertEqual(_ImageHandler.requests, [
+            ("/hop", f"images.test:{port}"), ("/image.png", f"images.test:{port}"),
+        ])
+
+    async def test_idle_host_slots_are_dropped(self):
+        """Per-host budgets only exist while downloads are in flight"""
+        port = self.server.server_address[1]
+        await asyncio.gather(*(
+            self.fetcher.fetch_into(f"http://images.test:{port}/image.png", self.store) for _ in range(8)
+        ))
+        self.assertEqual(self.fetcher._host_slots, {})
+
+
+class UnsafeURLTests(unittest.IsolatedAsyncioTestCase):
+    """URLs are checked before any connection is made"""
+
+    async def test_rejects_unsafe_urls(self):
+        """Only http(s) URLs resolving to public addresses are fetched"""
+        fetcher = ImageFetcher()
+        store = LocalBlobStore(Path(tempfile.mkdtemp()))
+        for url in [
+            "file:///etc/passwd", "ftp://example.com/a.png", "http://127.0.0.1/a.png", "http://10.0.0.5/a.png",
+            "http://169.254.169.254/latest/meta-data", "http://[::1]/a.png", "http://[::ffff:192.168.1.1]/a.png",
+        ]:
+            with self.assertRaises(UnsafeImageURL, msg=url):
+                await fetcher.fetch_into(url, store)
+        await fetcher.aclose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Tests for the in-memory storage engine; no database needed"""
+import sys
+import unittest
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pymongo.errors import DuplicateKeyError
+
+from pagination import decode_cursor, encode_cursor
+from repositories import NFTFilter, NFTRepository, TransactionFilter
+from search import tokenize
+from tests.fixtures import NOW, CatalogTestCase, nft
+
+
+class MemoryRepositoryTests(CatalogTestCase):
+    """Filter, sort, pagination and update semantics of the memory engine"""
+
+    async def test_01_filters(self):
+        """Equality, price range and prefix search filters"""
+        nfts = self.repos.nfts
+        self.assertEqual(await nfts.count(NFTFilter(collection="A")), 15)
+        self.assertEqual(await nfts.count(NFTFilter(collection="A", min_price=2, max_price=3)), 6)
+        found = await nfts.list(NFTFilter(search=tokenize("token 1")))
+        self.assertEqual(sorted(doc["id"] for doc in found), [f"nft-{i:03d}" for i in (1, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19)])
+        self.assertEqual(await nfts.count(NFTFilter(search=[])), 0)
+
+    async def test_02_sort_and_keyset_pages(self):
+        """Pages follow (sort field, id) in both directions without gaps or repeats"""
+        nfts = self.repos.nfts
+        for sort_by, direction in (("price", 1), ("price", -1), ("created_at", -1)):
+            expected = sorted(
+                (nft(i) for i in range(30) if i % 2),
+                key=lambda doc: (doc[sort_by], doc["id"]),
+                reverse=direction < 0
+            )
+            seen, after = [], None
+            while True:
+                page = await nfts.find(NFTFilter(collection="A"), sort_by, direction, after=after, limit=4, fields=["id", sort_by])
+                seen += [doc["id"] for doc in page]
+                if len(page) < 4:
+                    break
+                after = decode_cursor(encode_cursor(sort_by, direction, page[-1]), sort_by, direction)
+            self.assertEqual(seen, [doc["id"] for doc in expected])
+
+    async def test_03_projection_hides_internal_fields(self):
+        """Documents never expose derived search fields"""
+        doc = await self.repos.nfts.get("nft-001")
+        self.assertNotIn("search_terms", doc)
+        self.assertNotIn("name_terms", doc)
+        doc["price"] = 999
+        self.assertNotEqual((await self.repos.nfts.get("nft-001"))["price"], 999)
+
+    async def test_04_increments_keep_sort_index(self):
+        """Batched increments apply atomically and reorder sorted pages"""
+        await self.repos.nfts.increment_many({"nft-007": {"likes": 5}, "nft-003": {"likes": 2, "views": 1}, "missing": {"likes": 1}})
+        top = await self.repos.nfts.find(NFTFilter(), "likes", -1, limit=2)
+        self.assertEqual([doc["id"] for doc in top], ["nft-007", "nft-003"])
+        self.assertEqual(top[1]["views"], 1)
+
+    async def test_05_transfer_is_conditional_and_idempotent(self):
+        """Only the listing seller's transfer applies, and repeating it succeeds"""
+        nfts = self.repos.nfts
+        self.assertFalse(await nfts.transfer("nft-001", "mallory", "bob", "tx-1"))
+        # Relisted at another price since the purchase
+        self.assertFalse(await nfts.transfer("nft-001", "alice", "bob", "tx-1", price=1.0))
+        self.assertTrue(await nfts.transfer("nft-001", "alice", "bob", "tx-1", price=2.0))
+        self.assertTrue(await nfts.transfer("nft-001", "alice", "bob", "tx-1"))
+        self.assertFalse(await nfts.transfer("nft-001", "alice", "dave", "tx-2"))
+        doc = await nfts.get("nft-001")
+        self.assertEqual((doc["owner"], doc["status"]), ("bob", "sold"))
+        self.assertEqual(await nfts.count(NFTFilter(owner="bob")), 1)
+
+        await nfts.revert_transfer("nft-001", "alice", "tx-1")
+        doc = await nfts.get("nft-001")
+        self.assertEqual((doc["owner"], doc["status"]), ("alice", "listed"))
+
+    async def test_06_listing_updates(self):
+        """list_for_sale and unlist return the previous document"""
+        nfts = self.repos.nfts
+        previous = await nfts.unlist("nft-002")
+        self.assertEqual(previous["status"], "listed")
+        self.assertIsNone(await nfts.unlist("nft-002"))
+        previous = await nfts.list_for_sale("nft-002", 0.5)
+        self.assertEqual(previous["status"], "unlisted")
+        self.assertEqual(await nfts.cheapest_listed_price("B"), 0.5)
+
+    async def test_07_unique_ids(self):
+        """Duplicate ids and token ids are rejected like unique indexes"""
+        with self.assertRaises(DuplicateKeyError):
+            await self.repos.nfts.insert(nft(1))
+        with self.assertRaises(DuplicateKeyError):
+            await self.repos.nfts.insert(nft(100, token_id=1))
+
+    async def test_08_collection_stats(self):
+        """Stats aggregates and collection counters"""
+        stats = await self.repos.nfts.stats_by_collection(["A", "Z"])
+        self.assertEqual(stats, {"A": {"items_count": 15, "floor_price": 1.0}})
+        await self.repos.collections.add_items("A", 2, floor_candidate=0.25)
+        await self.repos.collections.add_volume("A", 3.0)
+        collection = await self.repos.collections.get("col-a")
+        self.assertEqual((collection["items_count"], collection["floor_price"], collection["volume"]), (2, 0.25, 3.0))
+
+    async def test_09_transactions(self):
+        """Newest-first listing, pending-only completion and filtered iteration"""
+        transactions = self.repos.transactions
+        await transactions.insert_many([
+            {"id": "tx-1", "nft_id": "nft-001", "price": 2.0, "status": "pending", "timestamp": NOW},
+            {"id": "tx-2", "nft_id": "nft-002", "collection": "B", "price": 3.0, "status": "failed", "timestamp": NOW + timedelta(hours=1)},
+        ])
+        self.assertEqual(await transactions.complete_many(["tx-1", "tx-2"], NOW), ["tx-1"])
+        self.assertEqual(await transactions.complete_many(["tx-1"], NOW), [])
+        self.assertEqual([doc["id"] for doc in await transactions.list()], ["tx-2", "tx-1"])
+        completed = [doc async for doc in transactions.iterate(TransactionFilter(status="completed"))]
+        self.assertEqual([doc["id"] for doc in completed], ["tx-1"])
+        # tx-1 has no collection field; it is resolved through its NFT
+        self.assertEqual(await transactions.volume_by_collection(), {"A": 2.0})
+
+    async def test_10_settlement_jobs(self):
+        """Claims lease the most overdue job and count attempts"""
+        jobs = self.repos.settlement_jobs
+        for i in range(2):
+            await jobs.enqueue({"_id": f"job-{i}", "state": "queued", "attempts": 0, "run_at": NOW + timedelta(seconds=i), "created_at": NOW})
+        [job] = await jobs.claim_many(NOW + timedelta(seconds=5), NOW + timedelta(seconds=30), 1)
+        self.assertEqual((job["_id"], job["attempts"], job["state"]), ("job-0", 1, "processing"))
+        self.assertEqual(await jobs.count_by_state(), {"queued": 1, "processing": 1, "failed": 0})
+        await jobs.finish_many(["job-0", "job-1"], NOW)
+        self.assertEqual(await jobs.claim_many(NOW + timedelta(minutes=5), NOW + timedelta(minutes=6), 10), [])
+
+    async def test_11_clear_resets_in_place(self):
+        """clear() empties the same repository objects the app holds"""
+        nfts = self.repos.nfts
+        self.assertEqual(await self.repos.sequences.advance("nft_token_id", 3), 3)
+        await self.repos.clear()
+        self.assertIs(self.repos.nfts, nfts)
+        self.assertEqual(await nfts.estimated_count(), 0)
+        self.assertEqual(await self.repos.sequences.advance("nft_token_id", 1), 1)
+
+    async def test_12_incomplete_engine_fails_at_construction(self):
+        """A repository missing an interface method cannot be instantiated"""
+        class PartialNFTRepository(NFTRepository):
+            async def get(self, nft_id):
+                return None
+        with self.assertRaises(TypeError):
+            PartialNFTRepository()
+
+
+if __name__ == "__main__":
+    unittest.main()
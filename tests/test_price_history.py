@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Tests for the OHLC price history rollups on the memory engine"""
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from memory_repositories import MemoryRepositories
+from price_history import BACKFILL_LOOKUP_SIZE, backfill_price_history, ohlc, record_sales
+
+NOW = datetime(2024, 1, 1)
+
+
+class PriceHistoryTests(unittest.IsolatedAsyncioTestCase):
+    """Incremental rollups and the pandas backfill agree"""
+
+    async def asyncSetUp(self):
+        self.repos = MemoryRepositories()
+
+    async def test_out_of_order_batches_match_backfill(self):
+        """Out-of-order batches give the same buckets as the backfill"""
+        sales = [("A", 2.0, NOW + timedelta(minutes=50)), ("A", 1.0, NOW + timedelta(minutes=10)), ("A", 4.0, NOW + timedelta(hours=1, minutes=5))]
+        await record_sales(self.repos, sales[:1])
+        await record_sales(self.repos, sales[1:])
+        hourly = [ohlc(bucket) for bucket in await self.repos.price_history.list("A", "1h")]
+        self.assertEqual([(b["open"], b["high"], b["low"], b["close"], b["count"]) for b in hourly], [(1.0, 2.0, 1.0, 2.0, 2), (4.0, 4.0, 4.0, 4.0, 1)])
+        daily = await self.repos.price_history.list("A", "1d")
+        self.assertEqual((ohlc(daily[0])["close"], daily[0]["volume"]), (4.0, 7.0))
+        # 2024-01-01 is a Monday
+        self.assertEqual((await self.repos.price_history.list("A", "1w"))[0]["start"], NOW)
+
+        await self.repos.transactions.insert_many([
+            {"id": f"tx-{i}", "nft_id": "nft-001", "collection": name, "price": price, "status": "completed", "timestamp": at, "settled_at": at}
+            for i, (name, price, at) in enumerate(sales)
+        ])
+        live = {interval: await self.repos.price_history.list("A", interval) for interval in ("1h", "1d", "1w")}
+        self.assertEqual(await backfill_price_history(self.repos, ["A"]), 4)
+        for interval, buckets in live.items():
+            self.assertEqual(await self.repos.price_history.list("A", interval), buckets)
+
+    async def test_backfill_resolves_legacy_sales_in_chunks(self):
+        """Sales without a collection are resolved through their NFTs, a chunk of ids per lookup"""
+        count = BACKFILL_LOOKUP_SIZE + 5
+        await self.repos.nfts.insert_many([
+            {"id": f"nft-{i:04d}", "collection": "A" if i % 2 else "B", "token_id": i} for i in range(count)
+        ])
+        await self.repos.transactions.insert_many([
+            {"id": f"tx-{i}", "nft_id": f"nft-{i:04d}", "price": 1.0, "status": "completed", "timestamp": NOW}
+            for i in range(count)
+        ] + [{"id": "tx-orphan", "nft_id": "nft-gone", "price": 9.0, "status": "completed", "timestamp": NOW}])
+        lookups = []
+        get_many = self.repos.nfts.get_many
+
+        async def counted(ids, *args, **kwargs):
+            lookups.append(len(ids))
+            return await get_many(ids, *args, **kwargs)
+
+        self.repos.nfts.get_many = counted
+        self.assertEqual(await backfill_price_history(self.repos), 6)
+        self.assertEqual(lookups, [BACKFILL_LOOKUP_SIZE, 6])
+        hourly = await self.repos.price_history.list("A", "1h")
+        self.assertEqual((hourly[0]["count"], hourly[0]["volume"]), (count // 2, float(count // 2)))
+
+    async def test_backfill_clears_collections_without_sales(self):
+        """A full backfill drops the rollups of collections that no longer have completed sales"""
+        await record_sales(self.repos, [("A", 2.0, NOW), ("B", 3.0, NOW + timedelta(hours=1))])
+        await self.repos.transactions.insert_many([
+            {"id": "tx-1", "nft_id": "nft-1", "collection": "A", "price": 5.0, "status": "completed", "timestamp": NOW},
+        ])
+        self.assertEqual(await backfill_price_history(self.repos), 3)
+        self.assertEqual(await self.repos.price_history.collections(), ["A"])
+        self.assertEqual(ohlc((await self.repos.price_history.list("A", "1h"))[0])["close"], 5.0)
+        self.assertEqual(await self.repos.price_history.list("B", "1d"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Tests for trait rarity scoring on the memory engine"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from rarity import count_mints, rescore_collection, score_mints
+from repositories import NFTFilter
+from tests.fixtures import CatalogTestCase, nft
+
+
+class RarityTests(CatalogTestCase):
+    """Collection rescoring and scoring of new mints"""
+
+    async def test_rarity_scores(self):
+        """Rare traits and rare omissions rank first; mints are scored from the counts"""
+        await self.repos.nfts.update_many({
+            doc["id"]: {"traits": [{"trait_type": "Background", "value": "Gold" if i == 5 else "Blue"}] + (
+                [{"trait_type": "Hat", "value": "Cap"}] if i != 7 else []
+            )}
+            for i, doc in enumerate(await self.repos.nfts.list(NFTFilter(collection="A"), fields=["id"]))
+        })
+        self.assertEqual(await rescore_collection(self.repos, "A"), 15)
+        ranked = await self.repos.nfts.find(NFTFilter(collection="A"), "rarity_score", -1, limit=15)
+        self.assertEqual([doc["rarity_rank"] for doc in ranked[:3]], [1, 1, 3])
+        self.assertAlmostEqual(ranked[0]["rarity_score"], ranked[1]["rarity_score"])
+        self.assertAlmostEqual([trait["rarity"] for trait in ranked[-1]["traits"]][0], 14 / 15)
+        counts = await self.repos.trait_counts.get("A")
+        self.assertEqual((counts["total"], counts["counts"]["Hat"]), (15, {"Cap": 14}))
+
+        minted = nft(100, collection="A", traits=[{"trait_type": "Background", "value": "Gold"}, {"trait_type": "Hat", "value": "Cap"}])
+        await score_mints(self.repos, [minted])
+        self.assertEqual([trait["rarity"] for trait in minted["traits"]], [2 / 16, 15 / 16])
+        self.assertLess(minted["rarity_score"], ranked[0]["rarity_score"])
+        # Counts only change once the NFT is stored
+        self.assertEqual((await self.repos.trait_counts.get("A"))["total"], 15)
+
+    async def test_incremental_rescore_writes_material_changes(self):
+        """After a mint, an incremental rescore rewrites only the NFTs whose rarity moved"""
+        ids = [doc["id"] for doc in await self.repos.nfts.list(NFTFilter(collection="A"), fields=["id"])]
+        await self.repos.nfts.update_many({
+            nft_id: {"traits": [{"trait_type": "Background", "value": "Gold" if nft_id == ids[5] else "Blue"}] + (
+                [{"trait_type": "Hat", "value": "Cap"}] if nft_id != ids[7] else []
+            )}
+            for nft_id in ids
+        })
+        await rescore_collection(self.repos, "A")
+        update_many = self.repos.nfts.update_many
+        written = []
+
+        async def recording_update_many(changes):
+            written.extend(changes)
+            await update_many(changes)
+        self.repos.nfts.update_many = recording_update_many
+
+        await rescore_collection(self.repos, "A", incremental=True)
+        self.assertEqual(written, [])
+
+        minted = nft(100, collection="A", traits=[{"trait_type": "Background", "value": "Blue"}, {"trait_type": "Hat", "value": "Cap"}])
+        await score_mints(self.repos, [minted])
+        await self.repos.nfts.insert(minted)
+        await count_mints(self.repos, [minted])
+        self.assertEqual((await self.repos.trait_counts.get("A"))["total"], 16)
+        await rescore_collection(self.repos, "A", incremental=True)
+        # The Gold NFT's trait halved in rarity and the hatless one's omission grew rarer;
+        # the common NFTs drifted within tolerance
+        self.assertEqual(sorted(written), sorted([ids[5], ids[7], minted["id"]]))
+        self.assertEqual((await self.repos.nfts.get(minted["id"]))["rarity_rank"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
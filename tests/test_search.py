@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Tests for search relevance ranking; no database needed"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from memory_repositories import MemoryRepositories
+from repositories import NFTFilter
+from search import rank_candidates, search_fields, tokenize
+
+
+class RelevanceRankingTests(unittest.IsolatedAsyncioTestCase):
+    """Relevance pages rank every match, not the first ones found"""
+
+    async def asyncSetUp(self):
+        self.repos = MemoryRepositories()
+        docs = []
+        for i in range(3000):
+            # Only the last NFTs match "dragon" as a whole word of their name
+            name = f"Dragon {i}" if i >= 2990 else f"Dragonfly {i}"
+            doc = {"id": f"nft-{i:04d}", "name": name, "description": "", "collection": "A", "token_id": i}
+            docs.append({**doc, **search_fields(doc["name"], doc["description"], doc["collection"])})
+        await self.repos.nfts.insert_many(docs)
+
+    async def rank(self, after=None, keep=5):
+        tokens = tokenize("dragon")
+        cursor = self.repos.nfts.search_candidates(NFTFilter(search=tokens))
+        try:
+            return await rank_candidates(cursor, tokens, True, after, keep)
+        finally:
+            await cursor.close()
+
+    async def test_best_matches_beyond_the_first_rows(self):
+        """Exact name matches inserted last still rank first"""
+        ranked = await self.rank()
+        self.assertEqual([row["id"] for row in ranked], [f"nft-{i:04d}" for i in (2999, 2998, 2997, 2996, 2995)])
+
+    async def test_pages_continue_after_position(self):
+        """Paging past the exact matches continues into the prefix matches without repeats"""
+        first = await self.rank(keep=8)
+        rest = await self.rank(after=(first[-1]["relevance"], first[-1]["id"]), keep=2995)
+        ids = [row["id"] for row in first + rest]
+        self.assertEqual(len(ids), 3000)
+        self.assertEqual(len(set(ids)), 3000)
+        self.assertEqual([row["id"] for row in rest[:3]], ["nft-2991", "nft-2990", "nft-2989"])
+
+
+if __name__ == "__main__":
+    unittest.main()
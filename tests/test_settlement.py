@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Tests for background settlement on the memory engine"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from settlement import SettlementQueue
+from tests.fixtures import NOW, CatalogTestCase
+
+
+class SettlementTests(CatalogTestCase):
+    """Retries and replays of settlement jobs"""
+
+    async def test_settlement_counts_each_sale_once(self):
+        """A failing job is retried alone, and its retry does not count the sale again"""
+        transactions = [
+            {"id": f"tx-{i}", "nft_id": f"nft-00{i}", "collection": "A", "buyer": "bob", "seller": "alice", "price": 5.0, "status": "pending", "timestamp": NOW}
+            for i in (1, 3)
+        ]
+        await self.repos.transactions.insert_many([dict(transaction) for transaction in transactions])
+        queue = SettlementQueue(self.repos, max_attempts=5, retry_backoff=0)
+        for transaction in transactions:
+            listed = (await self.repos.nfts.get(transaction["nft_id"]))["price"]
+            await queue.enqueue(transaction, listed_price=listed)
+
+        transfer = self.repos.nfts.transfer
+
+        async def flaky_transfer(nft_id, *args):
+            if nft_id == "nft-003" and not flaky_transfer.failed:
+                flaky_transfer.failed = True
+                raise RuntimeError("connection reset")
+            return await transfer(nft_id, *args)
+        flaky_transfer.failed = False
+        self.repos.nfts.transfer = flaky_transfer
+
+        add = self.repos.activity.add
+
+        async def flaky_add(buckets):
+            flaky_add.calls += 1
+            if flaky_add.calls == 1:
+                raise RuntimeError("write timeout")
+            await add(buckets)
+        flaky_add.calls = 0
+        self.repos.activity.add = flaky_add
+
+        await queue.settle(await queue.claim())
+        self.assertEqual(await self.repos.settlement_jobs.count_by_state(), {"queued": 1, "processing": 0, "failed": 0})
+        await queue.settle(await queue.claim())
+        # A lost lease replays both jobs
+        for transaction in transactions:
+            await self.repos.settlement_jobs.requeue(transaction["id"], NOW, "lease expired")
+        await queue.settle(await queue.claim())
+
+        collection = await self.repos.collections.get("col-a")
+        self.assertEqual(collection["volume"], 10.0)
+        daily = await self.repos.price_history.list("A", "1d")
+        self.assertEqual([(bucket["count"], bucket["volume"]) for bucket in daily], [(2, 10.0)])
+        self.assertEqual((await queue.metrics())["accounting_failures"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""Tests for trait filters and facets on the memory engine"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from repositories import NFTFilter
+from tests.fixtures import CatalogTestCase
+
+
+class TraitFacetTests(CatalogTestCase):
+    """Trait filters and facet counts"""
+
+    async def test_trait_filter_and_facets(self):
+        """Trait filters use the trait index; facets of a selected type ignore its own selection"""
+        docs = await self.repos.nfts.list(NFTFilter(collection="A"), fields=["id"])
+        await self.repos.nfts.update_many({
+            doc["id"]: {"traits": [{"trait_type": "Background", "value": "Gold" if i < 5 else "Blue"}] + (
+                [{"trait_type": "Hat", "value": "Cap"}] if i % 2 == 0 else []
+            )}
+            for i, doc in enumerate(docs)
+        })
+        gold_caps = NFTFilter(collection="A", traits={"Background": ["Gold"], "Hat": ["Cap"]})
+        self.assertEqual(await self.repos.nfts.count(gold_caps), 3)
+        either = NFTFilter(collection="A", traits={"Background": ["Gold", "Blue"]})
+        self.assertEqual(await self.repos.nfts.count(either), 15)
+
+        facets = await self.repos.nfts.trait_facets(gold_caps)
+        self.assertEqual(facets["total"], 3)
+        self.assertEqual(facets["traits"], {"Background": {"Gold": 3, "Blue": 5}, "Hat": {"Cap": 3}})
+
+        # Replaced traits leave the index
+        await self.repos.nfts.update_many({docs[0]["id"]: {"traits": []}})
+        self.assertEqual(await self.repos.nfts.count(gold_caps), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()